@@ -0,0 +1,107 @@
+# Benchmark: bulk queries (op histogram, type histogram, def/use counts,
+# operand kinds) over all insns of a generated module, done by traversal
+# of object IR, and using columnar view (pseudoc.columnar), both with
+# pure Python and NumPy (if installed) implementations. Results of all
+# implementations are checked to be the same.
+#
+# Usage: python bench/columnar.py [num_funcs...]
+import sys
+import io
+import time
+from collections import Counter
+
+sys.path.insert(0, ".")
+sys.path.insert(0, "bench")
+
+from pseudoc import parser
+from pseudoc import columnar
+from pseudoc.ir import Func
+import gen_pseudoc
+
+
+def timed(f):
+    t = time.perf_counter()
+    res = f()
+    return time.perf_counter() - t, res
+
+
+def kind(v):
+    if isinstance(v, int):
+        return columnar.CONST
+    if isinstance(v, str):
+        return columnar.VAR if v.startswith("$") else columnar.SYM
+    return columnar.OTHER
+
+
+# Reference implementations, traversing object IR.
+
+def obj_insns(mod):
+    for item in mod.contents:
+        if isinstance(item, Func):
+            for bb in item.bblocks:
+                for insn in bb.insns:
+                    yield item, insn
+
+
+def obj_op_histogram(mod):
+    return dict(Counter(insn.op for f, insn in obj_insns(mod)))
+
+
+def obj_type_histogram(mod):
+    return dict(Counter(insn.typ for f, insn in obj_insns(mod)))
+
+
+def obj_def_counts(mod):
+    return dict(Counter((f.name, insn.dest) for f, insn in obj_insns(mod) if insn.dest))
+
+
+def obj_use_counts(mod):
+    return dict(Counter(
+        (f.name, a.val) for f, insn in obj_insns(mod) for a in insn.args
+        if isinstance(a.val, str) and a.val.startswith("$")
+    ))
+
+
+def obj_operand_kinds(mod, op):
+    res = {}
+    for f, insn in obj_insns(mod):
+        if insn.op == op:
+            for pos, a in enumerate(insn.args):
+                h = res.setdefault(pos, {})
+                k = kind(a.val)
+                h[k] = h.get(k, 0) + 1
+    return res
+
+
+QUERIES = [
+    ("op_histogram", obj_op_histogram, lambda c, np: c.op_histogram(np)),
+    ("type_histogram", obj_type_histogram, lambda c, np: c.type_histogram(np)),
+    ("def_counts", obj_def_counts, lambda c, np: c.def_counts(np)),
+    ("use_counts", obj_use_counts, lambda c, np: c.use_counts(np)),
+    ("operand_kinds(call)", lambda m: obj_operand_kinds(m, "call"), lambda c, np: c.operand_kinds("call", np)),
+]
+
+
+def __main__():
+    sizes = [int(a) for a in sys.argv[1:]] or [2000, 20000]
+    impls = ["object", "columnar"]
+    if columnar.numpy is not None:
+        impls.append("numpy")
+    for size in sizes:
+        mod = parser.parse(io.StringIO(gen_pseudoc.many_funcs(size)))
+        t, cols = timed(lambda: columnar.build(mod))
+        print("%d funcs, %d insns, %d operands: build columns %.1f ms" % (
+            size, len(cols.insns), len(cols.args), t * 1000))
+        print("%-22s" % "query" + "".join(["%12s" % i for i in impls]))
+        for name, obj_q, col_q in QUERIES:
+            t_obj, ref = timed(lambda: obj_q(mod))
+            times = [t_obj]
+            for use_numpy in [False, True][:len(impls) - 1]:
+                t, res = timed(lambda: col_q(cols, use_numpy))
+                assert res == ref, (name, use_numpy)
+                times.append(t)
+            print("%-22s" % name + "".join(["%9.1f ms" % (t * 1000) for t in times]))
+
+
+if __name__ == "__main__":
+    __main__()
@@ -0,0 +1,43 @@
+# Compare two JSON result files written by bench/run.py.
+#
+# Usage: python bench/compare.py old.json new.json
+import sys
+import json
+
+
+def load(fname):
+    with open(fname) as f:
+        data = json.load(f)
+    return data["meta"], {(r["shape"], r["size"], r["stage"]): r for r in data["results"]}
+
+
+def ratio(old, new):
+    if not old:
+        return "-"
+    return "x%.2f" % (new / old)
+
+
+def __main__():
+    if len(sys.argv) != 3:
+        print("Usage: %s old.json new.json" % sys.argv[0])
+        sys.exit(1)
+    old_meta, old = load(sys.argv[1])
+    new_meta, new = load(sys.argv[2])
+    print("old: %s, new: %s" % (old_meta.get("rev"), new_meta.get("rev")))
+    print("%-13s %8s %-24s %10s %10s %7s %9s %9s %7s" % (
+        "shape", "size", "stage", "old ms", "new ms", "time", "old MB", "new MB", "mem"))
+    for key in sorted(set(old) | set(new)):
+        o = old.get(key)
+        n = new.get(key)
+        if o is None or n is None:
+            print("%-13s %8d %-24s %s" % (key + ("only in " + ("new" if o is None else "old"),)))
+            continue
+        print("%-13s %8d %-24s %10.1f %10.1f %7s %9.1f %9.1f %7s" % (
+            key[0], key[1], key[2],
+            o["time"] * 1000, n["time"] * 1000, ratio(o["time"], n["time"]),
+            o["peak_mem"] / 1e6, n["peak_mem"] / 1e6, ratio(o["peak_mem"], n["peak_mem"]),
+        ))
+
+
+if __name__ == "__main__":
+    __main__()
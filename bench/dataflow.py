@@ -0,0 +1,42 @@
+# Benchmark: dataflow analyses (liveness, reaching definitions) on large
+# generated CFGs, before and after SSA construction.
+#
+# Usage: python bench/dataflow.py [num_blocks...]
+import sys
+import io
+import time
+
+sys.path.insert(0, ".")
+sys.path.insert(0, "bench")
+
+from pseudoc import parser
+from pseudoc import ssa
+import gen_pseudoc
+
+
+def timed(f):
+    t = time.perf_counter()
+    f()
+    return time.perf_counter() - t
+
+
+def __main__():
+    sizes = [int(a) for a in sys.argv[1:]] or [1000, 10000, 40000]
+    for size in sizes:
+        src = gen_pseudoc.deep_cfg(size)
+        func = parser.parse(io.StringIO(src)).contents[0]
+        nbb = len(func.bblocks)
+        t_rpo = timed(lambda: func.analysis("rpo"))
+        for form in ("non-ssa", "ssa"):
+            if form == "ssa":
+                t_ssa = timed(lambda: ssa.construct(func))
+                print("%6d bb: ssa construction %.3fs" % (nbb, t_ssa))
+            t_live = timed(lambda: func.analysis("liveness"))
+            t_rd = timed(lambda: func.analysis("reaching_defs"))
+            print("%6d bb %-7s: rpo %.3fs, liveness %.3fs, reaching defs %.3fs" % (
+                nbb, form, t_rpo, t_live, t_rd))
+            func.invalidate_analyses({"rpo"})
+
+
+if __name__ == "__main__":
+    __main__()
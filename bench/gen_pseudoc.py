@@ -0,0 +1,226 @@
+# Generator of synthetic PseudoC programs of configurable size and shape,
+# for benchmarking. Output is fully determined by (shape, size, seed).
+import sys
+import random
+import argparse
+
+
+PRIM_TYPES = ["i8", "u8", "i16", "u16", "i32", "u32", "i64", "u64"]
+BIN_OPS = ["+", "-", "*", "&", "|", "^", "<<", ">>"]
+CMP_OPS = ["==", "!=", "<", ">", "<=", ">="]
+
+
+class Gen:
+
+    def __init__(self, seed=0):
+        self.rnd = random.Random(seed)
+        self.out = []
+        self.structs = []
+
+    def emit(self, s):
+        self.out.append(s)
+
+    def text(self):
+        return "".join(self.out)
+
+    def var(self, nvars):
+        return "$v%d" % self.rnd.randrange(nvars)
+
+    def val(self, nvars):
+        if self.rnd.random() < 0.25:
+            return str(self.rnd.randrange(1000))
+        return self.var(nvars)
+
+    def mem_type(self):
+        if self.structs and self.rnd.random() < 0.3:
+            return "struct %s" % self.rnd.choice(self.structs)
+        return self.rnd.choice(PRIM_TYPES)
+
+    def insn(self, nvars, nfuncs):
+        r = self.rnd.random()
+        dest = self.var(nvars)
+        if r < 0.4:
+            return "%s = %s %s %s" % (dest, self.val(nvars), self.rnd.choice(BIN_OPS), self.val(nvars))
+        if r < 0.5:
+            return "%s %s = %s" % (self.rnd.choice(PRIM_TYPES), dest, self.val(nvars))
+        if r < 0.6:
+            return "%s = *(%s*)%s" % (dest, self.mem_type(), self.var(nvars))
+        if r < 0.7:
+            return "*(%s*)%s = %s" % (self.rnd.choice(PRIM_TYPES), self.var(nvars), self.val(nvars))
+        if r < 0.8:
+            args = ", ".join([self.val(nvars) for _ in range(self.rnd.randrange(4))])
+            return "%s = f%d(%s)" % (dest, self.rnd.randrange(nfuncs), args)
+        if r < 0.85:
+            return "%s = (%s)%s" % (dest, self.rnd.choice(PRIM_TYPES), self.var(nvars))
+        if r < 0.9:
+            return "%s = @alloca(@sizeof(%s))" % (dest, self.mem_type())
+        if r < 0.95:
+            return "@nop"
+        return "%s = %s" % (dest, self.val(nvars))
+
+    def func(self, name, nblocks, insns_per_block, nvars=8, nfuncs=1, back_edge_prob=0.2):
+        params = ", ".join(["i32 $v%d" % i for i in range(min(nvars, 3))])
+        self.emit("i32 %s(%s) {\n" % (name, params))
+        for b in range(nblocks):
+            self.emit("l%d:\n" % b)
+            for _ in range(self.rnd.randint(1, insns_per_block * 2 - 1)):
+                self.emit("    %s\n" % self.insn(nvars, nfuncs))
+            if b == nblocks - 1:
+                self.emit("    return %s\n" % self.var(nvars))
+                break
+            r = self.rnd.random()
+            if r < back_edge_prob:
+                # Loop back edge (or forward jump on the first block).
+                target = self.rnd.randrange(b + 1)
+            else:
+                target = self.rnd.randrange(b + 1, nblocks)
+            if r < 0.6:
+                cond = "%s %s %s" % (self.var(nvars), self.rnd.choice(CMP_OPS), self.val(nvars))
+                self.emit("    if (%s) goto l%d\n" % (cond, target))
+            elif r < 0.8:
+                self.emit("    goto l%d\n" % target)
+            # Otherwise, fall thru.
+        self.emit("}\n\n")
+
+    def struct_defs(self, n, max_fields=6):
+        for i in range(n):
+            name = "S%d" % i
+            fields = []
+            for j in range(self.rnd.randint(1, max_fields)):
+                r = self.rnd.random()
+                if self.structs and r < 0.3:
+                    t = "struct %s" % self.rnd.choice(self.structs)
+                elif r < 0.45:
+                    # Pointer to itself or any struct (possibly not yet defined).
+                    t = "struct S%d*" % self.rnd.randrange(n)
+                else:
+                    t = self.rnd.choice(PRIM_TYPES)
+                if self.rnd.random() < 0.3:
+                    t += "".join(["[%d]" % self.rnd.randint(1, 16) for _ in range(self.rnd.randint(1, 3))])
+                fields.append("%s f%d" % (t, j))
+            self.emit("struct %s { %s }\n\n" % (name, ", ".join(fields)))
+            self.structs.append(name)
+
+    def data(self, name, nelems):
+        els = []
+        for _ in range(nelems):
+            r = self.rnd.random()
+            if r < 0.2:
+                els.append('"str%d\\n\\x%02x"' % (self.rnd.randrange(1000), self.rnd.randrange(256)))
+            elif r < 0.3:
+                els.append("(void*)%d" % self.rnd.randrange(1 << 16))
+            else:
+                els.append("(%s)%d" % (self.rnd.choice(PRIM_TYPES), self.rnd.randrange(128)))
+        self.emit("%s = { %s }\n\n" % (name, ", ".join(els)))
+
+
+# Each shape generator takes size (meaning depends on shape) and seed.
+
+def many_funcs(size, seed=0):
+    "size = number of functions (each of a few blocks)."
+    g = Gen(seed)
+    for i in range(size):
+        g.func("f%d" % i, g.rnd.randint(1, 8), 4, nfuncs=size)
+    return g.text()
+
+
+def huge_func(size, seed=0):
+    "size = number of instructions in a single function."
+    g = Gen(seed)
+    g.func("f0", max(1, size // 16), 8, nvars=64)
+    return g.text()
+
+
+def deep_cfg(size, seed=0):
+    "size = number of basic blocks in a single function, with many loops."
+    g = Gen(seed)
+    g.func("f0", size, 1, nvars=16, back_edge_prob=0.4)
+    return g.text()
+
+
+def long_data(size, seed=0):
+    "size = total number of data elements, in initializers of up to 100k elements."
+    g = Gen(seed)
+    i = 0
+    while size > 0:
+        n = min(size, 100000)
+        g.data("data%d" % i, n)
+        size -= n
+        i += 1
+    return g.text()
+
+
+def nested_types(size, seed=0):
+    "size = number of struct types, nesting each other, used by a few functions."
+    g = Gen(seed)
+    g.struct_defs(size)
+    for i in range(max(1, size // 10)):
+        g.func("f%d" % i, 4, 4, nfuncs=1)
+    return g.text()
+
+
+def loops(size, seed=0):
+    """size = number of functions with nested counted loops, doing arithmetic
+    and memory accesses. Unlike other shapes, the program is executable:
+    main() calls each function."""
+    g = Gen(seed)
+    g.emit("arr = { %s }\n\n" % ", ".join(["(i32)%d" % g.rnd.randrange(1000) for _ in range(64)]))
+    g.emit("leaf($v0, $v1) {\n    $v0 = $v0 ^ $v1\n    $v0 = $v0 + 1\n    return $v0\n}\n\n")
+    ops = ["+", "-", "*", "&", "|", "^"]
+    for f in range(size):
+        nvars = 4
+        g.emit("loop%d($v0, $v1) {\n    $v2 = 1\n    $v3 = 2\n    $i = 0\n" % f)
+        g.emit("outer:\n    $j = 0\ninner:\n")
+        for _ in range(g.rnd.randint(4, 12)):
+            r = g.rnd.random()
+            dest = g.var(nvars)
+            if r < 0.6:
+                g.emit("    %s = %s %s %s\n" % (dest, g.val(nvars), g.rnd.choice(ops), g.val(nvars)))
+            elif r < 0.7:
+                g.emit("    %s = %s %s %d\n" % (dest, g.var(nvars), g.rnd.choice(["<<", ">>"]), g.rnd.randrange(8)))
+            elif r < 0.85:
+                # Access arr[$j & 63].
+                g.emit("    $p = $j & 63\n    $p = $p << 2\n    $p = arr + $p\n")
+                if g.rnd.random() < 0.5:
+                    g.emit("    %s = *(i32*)$p\n" % dest)
+                else:
+                    g.emit("    *(i32*)$p = %s\n" % g.var(nvars))
+            else:
+                g.emit("    %s = leaf(%s, %s)\n" % (dest, g.var(nvars), g.val(nvars)))
+        g.emit("    $j = $j + 1\n    if ($j < %d) goto inner\n" % g.rnd.randint(10, 50))
+        g.emit("    $i = $i + 1\n    if ($i < %d) goto outer\n" % g.rnd.randint(5, 20))
+        g.emit("    return $v0\n}\n\n")
+    g.emit("main() {\n    $s = 0\n")
+    for f in range(size):
+        g.emit("    $r = loop%d(%d, %d)\n    $s = $s ^ $r\n" % (f, g.rnd.randrange(100), g.rnd.randrange(100)))
+    g.emit("    return $s\n}\n")
+    return g.text()
+
+
+SHAPES = {
+    "many_funcs": many_funcs,
+    "huge_func": huge_func,
+    "deep_cfg": deep_cfg,
+    "long_data": long_data,
+    "nested_types": nested_types,
+    "loops": loops,
+}
+
+
+def __main__():
+    argp = argparse.ArgumentParser(description="Generate synthetic PseudoC program")
+    argp.add_argument("shape", choices=sorted(SHAPES))
+    argp.add_argument("size", type=int)
+    argp.add_argument("--seed", type=int, default=0)
+    argp.add_argument("-o", "--out", help="Output to file")
+    args = argp.parse_args()
+    src = SHAPES[args.shape](args.size, args.seed)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(src)
+    else:
+        sys.stdout.write(src)
+
+
+if __name__ == "__main__":
+    __main__()
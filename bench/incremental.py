@@ -0,0 +1,55 @@
+# Benchmark: incremental re-parse after small edits of a large file,
+# compared to full parse.
+#
+# Usage: python bench/incremental.py [num_funcs]
+import sys
+import io
+import time
+
+sys.path.insert(0, ".")
+sys.path.insert(0, "bench")
+
+from pseudoc import parser
+from pseudoc.incremental import IncrementalParser
+import gen_pseudoc
+
+
+def timed(f):
+    t = time.perf_counter()
+    res = f()
+    return time.perf_counter() - t, res
+
+
+def dump(mod):
+    buf = io.StringIO()
+    mod.dump(file=buf)
+    return buf.getvalue()
+
+
+def __main__():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    src = gen_pseudoc.nested_types(200) + gen_pseudoc.many_funcs(size)
+    lines = src.split("\n")
+    mid = len(lines) // 2
+    while not lines[mid].strip().startswith("$"):
+        mid += 1
+    edits = [
+        ("change insn", lambda l: l[:mid] + ["    $v0 = $v1 + 1"] + l[mid + 1:]),
+        ("add call (shifts auto-labels)", lambda l: l[:mid] + ["    $v0 = f0($v1)"] + l[mid:]),
+        ("change struct", lambda l: [s.replace("{ ", "{ i8 x, ", 1) if s.startswith("struct S5 ") else s for s in l]),
+    ]
+    print("%d lines" % len(lines))
+    t_full, _ = timed(lambda: parser.parse(io.StringIO(src)))
+    print("full parse: %.1f ms" % (t_full * 1000))
+    p = IncrementalParser()
+    t, _ = timed(lambda: p.parse(src))
+    print("initial incremental parse: %.1f ms" % (t * 1000))
+    for name, edit in edits:
+        new_src = "\n".join(edit(lines))
+        t, mod = timed(lambda: p.parse(new_src))
+        print("%-30s: %.1f ms (%d reused, %d parsed)" % (name, t * 1000, p.reused, p.parsed))
+        assert dump(mod) == dump(parser.parse(io.StringIO(new_src)))
+
+
+if __name__ == "__main__":
+    __main__()
@@ -0,0 +1,57 @@
+# Benchmark: interpreter speed (executed insns per second) on generated
+# loop-heavy programs, in non-SSA and SSA form, both pre-decoded and
+# compiled to Python (jit).
+#
+# Usage: python bench/interp.py [num_funcs...]
+import sys
+import io
+import time
+
+sys.path.insert(0, ".")
+sys.path.insert(0, "bench")
+
+from pseudoc import parser
+from pseudoc import ssa
+from pseudoc.ir import Func
+from pseudoc.interp import Interp
+from pseudoc import pycodegen
+import gen_pseudoc
+
+
+def timed(f):
+    t = time.perf_counter()
+    res = f()
+    return time.perf_counter() - t, res
+
+
+def __main__():
+    sizes = [int(a) for a in sys.argv[1:]] or [10, 100]
+    for size in sizes:
+        src = gen_pseudoc.loops(size)
+        for form in ("non-ssa", "ssa"):
+            mod = parser.parse(io.StringIO(src))
+            if form == "ssa":
+                for item in mod.contents:
+                    if isinstance(item, Func):
+                        ssa.construct(item)
+            # Number of insns executed is the same for all runs, and is
+            # counted in a separate run, so timed runs don't pay for it.
+            interp = Interp(mod, count_insns=True)
+            res = interp.call("main")
+            cnt = interp.insn_count
+            t_decode, interp = timed(lambda: Interp(mod))
+            t_run, res2 = timed(lambda: interp.call("main"))
+            assert res2 == res
+            print("%4d funcs %-7s: decode %.3fs, run %.3fs, %d insns, %.2f M insns/s" % (
+                size, form, t_decode, t_run, cnt, cnt / t_run / 1e6))
+            pycodegen.clear_cache()
+            t_compile, interp = timed(lambda: Interp(mod, jit=True))
+            t_cached, interp = timed(lambda: Interp(mod, jit=True))
+            t_run, res2 = timed(lambda: interp.call("main"))
+            assert res2 == res
+            print("%4d funcs %-7s: jit compile %.3fs (cached %.3fs), run %.3fs, %.2f M insns/s" % (
+                size, form, t_compile, t_cached, t_run, cnt / t_run / 1e6))
+
+
+if __name__ == "__main__":
+    __main__()
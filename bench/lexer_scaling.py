@@ -0,0 +1,49 @@
+# Benchmark: lexing/parsing time vs line length. With cursor-based Lexer,
+# time per token should stay (roughly) constant as lines grow.
+import sys
+import time
+import io
+
+sys.path.insert(0, ".")
+
+from pseudoc import parser
+
+
+def make_data_line(n):
+    return "data = { %s }\n" % ", ".join(["(u32)%d" % i for i in range(n)])
+
+
+def make_call_line(n):
+    args = ", ".join(["$a%d" % i for i in range(n)])
+    return "fun() {\nlabel:\n    $r = callee(%s)\n}\n" % args
+
+
+def bench(make, n, repeat=3):
+    src = make(n)
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        parser.parse(io.StringIO(src))
+        t = time.perf_counter() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def __main__():
+    sizes = [1000, 2000, 4000, 8000, 16000, 32000]
+    if len(sys.argv) > 1:
+        sizes = [int(x) for x in sys.argv[1:]]
+    for name, make in (("data", make_data_line), ("call", make_call_line)):
+        print("%s initializer/args:" % name)
+        base = None
+        for n in sizes:
+            t = bench(make, n)
+            per_el = t / n * 1e6
+            if base is None:
+                base = per_el
+            print("  %7d elements: %8.2f ms  %6.3f us/element  (x%.2f)" % (n, t * 1000, per_el, per_el / base))
+
+
+if __name__ == "__main__":
+    __main__()
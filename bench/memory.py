@@ -0,0 +1,64 @@
+# Benchmark: memory used by IR objects, in bytes per instruction, for a
+# synthetic module (parsed from generated text, to get the same object
+# structure as the parser produces).
+#
+# Baseline, before IR objects got __slots__ (and Args were double-wrapped
+# in Insns), measured with this script for the default 1M instructions:
+# 854.0 bytes/insn.
+import sys
+import io
+import time
+import tracemalloc
+
+sys.path.insert(0, ".")
+
+from pseudoc import parser
+
+
+BLOCK_TMPL = """\
+l%d:
+    $a = $b + %d
+    i32 $c = $a * $b
+    $d = *(u32*)$p
+    *(u32*)$p = $c
+    $e = foo($a, 1, 2)
+    @nop
+    $f = (u8)$e
+    if ($f == 0) goto l%d
+"""
+INSNS_PER_BLOCK = 8
+BLOCKS_PER_FUNC = 100
+# See header comment.
+BASELINE_BYTES_PER_INSN = 854.0
+
+
+def make_src(n_insns):
+    n_funcs = max(1, n_insns // (INSNS_PER_BLOCK * BLOCKS_PER_FUNC))
+    out = []
+    for f in range(n_funcs):
+        out.append("f%d() {\n" % f)
+        for b in range(BLOCKS_PER_FUNC):
+            out.append(BLOCK_TMPL % (b, b, (b + 1) % BLOCKS_PER_FUNC))
+        out.append("}\n\n")
+    return "".join(out), n_funcs * BLOCKS_PER_FUNC * INSNS_PER_BLOCK
+
+
+def __main__():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    src, n = make_src(n)
+    f = io.StringIO(src)
+    del src
+    tracemalloc.start()
+    t = time.perf_counter()
+    mod = parser.parse(f)
+    t = time.perf_counter() - t
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("%d insns in %d functions, parsed in %.1fs" % (n, len(mod.contents), t))
+    print("memory: %.1f MB total, %.1f bytes/insn" % (size / 1e6, size / n))
+    print("baseline (without __slots__): %.1f bytes/insn, now x%.2f of it" % (
+        BASELINE_BYTES_PER_INSN, size / n / BASELINE_BYTES_PER_INSN))
+
+
+if __name__ == "__main__":
+    __main__()
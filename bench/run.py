@@ -0,0 +1,160 @@
+# Benchmark suite: times parsing, dumping, C rendering and (optionally)
+# passes on generated programs of various shapes, records peak memory,
+# and writes results as JSON, which can be compared with compare.py.
+#
+# Usage: python bench/run.py [-o results.json] [-x pass_spec] [--scale F]
+import sys
+import os
+import io
+import gc
+import json
+import time
+import platform
+import argparse
+import subprocess
+import tracemalloc
+
+_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(_dir))
+sys.path.insert(0, _dir)
+
+from pseudoc import parser
+from pseudoc import csyntax
+from pseudoc.ir import Module, Func, Data
+import pseudoc_tool
+import gen_pseudoc
+
+
+# Default size of each shape (see gen_pseudoc for meaning), at scale 1.0.
+DEFAULT_SIZES = {
+    "many_funcs": 2000,
+    "huge_func": 50000,
+    "deep_cfg": 10000,
+    "long_data": 200000,
+    "nested_types": 2000,
+}
+
+
+def measure(func, repeat):
+    """Run func() repeat times and return (best time, peak traced memory,
+    result). Memory is measured in an extra run, as tracing slows
+    execution down considerably."""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        t = time.perf_counter()
+        res = func()
+        t = time.perf_counter() - t
+        if best is None or t < best:
+            best = t
+        del res
+    gc.collect()
+    tracemalloc.start()
+    res = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, res
+
+
+def renderable(mod):
+    # csyntax supports only functions and data.
+    res = Module(mod.types)
+    for item in mod.contents:
+        if isinstance(item, (Func, Data)):
+            res.add(item)
+    return res
+
+
+def run_shape(shape, size, seed, passes, repeat):
+    src = gen_pseudoc.SHAPES[shape](size, seed)
+    results = []
+
+    def record(stage, t, peak):
+        results.append({
+            "shape": shape, "size": size, "stage": stage, "time": t, "peak_mem": peak,
+        })
+        print("%-13s %-24s %10.1f ms %10.1f MB" % (shape, stage, t * 1000, peak / 1e6))
+
+    t, peak, mod = measure(lambda: parser.parse(io.StringIO(src)), repeat)
+    record("parse", t, peak)
+
+    t, peak, _ = measure(lambda: parser.Parser(pack_data=True).parse(io.StringIO(src)), repeat)
+    record("parse_packed", t, peak)
+
+    t, peak, _ = measure(lambda: mod.dump(file=io.StringIO()), repeat)
+    record("dump", t, peak)
+
+    rmod = renderable(mod)
+    t, peak, _ = measure(lambda: csyntax.render_module(rmod, file=io.StringIO()), repeat)
+    record("render_c", t, peak)
+
+    for spec, passes_list in passes:
+        # Passes may modify functions, so each run gets a fresh parse (not
+        # included in the time).
+        times = []
+        peak = 0
+        for i in range(repeat + 1):
+            pmod = parser.parse(io.StringIO(src))
+            traced = i == repeat
+            gc.collect()
+            if traced:
+                tracemalloc.start()
+            t = time.perf_counter()
+            for item in pmod.contents:
+                for pass_func, pass_params in passes_list:
+                    pseudoc_tool.run_pass(item, pass_func, pass_params)
+            t = time.perf_counter() - t
+            if traced:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            else:
+                times.append(t)
+        record("pass:" + spec, min(times), peak)
+
+    return results
+
+
+def git_rev():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=_dir, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def __main__():
+    argp = argparse.ArgumentParser(description="Run PseudoC benchmarks")
+    argp.add_argument("-o", "--out", help="write JSON results to file")
+    argp.add_argument("--shapes", default=",".join(DEFAULT_SIZES), help="comma-separated shapes to run")
+    argp.add_argument("--scale", type=float, default=1.0, help="multiply default sizes by this")
+    argp.add_argument("--seed", type=int, default=0)
+    argp.add_argument("--repeat", type=int, default=3, help="take best time of N runs")
+    argp.add_argument("-x", "--xforms", default=[], action="append", help="pass(es) to benchmark, as for pseudoc_tool")
+    args = argp.parse_args()
+
+    passes = []
+    for x in args.xforms:
+        passes_list = []
+        pseudoc_tool.parse_passes_spec(x, passes_list)
+        passes.append((x, passes_list))
+
+    results = []
+    for shape in args.shapes.split(","):
+        size = max(1, int(DEFAULT_SIZES[shape] * args.scale))
+        results.extend(run_shape(shape, size, args.seed, passes, args.repeat))
+
+    if args.out:
+        meta = {
+            "rev": git_rev(),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "args": vars(args),
+        }
+        with open(args.out, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=1)
+
+
+if __name__ == "__main__":
+    __main__()
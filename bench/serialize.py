@@ -0,0 +1,67 @@
+# Benchmark: loading a module from binary serialized form vs parsing text.
+import sys
+import io
+import os
+import time
+import tempfile
+
+sys.path.insert(0, ".")
+
+from pseudoc import parser
+from pseudoc import serialize
+
+
+FUNC_TMPL = """\
+i32 f%d(i32 $a, i32 $b) {
+l0:
+    i32 $c = $a + $b
+    $d = $c * 3
+    $p = @alloca(@sizeof(i32))
+    *(i32*)$p = $d
+    if ($d > 10) goto l1
+    $e = foo($c, $d, "str\\n")
+    $f = *(i32*)$p
+l1:
+    $g = (u8)$c
+    return $c
+}
+"""
+
+
+def make_src(n):
+    return "\n".join([FUNC_TMPL % i for i in range(n)])
+
+
+def best_of(f, repeat=3):
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        res = f()
+        t = time.perf_counter() - t
+        if best is None or t < best:
+            best = t
+    return best, res
+
+
+def __main__():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    src = make_src(n)
+    t_parse, mod = best_of(lambda: parser.parse(io.StringIO(src)))
+
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "mod.pscb")
+        t_save, _ = best_of(lambda: serialize.dump_file(mod, path))
+        t_load, _ = best_of(lambda: serialize.load_file(path))
+        name = "f%d" % (n // 2)
+        t_lazy, _ = best_of(lambda: serialize.load_func(path, name))
+        size = os.path.getsize(path)
+
+    print("%d functions, text: %d bytes, binary: %d bytes (x%.2f of text)" % (n, len(src), size, size / len(src)))
+    print("parse text:    %8.1f ms" % (t_parse * 1000))
+    print("save binary:   %8.1f ms" % (t_save * 1000))
+    print("load binary:   %8.1f ms  (x%.1f faster than parse)" % (t_load * 1000, t_parse / t_load))
+    print("load one func: %8.3f ms" % (t_lazy * 1000))
+
+
+if __name__ == "__main__":
+    __main__()
@@ -3,47 +3,76 @@ import re
 
 class LexerError(Exception):
 
-    def __init__(self, msg, context):
+    def __init__(self, msg, context, lineno=None, col=None):
         self.msg = msg
         self.ctx = context
+        self.lineno = lineno
+        self.col = col
+
+    def __str__(self):
+        loc = ""
+        if self.lineno is not None:
+            loc = "%d:" % self.lineno
+        if self.col is not None:
+            loc += "%d:" % (self.col + 1)
+        if loc:
+            loc += " "
+        return "%s%s: %r" % (loc, self.msg, self.ctx)
 
 
 class Lexer:
+    """Lexer over a single line of input. Instead of slicing off consumed
+    input, keeps the original string and a cursor position into it, so
+    tokenizing a line is linear in its length."""
+
+    _ws = re.compile("[ \t]+")
+
+    def __init__(self, l=None, lineno=None):
+        self.init(l, lineno)
+
+    def init(self, l, lineno=None):
+        self.s = l
+        self.pos = 0
+        self.end = len(l) if l else 0
+        self.lineno = lineno
 
-    def __init__(self, l=None):
-        self.l = l
-        self._ws = re.compile("[ \t]+")
+    # Remaining (unconsumed) part of the line. Creates a new string, so
+    # should be used only for error reporting and similar.
+    @property
+    def l(self):
+        return self.s[self.pos:]
 
-    def init(self, l):
-        self.l = l
+    @property
+    def col(self):
+        return self.pos
 
     def error(self, msg, ctx=None):
         if ctx is None:
             ctx = self.l
-        raise LexerError(msg, ctx)
+        raise LexerError(msg, ctx, self.lineno, self.end - len(ctx))
 
     def eol(self):
-        return not self.l
+        return self.pos >= self.end
 
     def skipws(self):
-        m = self._ws.match(self.l)
+        m = self._ws.match(self.s, self.pos)
         if m:
-            self.l = self.l[m.end():]
+            self.pos = m.end()
 
     def check(self, s):
-        return self.l.startswith(s)
+        return self.s.startswith(s, self.pos)
 
     def match(self, s, skipws=True):
-        if self.check(s):
-            self.l = self.l[len(s):]
+        if self.s.startswith(s, self.pos):
+            self.pos += len(s)
             if skipws:
                 self.skipws()
             return True
 
     def match_re(self, r, skipws=True):
-        m = r.match(self.l)
+        m = r.match(self.s, self.pos)
         if m:
-            self.l = self.l[m.end():]
+            self.pos = m.end()
             if skipws:
                 self.skipws()
             return m.group()
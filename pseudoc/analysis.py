@@ -0,0 +1,395 @@
+# PseudoC-IR - Simple Program Analysis/Compiler Intermediate Representation
+#
+# Copyright (c) 2020-2021 Paul Sokolovsky
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# Function analyses, computed on demand and cached until invalidated.
+#
+# Passes get analysis results via Func.analysis(name), e.g.
+# func.analysis("domtree"). A pass then returns set of analysis names
+# which it preserved (i.e. which are still valid after its changes), or
+# ALL if it didn't modify function. Returning anything else (e.g. None, as
+# passes not aware of analyses do) invalidates everything. An analysis is kept only if
+# analyses it was computed from are kept too.
+#
+# Analyses work on CFG edges (bb.succs/bb.preds) and consider only blocks
+# reachable from the entry (first) block.
+
+from . import dataflow
+
+
+class _All:
+    "Set-like object which contains everything."
+
+    def __contains__(self, x):
+        return True
+
+    def __repr__(self):
+        return "ALL"
+
+
+ALL = _All()
+# Analyses which depend only on CFG shape, not on instructions. Passes
+# which modify instructions, but not control flow, can return this.
+CFG = frozenset(["rpo", "domtree", "domfrontier", "loops"])
+
+
+# name -> (compute function, names of analyses it uses)
+ANALYSES = {}
+
+
+def register(name, func, deps=()):
+    "Register analysis. func(func, am) computes and returns result."
+    ANALYSES[name] = (func, tuple(deps))
+
+
+class AnalysisManager:
+
+    def __init__(self, func):
+        self.func = func
+        self.results = {}
+
+    def get(self, name):
+        res = self.results.get(name)
+        if res is None:
+            try:
+                calc, deps = ANALYSES[name]
+            except KeyError:
+                raise ValueError("Unknown analysis: %s" % name)
+            res = self.results[name] = calc(self.func, self)
+        return res
+
+    def invalidate(self, preserved=None):
+        if preserved is ALL:
+            return
+        if not preserved:
+            self.results.clear()
+            return
+
+        kept = {}
+
+        def is_kept(name):
+            res = kept.get(name)
+            if res is None:
+                res = name in preserved and all(is_kept(d) for d in ANALYSES[name][1])
+                kept[name] = res
+            return res
+
+        for name in list(self.results):
+            if not is_kept(name):
+                del self.results[name]
+
+
+# Reverse postorder
+
+
+def calc_rpo(func, am):
+    "List of reachable blocks in reverse postorder."
+    if not func.bblocks:
+        return []
+    entry = func.bblocks[0]
+    post = []
+    seen = {entry}
+    # Iterative DFS, with (block, iterator over succs) on stack.
+    stack = [(entry, iter(entry.succs))]
+    while stack:
+        bb, it = stack[-1]
+        for s in it:
+            if s not in seen:
+                seen.add(s)
+                stack.append((s, iter(s.succs)))
+                break
+        else:
+            stack.pop()
+            post.append(bb)
+    post.reverse()
+    return post
+
+
+# Dominator tree
+
+
+class DomTree:
+
+    def __init__(self, rpo, idom):
+        self.rpo = rpo
+        # bb -> immediate dominator (None for entry)
+        self.idom = idom
+        self.children = {bb: [] for bb in rpo}
+        for bb in rpo:
+            d = idom[bb]
+            if d is not None:
+                self.children[d].append(bb)
+        # Pre/post DFS numbering of the tree, for O(1) dominates().
+        self.pre = {}
+        self.post = {}
+        if rpo:
+            cnt = 0
+            stack = [(rpo[0], False)]
+            while stack:
+                bb, done = stack.pop()
+                if done:
+                    self.post[bb] = cnt
+                else:
+                    self.pre[bb] = cnt
+                    stack.append((bb, True))
+                    for c in reversed(self.children[bb]):
+                        stack.append((c, False))
+                cnt += 1
+
+    def dominates(self, a, b):
+        "Whether a dominates b (each block dominates itself)."
+        return self.pre[a] <= self.pre[b] and self.post[b] <= self.post[a]
+
+    def strictly_dominates(self, a, b):
+        return a is not b and self.dominates(a, b)
+
+
+def calc_domtree(func, am):
+    # Cooper, Harvey, Kennedy "A Simple, Fast Dominance Algorithm".
+    rpo = am.get("rpo")
+    order = {bb: i for i, bb in enumerate(rpo)}
+    idom = [None] * len(rpo)
+    if rpo:
+        idom[0] = 0
+
+    def intersect(a, b):
+        while a != b:
+            while a > b:
+                a = idom[a]
+            while b > a:
+                b = idom[b]
+        return a
+
+    changed = True
+    while changed:
+        changed = False
+        for i in range(1, len(rpo)):
+            new = None
+            for p in rpo[i].preds:
+                j = order.get(p)
+                if j is None or idom[j] is None:
+                    continue
+                if new is None:
+                    new = j
+                else:
+                    new = intersect(j, new)
+            if idom[i] != new:
+                idom[i] = new
+                changed = True
+
+    res = {bb: rpo[idom[i]] for i, bb in enumerate(rpo)}
+    if rpo:
+        res[rpo[0]] = None
+    return DomTree(rpo, res)
+
+
+def calc_domfrontier(func, am):
+    "Dominance frontiers, bb -> list of blocks (Cooper-Harvey-Kennedy)."
+    domtree = am.get("domtree")
+    idom = domtree.idom
+    df = {bb: [] for bb in domtree.rpo}
+    for bb in domtree.rpo:
+        preds = [p for p in bb.preds if p in idom]
+        if len(preds) < 2:
+            continue
+        for p in preds:
+            runner = p
+            while runner is not idom[bb]:
+                d = df[runner]
+                if not d or d[-1] is not bb:
+                    d.append(bb)
+                runner = idom[runner]
+    return df
+
+
+# Loops
+
+
+class Loop:
+
+    def __init__(self, header):
+        self.header = header
+        self.blocks = {header}
+        self.parent = None
+        self.children = []
+        self.depth = 1
+
+    def __repr__(self):
+        return "<Loop %s %d bb>" % (self.header.label, len(self.blocks))
+
+
+class LoopInfo:
+
+    def __init__(self, loops, loop_of):
+        # All loops, outer loops before inner ones.
+        self.loops = loops
+        self.top_level = [l for l in loops if l.parent is None]
+        # bb -> innermost loop containing it
+        self.loop_of = loop_of
+
+    def loop_for(self, bb):
+        return self.loop_of.get(bb)
+
+    def depth(self, bb):
+        l = self.loop_of.get(bb)
+        return l.depth if l else 0
+
+
+def calc_loops(func, am):
+    "Natural loops, with loops sharing a header merged."
+    domtree = am.get("domtree")
+    loops = {}
+    for bb in domtree.rpo:
+        for h in bb.succs:
+            if h in domtree.pre and domtree.dominates(h, bb):
+                loop = loops.get(h)
+                if loop is None:
+                    loop = loops[h] = Loop(h)
+                # Blocks which reach back edge source without passing
+                # thru the header.
+                work = [bb]
+                while work:
+                    b = work.pop()
+                    if b in loop.blocks:
+                        continue
+                    loop.blocks.add(b)
+                    work.extend(p for p in b.preds if p in domtree.pre)
+
+    # Loops are either nested or disjoint, so processing larger loops
+    # first, innermost loop of a header so far is the parent.
+    res = sorted(loops.values(), key=lambda l: len(l.blocks), reverse=True)
+    loop_of = {}
+    for loop in res:
+        parent = loop_of.get(loop.header)
+        if parent is not None:
+            loop.parent = parent
+            loop.depth = parent.depth + 1
+            parent.children.append(loop)
+        for b in loop.blocks:
+            loop_of[b] = loop
+    return LoopInfo(res, loop_of)
+
+
+register("rpo", calc_rpo)
+register("domtree", calc_domtree, ("rpo",))
+register("domfrontier", calc_domfrontier, ("domtree",))
+register("liveness", dataflow.calc_liveness, ("rpo",))
+register("reaching_defs", dataflow.calc_reaching_defs, ("rpo",))
+register("loops", calc_loops, ("domtree",))
+
+
+# Printing of analysis results, for debugging and tests.
+
+
+def _labels(bbs):
+    return " ".join([bb.label for bb in bbs])
+
+
+def _val_names(keys):
+    # Keys are var names, or defining insns in SSA.
+    return " ".join(sorted([k if isinstance(k, str) else k.dest_name() for k in keys]))
+
+
+def _print_rpo(func, res, file):
+    print("    %s" % _labels(res), file=file)
+
+
+def _print_domtree(func, res, file):
+    for bb in res.rpo:
+        idom = res.idom[bb]
+        print("    %s: %s" % (bb.label, idom.label if idom else "-"), file=file)
+
+
+def _print_domfrontier(func, res, file):
+    for bb in func.analysis("rpo"):
+        print("    %s: %s" % (bb.label, _labels(res[bb])), file=file)
+
+
+def _print_loops(func, res, file):
+    rpo = func.analysis("rpo")
+    for loop in res.loops:
+        print("    %s: depth %d, parent %s, blocks %s" % (
+            loop.header.label, loop.depth, loop.parent.header.label if loop.parent else "-",
+            _labels([bb for bb in rpo if bb in loop.blocks])), file=file)
+
+
+def _print_liveness(func, res, file):
+    for bb in func.analysis("rpo"):
+        print("    %s: in [%s] out [%s]" % (bb.label, _val_names(res.live_in(bb)), _val_names(res.live_out(bb))), file=file)
+
+
+def _def_names(defs, is_ssa):
+    return " ".join(sorted([d.dest_name(is_ssa) for d in defs]))
+
+
+def _print_reaching_defs(func, res, file):
+    # In non-SSA form, defs of a var are told apart by block (only the
+    # last def in a block can reach other blocks).
+    if func.is_ssa:
+        names = lambda defs: _def_names(defs, True)
+    else:
+        def_bb = {insn: bb for bb in func.bblocks for insn in bb.insns}
+        names = lambda defs: " ".join(sorted(["%s@%s" % (d.dest, def_bb[d].label) for d in defs]))
+    for bb in func.analysis("rpo"):
+        print("    %s: in [%s] out [%s]" % (bb.label, names(res.reaching_in(bb)), names(res.reaching_out(bb))), file=file)
+
+
+_PRINTERS = {
+    "rpo": _print_rpo,
+    "domtree": _print_domtree,
+    "domfrontier": _print_domfrontier,
+    "loops": _print_loops,
+    "liveness": _print_liveness,
+    "reaching_defs": _print_reaching_defs,
+}
+
+
+def dump(func, names="rpo:domtree:domfrontier:loops", file=None):
+    """Pass which prints results of analyses (names separated by ":") to
+    file, which is a file object or a path to append to (e.g. from
+    pseudoc_tool, -x "pseudoc.analysis.dump(file=out.txt)"), stdout by
+    default. Note that pseudoc_tool's -o doesn't apply to this output. An
+    analysis which was already computed (and not invalidated since) is
+    marked as "cached". Doesn't modify function."""
+    from .ir import Func
+
+    if not isinstance(func, Func):
+        return ALL
+    if isinstance(file, str):
+        with open(file, "a") as f:
+            return dump(func, names, f)
+    print("# %s" % func.name, file=file)
+    for name in names.split(":"):
+        cached = func.analyses is not None and name in func.analyses.results
+        res = func.analysis(name)
+        print("# %s%s:" % (name, " (cached)" if cached else ""), file=file)
+        _PRINTERS[name](func, res, file)
+    return ALL
+
+
+def invalidate(func, keep=""):
+    """Pass which doesn't change function, but invalidates its analyses,
+    except those in keep (names separated by ":"), as a pass changing it
+    would."""
+    return frozenset(keep.split(":")) if keep else None
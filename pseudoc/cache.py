@@ -0,0 +1,204 @@
+# PseudoC-IR - Simple Program Analysis/Compiler Intermediate Representation
+#
+# Copyright (c) 2020-2021 Paul Sokolovsky
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# On-disk cache of parse results.
+#
+# Entries are modules in pseudoc.serialize format, named by a hash of the
+# source contents, parser/format versions and parse options. Entries are
+# written to a temporary file and renamed into place, so concurrent users
+# never see partial entries. Cache hits bump entry's mtime, and eviction
+# removes least recently used entries once total size exceeds the limit.
+
+import os
+import time
+import hashlib
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from . import config
+from . import parser
+from . import serialize
+from .ir import Module
+
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+_SUFFIX = ".pscb"
+_TMP_SUFFIX = ".tmp"
+# Temporary files older than this are leftovers of crashed writers.
+_STALE_TMP_AGE = 3600
+# Size of chunks in which input is read for hashing.
+_CHUNK_SIZE = 1 << 16
+
+
+def parse_options():
+    "Options which affect parse result for the same input."
+    return (config.SPLIT_BB_AFTER_CALL, config.PACK_DATA)
+
+
+class ParseCache:
+
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE):
+        self.dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, path):
+        "Return (key, stat stamp) for contents of file path."
+        h = hashlib.sha256()
+        h.update(("%d %d %r\n" % (parser.VERSION, serialize.VERSION, parse_options())).encode())
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            while True:
+                chunk = f.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                h.update(chunk)
+        return h.hexdigest(), (st.st_mtime_ns, st.st_size)
+
+    def entry_path(self, key):
+        return os.path.join(self.dir, key + _SUFFIX)
+
+    def lookup(self, key):
+        "Return serialize.MappedReader for cached entry (to be closed by caller), or None."
+        path = self.entry_path(key)
+        try:
+            reader = serialize.MappedReader(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, serialize.FormatError):
+            # Corrupted or stale entry (ValueError is from mmap of empty
+            # file), will be overwritten.
+            return None
+        # Items are decoded lazily, when it's too late to fall back to
+        # parsing, so check them all upfront.
+        try:
+            reader.verify()
+        except serialize.FormatError:
+            reader.close()
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return reader
+
+    def open(self, path):
+        """Return (TypeTable, iterator of parsed items) for file path, using
+        cache. Items are parsed (or decoded) lazily, as iterated."""
+        key, stamp = self.key(path)
+        reader = self.lookup(key)
+        if reader is not None:
+            return reader.types, self._iter_cached(reader)
+        p = parser.Parser()
+        return p.types, self._iter_parse(p, path, key, stamp)
+
+    @staticmethod
+    def _iter_cached(reader):
+        try:
+            yield from reader
+        finally:
+            reader.close()
+
+    def _iter_parse(self, p, path, key, stamp):
+        fd, tmp_path = tempfile.mkstemp(suffix=_TMP_SUFFIX, dir=self.dir)
+        done = False
+        try:
+            with os.fdopen(fd, "wb") as f:
+                w = serialize.Writer(f)
+                # Parsed as a stream, so only one function is in memory at
+                # a time.
+                with open(path) as src:
+                    for item in p.parse_iter(src):
+                        # Item is encoded before it's yielded (and possibly
+                        # modified by the caller).
+                        w.add(item)
+                        yield item
+                    st = os.fstat(src.fileno())
+                w.close()
+            # Don't store result under the key if file was changed since
+            # it was hashed.
+            if (st.st_mtime_ns, st.st_size) == stamp:
+                os.replace(tmp_path, self.entry_path(key))
+                done = True
+        finally:
+            if not done:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+        self.evict()
+
+    def parse_iter(self, path):
+        "Like parser.parse_iter(), but for a file path, and using cache."
+        return self.open(path)[1]
+
+    def parse(self, path):
+        types, items = self.open(path)
+        mod = Module(types)
+        for item in items:
+            mod.add(item)
+        return mod
+
+    def evict(self):
+        "Remove least recently used entries until cache fits in max_size."
+        lock_f = open(os.path.join(self.dir, ".lock"), "w")
+        try:
+            if fcntl:
+                fcntl.flock(lock_f, fcntl.LOCK_EX)
+            entries = []
+            total = 0
+            now = time.time()
+            for de in os.scandir(self.dir):
+                try:
+                    st = de.stat()
+                except FileNotFoundError:
+                    continue
+                if de.name.endswith(_TMP_SUFFIX):
+                    if now - st.st_mtime > _STALE_TMP_AGE:
+                        self._remove(de.path)
+                    continue
+                if not de.name.endswith(_SUFFIX):
+                    continue
+                entries.append((st.st_mtime, st.st_size, de.path))
+                total += st.st_size
+            entries.sort()
+            for mtime, size, path in entries:
+                if total <= self.max_size:
+                    break
+                self._remove(path)
+                total -= size
+        finally:
+            lock_f.close()
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,417 @@
+# PseudoC-IR - Simple Program Analysis/Compiler Intermediate Representation
+#
+# Copyright (c) 2020-2021 Paul Sokolovsky
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# Columnar view of a Module, for bulk analyses over many functions
+# (python -m pseudoc.columnar file.pseudoc prints a few of them).
+#
+# Instructions of all functions are stored as parallel arrays (one entry
+# per insn, in order of functions, blocks and insns within them), with
+# ops, values and types interned into integer ids:
+#
+#   op[i]       - op id (Columns.ops[id] is op string)
+#   dest[i]     - value id of dest, or -1 if insn has no dest
+#   typ[i]      - type id (Columns.types[id] is Insn.typ), or -1 if None
+#   block[i]    - block id (Columns.blocks[id] is BBlock)
+#   func[i]     - function id (Columns.funcs[id] is Func)
+#   arg_start[i] .. arg_start[i + 1] - range of insn's operands in args
+#
+#   args[j]     - value id of an operand (Columns.vals[id] is Arg.val)
+#   val_kind[v] - kind of value: VAR ($name), CONST (int), SYM (other
+#                 strings: symbols, labels, "if" operators), OTHER
+#                 (InlineStr, SpecFunc, types)
+#
+# Blocks: block_func[b], block_start[b] .. block_start[b + 1] (range of
+# insns) and succ_start[b] .. succ_start[b + 1] (range in succs, which
+# holds block ids). Functions: func_block_start[f] .. func_block_start[f + 1].
+#
+# Columns are array.array("i") objects. If NumPy is installed, np(name)
+# returns a zero-copy numpy array over a column, and query methods use
+# vectorized implementations (use_numpy=False forces pure Python ones).
+#
+# Columns can be modified in place (e.g. replacing op or operand ids,
+# using intern_op()/intern_val() for new values), and written back to
+# insn objects with store(). Adding or removing insns or operands isn't
+# supported (build a new view after such changes in object IR). store()
+# doesn't update Arg.defi links of SSA functions. python -m pseudoc.columnar
+# --replace OLD=NEW edits ops and values this way, stores them and dumps
+# the module (functions parsed from text aren't in SSA form).
+
+from array import array
+from collections import Counter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .ir import Func
+
+
+VAR = 0
+CONST = 1
+SYM = 2
+OTHER = 3
+
+
+def _intern(lst, ids, v):
+    i = ids.get(v)
+    if i is None:
+        i = ids[v] = len(lst)
+        lst.append(v)
+    return i
+
+
+class Columns:
+
+    def __init__(self):
+        self.ops = []
+        self.op_ids = {}
+        self.vals = []
+        self.val_ids = {}
+        self.types = []
+        self.type_ids = {}
+        self.funcs = []
+        self.blocks = []
+        self.insns = []
+
+        self.op = array("i")
+        self.dest = array("i")
+        self.typ = array("i")
+        self.block = array("i")
+        self.func = array("i")
+        self.arg_start = array("i", [0])
+        self.args = array("i")
+        self.val_kind = array("i")
+        self.block_func = array("i")
+        self.block_start = array("i", [0])
+        self.succ_start = array("i", [0])
+        self.succs = array("i")
+        self.func_block_start = array("i", [0])
+
+    def intern_op(self, op):
+        return _intern(self.ops, self.op_ids, op)
+
+    def intern_type(self, typ):
+        if typ is None:
+            return -1
+        return _intern(self.types, self.type_ids, typ)
+
+    def intern_val(self, v):
+        i = self.val_ids.get(v)
+        if i is None:
+            i = self.val_ids[v] = len(self.vals)
+            self.vals.append(v)
+            if isinstance(v, int):
+                kind = CONST
+            elif isinstance(v, str):
+                kind = VAR if v.startswith("$") else SYM
+            else:
+                kind = OTHER
+            self.val_kind.append(kind)
+        return i
+
+    def add_func(self, func):
+        f = len(self.funcs)
+        self.funcs.append(func)
+        # Hot loop, so attributes are looked up once.
+        intern_op = self.intern_op
+        intern_type = self.intern_type
+        val_ids = self.val_ids
+        intern_val = self.intern_val
+        op_col = self.op.append
+        dest_col = self.dest.append
+        typ_col = self.typ.append
+        block_col = self.block.append
+        func_col = self.func.append
+        arg_start = self.arg_start.append
+        args_col = self.args.append
+        insns = self.insns
+        nargs = len(self.args)
+
+        b0 = len(self.blocks)
+        block_ids = {bb: b0 + i for i, bb in enumerate(func.bblocks)}
+        for bb in func.bblocks:
+            b = block_ids[bb]
+            self.blocks.append(bb)
+            self.block_func.append(f)
+            for insn in bb.insns:
+                insns.append(insn)
+                op_col(intern_op(insn.op))
+                d = insn.dest
+                dest_col(intern_val(d) if d else -1)
+                typ_col(intern_type(insn.typ))
+                block_col(b)
+                func_col(f)
+                for a in insn.args:
+                    v = a.val
+                    i = val_ids.get(v)
+                    if i is None:
+                        i = intern_val(v)
+                    args_col(i)
+                nargs += len(insn.args)
+                arg_start(nargs)
+            self.block_start.append(len(insns))
+            self.succs.extend([block_ids[s] for s in bb.succs])
+            self.succ_start.append(len(self.succs))
+        self.func_block_start.append(len(self.blocks))
+
+    def store(self):
+        "Write (possibly modified) columns back to insn objects."
+        ops = self.ops
+        vals = self.vals
+        types = self.types
+        op = self.op
+        dest = self.dest
+        typ = self.typ
+        args = self.args
+        arg_start = self.arg_start
+        for i, insn in enumerate(self.insns):
+            insn.op = ops[op[i]]
+            d = dest[i]
+            if d >= 0:
+                insn.dest = vals[d]
+            t = typ[i]
+            insn.typ = types[t] if t >= 0 else None
+            j = arg_start[i]
+            assert arg_start[i + 1] - j == len(insn.args), insn
+            for a in insn.args:
+                v = vals[args[j]]
+                if a.val is not v:
+                    a.val = v
+                j += 1
+
+    def np(self, name):
+        "Zero-copy numpy array over column name."
+        return numpy.frombuffer(getattr(self, name), dtype=numpy.intc)
+
+    def replace(self, col, old, new, use_numpy=None):
+        "Replace id old with new in column col, return number replaced."
+        if self._use_numpy(use_numpy):
+            c = self.np(col)
+            m = c == old
+            c[m] = new
+            return int(m.sum())
+        c = getattr(self, col)
+        n = 0
+        for i, v in enumerate(c):
+            if v == old:
+                c[i] = new
+                n += 1
+        return n
+
+    # Queries
+
+    def _use_numpy(self, use_numpy):
+        if use_numpy is None:
+            return numpy is not None
+        return use_numpy
+
+    def _hist(self, col, names, use_numpy):
+        if self._use_numpy(use_numpy):
+            counts = numpy.bincount(self.np(col), minlength=len(names))
+            return {names[i]: int(c) for i, c in enumerate(counts) if c}
+        return {names[i]: c for i, c in Counter(getattr(self, col)).items()}
+
+    def op_histogram(self, use_numpy=None):
+        "Number of insns per op."
+        return self._hist("op", self.ops, use_numpy)
+
+    def type_histogram(self, use_numpy=None):
+        "Number of insns per Insn.typ (None for untyped)."
+        if self._use_numpy(use_numpy):
+            counts = numpy.bincount(self.np("typ") + 1, minlength=len(self.types) + 1)
+            return {([None] + self.types)[i]: int(c) for i, c in enumerate(counts) if c}
+        return {self.types[i] if i >= 0 else None: c for i, c in Counter(self.typ).items()}
+
+    def func_insns(self, f):
+        "Range of insn indexes of function id f."
+        fbs = self.func_block_start
+        return range(self.block_start[fbs[f]], self.block_start[fbs[f + 1]])
+
+    def func_args(self, f):
+        "Range of operand indexes (into args) of function id f."
+        r = self.func_insns(f)
+        return range(self.arg_start[r.start], self.arg_start[r.stop])
+
+    def _np_func_val_counts(self, funcs, vals):
+        # Count (function id, value id) pairs, as {(func name, value): count}.
+        nvals = len(self.vals)
+        keys, counts = numpy.unique(funcs.astype(numpy.int64) * nvals + vals, return_counts=True)
+        pairs = zip((keys // nvals).tolist(), (keys % nvals).tolist(), counts.tolist())
+        return {(self.funcs[f].name, self.vals[v]): c for f, v, c in pairs}
+
+    def _func_counts(self, col, ranges, select):
+        # Count value ids in per-function ranges of column, for values
+        # for which select(value id) is true.
+        res = {}
+        vals = self.vals
+        for f, func in enumerate(self.funcs):
+            r = ranges(f)
+            for v, c in Counter(col[r.start:r.stop]).items():
+                if select(v):
+                    res[(func.name, vals[v])] = c
+        return res
+
+    def def_counts(self, use_numpy=None):
+        "Number of definitions of each variable, as {(func name, var): count}."
+        if self._use_numpy(use_numpy):
+            dest = self.np("dest")
+            m = dest >= 0
+            return self._np_func_val_counts(self.np("func")[m], dest[m])
+        return self._func_counts(self.dest, self.func_insns, lambda v: v >= 0)
+
+    def arg_funcs(self, use_numpy=None):
+        "Function id of each operand (a column parallel to args)."
+        if self._use_numpy(use_numpy):
+            return numpy.repeat(self.np("func"), numpy.diff(self.np("arg_start")))
+        res = array("i")
+        for f in range(len(self.funcs)):
+            res.extend(array("i", [f]) * len(self.func_args(f)))
+        return res
+
+    def use_counts(self, use_numpy=None):
+        "Number of uses of each variable as operand, as {(func name, var): count}."
+        if self._use_numpy(use_numpy):
+            args = self.np("args")
+            m = self.np("val_kind")[args] == VAR
+            return self._np_func_val_counts(self.arg_funcs(True)[m], args[m])
+        kind = self.val_kind
+        return self._func_counts(self.args, self.func_args, lambda v: kind[v] == VAR)
+
+    def operand_kinds(self, op, use_numpy=None):
+        """Histogram of kinds of operands of insns with given op, as
+        {arg position: {kind: count}}."""
+        op_id = self.op_ids.get(op)
+        res = {}
+        if op_id is None:
+            return res
+        if self._use_numpy(use_numpy):
+            idx = numpy.nonzero(self.np("op") == op_id)[0]
+            start = self.np("arg_start")
+            nargs = start[idx + 1] - start[idx]
+            kinds = self.np("val_kind")
+            args = self.np("args")
+            for pos in range(int(nargs.max()) if len(idx) else 0):
+                sel = start[idx[nargs > pos]] + pos
+                counts = numpy.bincount(kinds[args[sel]], minlength=OTHER + 1)
+                res[pos] = {k: int(c) for k, c in enumerate(counts) if c}
+            return res
+        start = self.arg_start
+        args = self.args
+        kinds = self.val_kind
+        for i, o in enumerate(self.op):
+            if o == op_id:
+                for pos, j in enumerate(range(start[i], start[i + 1])):
+                    h = res.get(pos)
+                    if h is None:
+                        h = res[pos] = {}
+                    k = kinds[args[j]]
+                    h[k] = h.get(k, 0) + 1
+        return res
+
+
+def build(mod):
+    "Build Columns for functions of Module mod."
+    cols = Columns()
+    for item in mod.contents:
+        if isinstance(item, Func):
+            cols.add_func(item)
+    return cols
+
+
+KIND_NAMES = ["var", "const", "sym", "other"]
+
+
+def _parse_val(s):
+    try:
+        return int(s, 0)
+    except ValueError:
+        return s
+
+
+def __main__():
+    import argparse
+    from . import parser
+
+    argp = argparse.ArgumentParser(description="Print bulk statistics of PseudoC module, using columnar view")
+    argp.add_argument("file")
+    argp.add_argument("--no-numpy", action="store_true", help="use pure Python implementations")
+    argp.add_argument("--replace", action="append", default=[], metavar="OLD=NEW",
+        help="replace op, or value (var, symbol, const) OLD with NEW in columns, "
+        "store them back and dump the module (instead of statistics)")
+    args = argp.parse_args()
+    use_numpy = False if args.no_numpy else None
+
+    with open(args.file) as f:
+        mod = parser.parse(f)
+    cols = build(mod)
+
+    if args.replace:
+        for r in args.replace:
+            old, new = r.split("=", 1)
+            if old in cols.op_ids:
+                n = cols.replace("op", cols.op_ids[old], cols.intern_op(new), use_numpy)
+            else:
+                old = cols.val_ids.get(_parse_val(old))
+                if old is None:
+                    argp.error("no op or value to replace: %s" % r)
+                new = cols.intern_val(_parse_val(new))
+                n = cols.replace("dest", old, new, use_numpy)
+                n += cols.replace("args", old, new, use_numpy)
+            print("# %s: %d" % (r, n))
+        cols.store()
+        for i, item in enumerate(mod.contents):
+            if i:
+                print()
+            item.dump()
+        return
+
+    print("funcs: %d, blocks: %d, insns: %d, operands: %d" % (
+        len(cols.funcs), len(cols.blocks), len(cols.insns), len(cols.args)))
+    print("ops:")
+    for op, c in sorted(cols.op_histogram(use_numpy).items(), key=lambda x: (-x[1], x[0])):
+        print("  %-8s %d" % (op, c))
+    print("types:")
+    for t, c in sorted(cols.type_histogram(use_numpy).items(), key=lambda x: (-x[1], str(x[0]))):
+        print("  %-8s %d" % (t, c))
+    print("multiply defined vars:")
+    for (f, v), c in sorted(cols.def_counts(use_numpy).items()):
+        if c > 1:
+            print("  %s: %s %d" % (f, v, c))
+    uses = cols.use_counts(use_numpy)
+    print("unused vars:")
+    for (f, v) in sorted(cols.def_counts(use_numpy)):
+        if (f, v) not in uses:
+            print("  %s: %s" % (f, v))
+    for op in ("@load", "@store", "call"):
+        kinds = cols.operand_kinds(op, use_numpy)
+        if kinds:
+            print("%s operand kinds:" % op)
+            for pos, h in sorted(kinds.items()):
+                print("  %d: %s" % (pos, ", ".join(["%s=%d" % (KIND_NAMES[k], c) for k, c in sorted(h.items())])))
+
+
+if __name__ == "__main__":
+    __main__()
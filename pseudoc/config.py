@@ -4,3 +4,8 @@
 # which variables are live after call (which then can be assigned
 # to callee-save registers).
 SPLIT_BB_AFTER_CALL = True
+
+# Parse data initializers into contiguous bytes (Data.content, with
+# Data.relocs for symbol addresses), instead of per-element Data.desc.
+# Uses less memory for large tables.
+PACK_DATA = False
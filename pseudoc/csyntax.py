@@ -1,97 +1,155 @@
+import sys
+import struct
+
 from pseudoc import config
-from .ir import Func, Data
+from .ir import Func, Data, InlineStr, DEFAULT_LAYOUT
+
+
+def _write(file, s):
+    if file is None:
+        file = sys.stdout
+    file.write(s)
 
 
 def str_varset(s):
     return ", ".join(sorted([v.dest_name() for v in s]))
 
 
-def render_insn(insn, bb, cfg, use_regs):
+def mem_type(arg):
+    # Untyped memory access is of machine word size.
+    if arg.val is None:
+        return "long"
+    return arg.val
 
-    def str_arg(arg):
-        if arg.defi is not None:
-            if use_regs:
-                val = arg.defi.reg
-            else:
-                val = arg.defi.dest_name()
-        else:
-            if arg.val == "@undef":
-                return "UNDEF"
-            val = str(arg.val)
-        return val
-
-    def format_args(insn):
-        res = []
-        for arg in insn.args:
-            res.append(str_arg(arg))
-        return ", ".join(res)
-
-    def render(insn):
-        prefix = ""
-
-        if not insn.dest:
-            if insn.op == "return":
-                if insn.args:
-                    return "return %s" % str_arg(insn.args[0])
-                else:
-                    return "return"
-            elif insn.op == "goto":
-                return "goto %s" % insn.args[0]
-            elif insn.op == "if":
-                return "if (%s) goto %s; else goto %s" % (
-                    " ".join([str_arg(a) for a in insn.args]),
-                    bb.succs[0].label,
-                    bb.succs[1].label,
-                )
-
-        if insn.op == "@param":
-            rhs = cfg.params[insn.args[0].val]
-        elif insn.op == "@load":
-            rhs = "*(%s*)%s" % (insn.args[1], str_arg(insn.args[0]))
-        elif insn.op == "@store":
-            rhs = "*(%s*)%s = %s" % (insn.args[1], str_arg(insn.args[0]), str_arg(insn.args[2]))
-        elif insn.op == "@phi":
-            if use_regs:
-                reg = insn.reg
-                for a in insn.args:
-                    if reg != a.defi.reg:
-                        break
-                else:
-                    return None
-
-            preds = ["&&%s" % p.label for p in bb.preds]
-            vals = [str_arg(a) for a in insn.args]
-            args = []
-            for t in zip(preds, vals):
-                args.extend(t)
-            args.append("NULL")
-            rhs = "%s(%s)" % ("phi", ", ".join(args))
-        elif insn.op[0].isalpha() or insn.op.startswith("@"):
-            op = insn.op
-            args = insn.args
-            if insn.op == "call":
-                op = args[0]
-                args = args[1:]
-            rhs = "%s(%s)" % (op, ", ".join([str_arg(a) for a in args]))
+
+def str_arg(arg, use_regs):
+    if arg.defi is not None:
+        if use_regs:
+            return arg.defi.reg
+        return arg.defi.dest_name()
+    if arg.val == "@undef":
+        return "UNDEF"
+    return str(arg.val)
+
+
+# Renderers of insns without dest which are statements, by op. Each takes
+# (insn, bb, cfg, use_regs) and returns C text.
+
+def _render_return(insn, bb, cfg, use_regs):
+    if insn.args:
+        return "return %s" % str_arg(insn.args[0], use_regs)
+    return "return"
+
+
+def _render_goto(insn, bb, cfg, use_regs):
+    return "goto %s" % insn.args[0]
+
+
+def _render_if(insn, bb, cfg, use_regs):
+    return "if (%s) goto %s; else goto %s" % (
+        " ".join([str_arg(a, use_regs) for a in insn.args]),
+        bb.succs[0].label,
+        bb.succs[1].label,
+    )
+
+
+STMT_RENDERERS = {
+    "return": _render_return,
+    "goto": _render_goto,
+    "if": _render_if,
+}
+
+
+# Renderers of right-hand side of insns, by op (same args as above). May
+# return None if insn should be skipped.
+
+def _render_param(insn, bb, cfg, use_regs):
+    return cfg.params[insn.args[0].val]
+
+
+def _render_load(insn, bb, cfg, use_regs):
+    return "*(%s*)%s" % (mem_type(insn.args[1]), str_arg(insn.args[0], use_regs))
+
+
+def _render_store(insn, bb, cfg, use_regs):
+    return "*(%s*)%s = %s" % (
+        mem_type(insn.args[1]), str_arg(insn.args[0], use_regs), str_arg(insn.args[2], use_regs)
+    )
+
+
+def _render_phi(insn, bb, cfg, use_regs):
+    if use_regs:
+        # Phi of values all in the same register is a no-op.
+        reg = insn.reg
+        for a in insn.args:
+            if a.defi is None or reg != a.defi.reg:
+                break
         else:
-            if insn.op == "=":
-                rhs = str_arg(insn.args[0])
-            else:
-                assert len(insn.args) == 2
-                rhs = "%s %s %s" % (str_arg(insn.args[0]), insn.op, str_arg(insn.args[1]))
+            return None
+
+    args = []
+    for p, a in zip(bb.preds, insn.args):
+        args.append("&&%s" % p.label)
+        args.append(str_arg(a, use_regs))
+    args.append("NULL")
+    return "%s(%s)" % ("phi", ", ".join(args))
+
 
+def _render_func_like(insn, bb, cfg, use_regs):
+    op = insn.op
+    args = insn.args
+    if op == "call":
+        op = args[0]
+        args = args[1:]
+    return "%s(%s)" % (op, ", ".join([str_arg(a, use_regs) for a in args]))
 
-        if not insn.dest:
-            res = "%s" % rhs
+
+def _render_move(insn, bb, cfg, use_regs):
+    return str_arg(insn.args[0], use_regs)
+
+
+def _render_infix(insn, bb, cfg, use_regs):
+    assert len(insn.args) == 2
+    return "%s %s %s" % (str_arg(insn.args[0], use_regs), insn.op, str_arg(insn.args[1], use_regs))
+
+
+RHS_RENDERERS = {
+    "@param": _render_param,
+    "@load": _render_load,
+    "@store": _render_store,
+    "@phi": _render_phi,
+    "=": _render_move,
+}
+
+
+def _get_rhs_renderer(op):
+    f = RHS_RENDERERS.get(op)
+    if f is None:
+        if op[0].isalpha() or op.startswith("@"):
+            f = _render_func_like
         else:
-            if use_regs:
-                dest = insn.reg
-            else:
-                dest = insn.dest_name(cfg.is_ssa)
-            res = "%s = %s" % (dest, rhs)
-        return prefix + res
+            f = _render_infix
+        RHS_RENDERERS[op] = f
+    return f
 
-    return render(insn)
+
+def render_insn(insn, bb, cfg, use_regs):
+    if not insn.dest:
+        f = STMT_RENDERERS.get(insn.op)
+        if f is not None:
+            return f(insn, bb, cfg, use_regs)
+
+    f = RHS_RENDERERS.get(insn.op) or _get_rhs_renderer(insn.op)
+    rhs = f(insn, bb, cfg, use_regs)
+    if rhs is None:
+        return None
+    if not insn.dest:
+        return rhs
+    if use_regs:
+        dest = insn.reg
+    else:
+        dest = insn.dest_name(cfg.is_ssa)
+    return "%s = %s" % (dest, rhs)
 
 
 def get_local_vars(cfg, use_regs):
@@ -112,56 +170,139 @@ def get_local_vars(cfg, use_regs):
 
 def is_str_data(data):
     # Whether Data is a simple string.
-    return len(data.desc) == 1 and data.desc[0][0] == "str"
+    return data.desc is not None and len(data.desc) == 1 and data.desc[0][0] == "str"
+
+
+# byte -> its representation in C string literal (octal escapes are used,
+# as hex escapes don't have fixed length).
+_C_CHARS = [chr(c) if 0x20 <= c < 0x7f else "\\%03o" % c for c in range(256)]
+for _c in '"\\?':
+    _C_CHARS[ord(_c)] = "\\%03o" % ord(_c)
+
 
+def c_bytes(b):
+    return '"%s"' % "".join([_C_CHARS[c] for c in b])
 
-def render_data(data, file=None):
+
+# Size -> C type of data elements with relocs. Fixed-width integer types
+# are used even for pointer-sized ones, so data layout matches the one
+# data was packed with regardless of the host (and if host pointers are
+# larger, compiler rejects truncating symbol addresses, instead of fields
+# being silently misplaced).
+_RELOC_TYPES = {1: "uint8_t", 2: "uint16_t", 4: "uint32_t", 8: "uint64_t"}
+
+
+def render_data(data, file=None, layout=DEFAULT_LAYOUT):
     if is_str_data(data):
-        print("char %s[%d] = %s;" % (data.name, len(data.desc[0][2]), data.desc[0][1]), file=file)
-    else:
-        assert False
+        _write(file, "char %s[%d] = %s;\n" % (data.name, len(data.desc[0][2]), data.desc[0][1]))
+        return
+    content, relocs, align = layout.pack_data(data)
+    if not relocs:
+        _write(file, "unsigned char %s[%d] = %s;\n" % (data.name, len(content), c_bytes(content)))
+        return
+    # Elements with symbol addresses need own initializers, so data is
+    # rendered as a packed struct of them and byte arrays in between.
+    fields = []
+    inits = []
+    off = 0
+    for r_off, typ, val in relocs:
+        if r_off > off:
+            fields.append("unsigned char f%d[%d];" % (len(fields), r_off - off))
+            inits.append(c_bytes(content[off:r_off]))
+        size = layout.prim_size(typ)
+        addr = str(val) if isinstance(val, InlineStr) else "&%s" % val
+        ctype = _RELOC_TYPES[size]
+        fields.append("%s f%d;" % (ctype, len(fields)))
+        inits.append("(%s)(uintptr_t)%s" % (ctype, addr))
+        off = r_off + size
+    if off < len(content):
+        fields.append("unsigned char f%d[%d];" % (len(fields), len(content) - off))
+        inits.append(c_bytes(content[off:]))
+    _write(file, "struct __attribute__((packed)) {\n    %s\n} %s = { %s };\n" % (
+        "\n    ".join(fields), data.name, ", ".join(inits)))
 
 
 def render_cfg(func, use_regs=False, file=None):
     config.SSA_SUFFIX_CHAR = "_"
 
-    print("int %s(%s) {" % (func.name, ", ".join(["int %s" % p for p in func.params])), file=file)
+    # Function text is built as a list of lines, written at once.
+    out = ["int %s(%s) {" % (func.name, ", ".join(["int %s" % p for p in func.params]))]
 
     if func.is_ssa:
-        print("    SSA_HEADER();", file=file)
+        out.append("    SSA_HEADER();")
 
     local_vars = get_local_vars(func, use_regs)
     if local_vars:
-        print("    long %s;" % ", ".join(local_vars), file=file)
+        out.append("    long %s;" % ", ".join(local_vars))
 
-    for i, bb in enumerate(func.bblocks):
-        next_bb = func.bblocks[i + 1] if i < len(func.bblocks) - 1 else None
-        label = "L(%s):" % bb.label if func.is_ssa else "%s:" % bb.label
-        print(label, file=file)
+    bblocks = func.bblocks
+    for i, bb in enumerate(bblocks):
+        next_bb = bblocks[i + 1] if i < len(bblocks) - 1 else None
+        out.append("L(%s):" % bb.label if func.is_ssa else "%s:" % bb.label)
         for insn in bb.insns:
             insn_str = render_insn(insn, bb, func, use_regs)
             if insn_str is None:
                 continue
-            print("    " + insn_str + ";", file=file)
+            out.append("    %s;" % insn_str)
         if len(bb.succs) == 1 and bb.succs[0] is not next_bb:
-            print("    goto %s;" % bb.succs[0].label, file=file)
-    print("}", file=file)
+            out.append("    goto %s;" % bb.succs[0].label)
+    out.append("}")
+    out.append("")
+    _write(file, "\n".join(out))
 
 
-def render_item(el, use_regs=False, file=None):
+def render_item(el, use_regs=False, file=None, layout=DEFAULT_LAYOUT):
     if isinstance(el, Func):
         render_cfg(el, use_regs, file)
     elif isinstance(el, Data):
-        render_data(el, file)
+        render_data(el, file, layout)
     else:
         assert False
 
 
-def render_module(mod, use_regs=False, file=None):
-    print('#include "pseudoc.h"\n', file=file)
+def extern_syms(mod, layout=DEFAULT_LAYOUT):
+    """Symbols referenced by data relocs, but not defined in the module."""
+    defined = {el.name for el in mod.contents}
+    res = []
+    for el in mod.contents:
+        if not isinstance(el, Data) or is_str_data(el):
+            continue
+        for _, _, val in layout.pack_data(el)[1]:
+            if not isinstance(val, InlineStr) and val not in defined and val not in res:
+                res.append(val)
+    return res
+
+
+def render_module(mod, use_regs=False, file=None, layout=DEFAULT_LAYOUT):
+    _write(file, '#include <stdint.h>\n#include "pseudoc.h"\n\n')
+    externs = extern_syms(mod, layout)
+    if externs:
+        _write(file, "".join(["extern char %s[];\n" % s for s in externs]) + "\n")
     need_empty_line = False
     for el in mod.contents:
         if need_empty_line:
-            print(file=file)
-        render_item(el, use_regs, file)
+            _write(file, "\n")
+        render_item(el, use_regs, file, layout)
         need_empty_line = True
+
+
+def __main__():
+    import argparse
+    from .ir import DataLayout
+    from . import parser
+
+    argp = argparse.ArgumentParser(description="Render PseudoC module as C")
+    argp.add_argument("file")
+    argp.add_argument("--ptr-size", type=int, default=struct.calcsize("P"),
+        help="pointer size data is laid out with (default: host's, %(default)s)")
+    args = argp.parse_args()
+
+    layout = DataLayout(args.ptr_size)
+    with open(args.file) as f:
+        # Data content can be packed while parsing only for default layout.
+        mod = parser.Parser(pack_data=layout.ptr_size == DEFAULT_LAYOUT.ptr_size).parse(f)
+    render_module(mod, file=sys.stdout, layout=layout)
+
+
+if __name__ == "__main__":
+    __main__()
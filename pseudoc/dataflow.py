@@ -0,0 +1,275 @@
+# PseudoC-IR - Simple Program Analysis/Compiler Intermediate Representation
+#
+# Copyright (c) 2020-2021 Paul Sokolovsky
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# Bit-vector dataflow framework.
+#
+# Sets are Python ints used as bitsets, with elements (variables, defs,
+# etc.) numbered densely by each problem. Blocks are numbered in reverse
+# postorder, and the solver uses a worklist ordered by it (or by postorder
+# for backward problems), so acyclic parts of CFG converge in one visit.
+# Only blocks reachable from the entry are considered.
+#
+# Problems are described by per-block gen/kill bitsets, with union as the
+# meet operator: out = gen | (in & ~kill), where for a forward problem
+# "in" is at block entry, and for backward, at block exit.
+
+from heapq import heappush, heappop
+
+
+def is_local_var(val):
+    return isinstance(val, str) and val.startswith("$")
+
+
+def use_key(arg):
+    "Key of the value used by arg (def insn in SSA, var name otherwise), or None."
+    if arg.defi is not None:
+        return arg.defi
+    if is_local_var(arg.val):
+        return arg.val
+    return None
+
+
+def def_key(insn, is_ssa):
+    if not insn.dest:
+        return None
+    if is_ssa:
+        return insn
+    return insn.dest
+
+
+def iter_bits(bits):
+    "Yield numbers of set bits."
+    if bits.bit_length() > 1024:
+        # Isolating lowest bit is O(size) for big ints, so scan a string
+        # instead.
+        s = bin(bits)[:1:-1]
+        i = s.find("1")
+        while i >= 0:
+            yield i
+            i = s.find("1", i + 1)
+        return
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class Dataflow:
+
+    forward = True
+
+    def __init__(self, rpo):
+        self.blocks = rpo
+        self.index = {bb: i for i, bb in enumerate(rpo)}
+        n = len(rpo)
+        self.gen = [0] * n
+        self.kill = [0] * n
+        # Added to meet result of a block, if not None.
+        self.extra = None
+        # Results: meet of inputs, and transfer function result, for each
+        # block (i.e. for forward problem, set at entry and exit).
+        self.inp = None
+        self.out = None
+
+    def solve(self):
+        blocks = self.blocks
+        index = self.index
+        n = len(blocks)
+        gen = self.gen
+        kill = self.kill
+        extra = self.extra
+        if self.forward:
+            inputs = [[index[p] for p in bb.preds if p in index] for bb in blocks]
+            deps = [[index[s] for s in bb.succs] for bb in blocks]
+            prio = list(range(n))
+        else:
+            inputs = [[index[s] for s in bb.succs] for bb in blocks]
+            deps = [[index[p] for p in bb.preds if p in index] for bb in blocks]
+            prio = list(range(n - 1, -1, -1))
+        order = sorted(range(n), key=prio.__getitem__)
+
+        inp = [0] * n
+        out = list(gen)
+        pending = [True] * n
+        # Worklist is processed in passes, each in priority order. Blocks
+        # which become pending with a priority lower than the current
+        # block's (i.e. along back edges) are deferred to the next pass,
+        # so a change doesn't restart propagation from the loop header
+        # each time (which is quadratic on CFGs with many loops).
+        # Heaps of (priority, block number).
+        work = [(prio[i], i) for i in order]
+        nxt = []
+        while work:
+            while work:
+                p, i = heappop(work)
+                pending[i] = False
+                x = extra[i] if extra else 0
+                for j in inputs[i]:
+                    x |= out[j]
+                inp[i] = x
+                y = gen[i] | (x & ~kill[i])
+                if y != out[i]:
+                    out[i] = y
+                    for j in deps[i]:
+                        if not pending[j]:
+                            pending[j] = True
+                            if prio[j] > p:
+                                heappush(work, (prio[j], j))
+                            else:
+                                heappush(nxt, (prio[j], j))
+            work, nxt = nxt, work
+        self.inp = inp
+        self.out = out
+        return self
+
+
+class Liveness(Dataflow):
+    """Live variables (or values, in SSA). Phi uses are live at the end of
+    the corresponding predecessor."""
+
+    forward = False
+
+    def __init__(self, func, rpo):
+        super().__init__(rpo)
+        is_ssa = func.is_ssa
+        index = self.index
+        n = len(rpo)
+        # Only values upward-exposed somewhere (or used by phis) can be
+        # live across blocks, so only they get numbered. This keeps
+        # bitsets small, in particular in SSA.
+        self.keys = keys = []
+        num = {}
+        uses = [[] for _ in range(n)]
+        defs = [[] for _ in range(n)]
+        phi_uses = [[] for _ in range(n)]
+        for i, bb in enumerate(rpo):
+            u = uses[i]
+            d = defs[i]
+            defined = set()
+            for insn in bb.insns:
+                if insn.op == "@phi":
+                    for p, a in zip(bb.preds, insn.args):
+                        k = use_key(a)
+                        if k is not None and p in index:
+                            phi_uses[index[p]].append(k)
+                else:
+                    for a in insn.args:
+                        k = use_key(a)
+                        if k is not None and k not in defined:
+                            u.append(k)
+                k = def_key(insn, is_ssa)
+                if k is not None:
+                    defined.add(k)
+                    d.append(k)
+
+        def bits(lst, add):
+            res = 0
+            for k in lst:
+                b = num.get(k)
+                if b is None:
+                    if not add:
+                        continue
+                    b = num[k] = len(keys)
+                    keys.append(k)
+                res |= 1 << b
+            return res
+
+        self.gen = [bits(u, True) for u in uses]
+        extra = [bits(u, True) for u in phi_uses]
+        if any(extra):
+            self.extra = extra
+        self.kill = [bits(d, False) for d in defs]
+        self.num = num
+        self.solve()
+
+    def _keys(self, bits):
+        keys = self.keys
+        return {keys[b] for b in iter_bits(bits)}
+
+    def live_in(self, bb):
+        return self._keys(self.out[self.index[bb]])
+
+    def live_out(self, bb):
+        return self._keys(self.inp[self.index[bb]])
+
+    def is_live_in(self, key, bb):
+        b = self.num.get(key)
+        return b is not None and bool(self.out[self.index[bb]] >> b & 1)
+
+    def is_live_out(self, key, bb):
+        b = self.num.get(key)
+        return b is not None and bool(self.inp[self.index[bb]] >> b & 1)
+
+
+class ReachingDefs(Dataflow):
+    """Definitions (insns with dest) reaching each block. In SSA, each
+    definition is of a distinct value, so none kills another."""
+
+    def __init__(self, func, rpo):
+        super().__init__(rpo)
+        is_ssa = func.is_ssa
+        # Only last def of a var in a block can reach past the block, so
+        # only such defs are numbered.
+        self.defs = defs = []
+        num = {}
+        var_mask = {}
+        block_vars = []
+        for i, bb in enumerate(rpo):
+            last = {}
+            for insn in bb.insns:
+                k = def_key(insn, is_ssa)
+                if k is not None:
+                    last[k] = insn
+            g = 0
+            for var, insn in last.items():
+                b = num[insn] = len(defs)
+                defs.append(insn)
+                g |= 1 << b
+                var_mask[var] = var_mask.get(var, 0) | (1 << b)
+            self.gen[i] = g
+            block_vars.append(last)
+        for i, last in enumerate(block_vars):
+            k = 0
+            for var in last:
+                k |= var_mask[var]
+            self.kill[i] = k & ~self.gen[i]
+        self.num = num
+        self.solve()
+
+    def reaching_in(self, bb):
+        defs = self.defs
+        return [defs[b] for b in iter_bits(self.inp[self.index[bb]])]
+
+    def reaching_out(self, bb):
+        defs = self.defs
+        return [defs[b] for b in iter_bits(self.out[self.index[bb]])]
+
+
+def calc_liveness(func, am):
+    return Liveness(func, am.get("rpo"))
+
+
+def calc_reaching_defs(func, am):
+    return ReachingDefs(func, am.get("rpo"))
@@ -22,14 +22,23 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+
+# Output is built per item (function, struct, data) as a list of lines,
+# which is then written with a single write() call. Insn mnemonics are
+# formatted by per-op functions looked up in a table.
+
+import sys
+
 from . import ir
 
 
-# Insn functions
+def _write(file, s):
+    if file is None:
+        file = sys.stdout
+    file.write(s)
 
 
-def is_infix_op(self):
-    return not self.op[0].isalpha() and not self.op.startswith("@") and len(self.args) == 2
+# Insn functions
 
 
 def format_dest_name(self, is_ssa=True):
@@ -49,69 +58,118 @@ def format_if_insn(self):
     return "%s (%s)" % (self.op, format_args(self.args, sep=" "))
 
 
+# Formatters of insn mnemonics (without dest), by op. Each takes insn and
+# optional BBlock.
+
+def _fmt_generic(self, bb):
+    res = self.op
+    args = format_args(self.args)
+    if args:
+        res += " " + args
+    return res
+
+
+def _fmt_operator(self, bb):
+    # Non-alphanumeric op, infix if binary.
+    if len(self.args) == 2:
+        return "%s %s %s" % (self.args[0], self.op, self.args[1])
+    return _fmt_generic(self, bb)
+
+
+def _fmt_move(self, bb):
+    if len(self.args) == 2:
+        return _fmt_operator(self, bb)
+    return format_args(self.args)
+
+
+def _fmt_op_only(self, bb):
+    return self.op
+
+
+def _fmt_spec(self, bb):
+    return "%s(%s)" % (self.op, format_args(self.args))
+
+
+def _fmt_load(self, bb):
+    if self.args[1].val is None:
+        return "*%s" % self.args[0]
+    assert isinstance(self.args[1].val, ir.Type), repr(self.args[1])
+    return "*(%s*)%s" % (self.args[1].val, self.args[0])
+
+
+def _fmt_store(self, bb):
+    if self.args[1].val is None:
+        return "*%s = %s" % (self.args[0], self.args[2])
+    assert isinstance(self.args[1].val, ir.Type), repr(self.args[1])
+    return "*(%s*)%s = %s" % (self.args[1].val, self.args[0], self.args[2])
+
+
+def _fmt_cast(self, bb):
+    return "(%s)%s" % (self.args[0], self.args[1])
+
+
+def _fmt_call(self, bb):
+    return "%s(%s)" % (self.args[0], format_args(self.args[1:]))
+
+
+def _fmt_if(self, bb):
+    res = format_if_insn(self)
+    if bb:
+        assert len(bb.succs) == 2
+        res += " goto %s else %s" % (bb.succs[0].label, bb.succs[1].label)
+    return res
+
+
+def _fmt_goto(self, bb):
+    if bb:
+        assert len(bb.succs) == 1
+        return "%s %s" % (self.op, bb.succs[0].label)
+    return "%s %s" % (self.op, format_args(self.args))
+
+
+INSN_FORMATTERS = {
+    "=": _fmt_move,
+    "@nop": _fmt_op_only,
+    "@load": _fmt_load,
+    "@store": _fmt_store,
+    "@cast": _fmt_cast,
+    "call": _fmt_call,
+    "if": _fmt_if,
+    "goto": _fmt_goto,
+}
+
+
+def _get_formatter(op):
+    f = INSN_FORMATTERS.get(op)
+    if f is None:
+        if op.startswith("@"):
+            f = _fmt_spec
+        elif not op[0].isalpha():
+            f = _fmt_operator
+        else:
+            f = _fmt_generic
+        # Cache for other insns with the same op.
+        INSN_FORMATTERS[op] = f
+    return f
+
+
 def format_insn(self, bb=None, is_ssa=True):
     "Format textual mnemonic of instruction, without any annotations."
-    res = ""
-
+    f = INSN_FORMATTERS.get(self.op) or _get_formatter(self.op)
     if self.dest:
+        res = "%s = " % format_dest_name(self, is_ssa)
         if self.typ:
-            res += "%s " % self.typ
-        res += "%s = " % format_dest_name(self, is_ssa)
-
-    if is_infix_op(self):
-        res += "%s %s %s" % (self.args[0], self.op, self.args[1])
-    elif self.op == "=":
-        res += format_args(self.args)
-    elif self.op == "@nop":
-        res += self.op
-    elif self.op == "@load":
-        if self.args[1].val is None:
-            res += "*%s" % self.args[0]
-        else:
-            assert isinstance(self.args[1].val, ir.Type), repr(self.args[1])
-            res += "*(%s*)%s" % (self.args[1].val, self.args[0])
-    elif self.op == "@store":
-        if self.args[1].val is None:
-            res += "*%s = %s" % (self.args[0], self.args[2])
-        else:
-            assert isinstance(self.args[1].val, ir.Type), repr(self.args[1])
-            res += "*(%s*)%s = %s" % (self.args[1].val, self.args[0], self.args[2])
-    elif self.op == "@cast":
-        res += "(%s)%s" % (self.args[0], self.args[1])
-    elif self.op.startswith("@"):
-        res += "%s(%s)" % (self.op, format_args(self.args))
-    elif self.op == "call":
-        res += "%s(%s)" % (self.args[0], format_args(self.args[1:]))
-    elif self.op == "if":
-        res += format_if_insn(self)
-        if bb:
-            assert len(bb.succs) == 2
-            res += " goto %s else %s" % (bb.succs[0].label, bb.succs[1].label)
-    elif self.op == "goto":
-        if bb:
-            assert len(bb.succs) == 1
-            res += "%s %s" % (self.op, bb.succs[0].label)
-        else:
-            res += "%s %s" % (self.op, format_args(self.args))
-    else:
-        res += self.op
-        args = format_args(self.args)
-        if args:
-            res += " " + args
-
-    return res
+            res = "%s %s" % (self.typ, res)
+        return res + f(self, bb)
+    return f(self, bb)
 
 
 # __str__ alike which can take extra optional args.
 def format_insn_ann(self, bb=None, **opts):
     prefix = "    "
-    suffix = ""
     if self.id is not None:
         prefix = "%6d: " % self.id
-    mnem = self.format_insn(bb, **opts)
-    if suffix:
-        suffix = " ;" + suffix
-    return prefix + mnem + suffix
+    return prefix + self.format_insn(bb, **opts)
 
 
 # Arg functions
@@ -129,24 +187,43 @@ def format_arg(self):
 # BBlock functions
 
 
-def dump_bb_insns(self, file=None, **opts):
+def bb_insns_lines(self, out, **opts):
+    "Append lines of block's insns to list out."
     for s in self.insns:
-        print(s.to_str(bb=self, **opts), file=file)
+        if s.id is None:
+            out.append("    " + s.format_insn(self, **opts))
+        else:
+            out.append("%6d: %s" % (s.id, s.format_insn(self, **opts)))
 
 
-def dump_bb(self, bb_ann=True, expl_goto=False, file=None, **opts):
-    print("%s:" % self.label, file=file)
+def bb_lines(self, out, bb_ann=True, expl_goto=False, **opts):
+    "Append lines of block dump to list out."
+    out.append("%s:" % self.label)
     if bb_ann:
-        print("    # pred: %s" % (
-            [b.label for b in self.preds],
-        ), file=file)
-    dump_bb_insns(self, file=file, **opts)
+        out.append("    # pred: %s" % ([b.label for b in self.preds],))
+    bb_insns_lines(self, out, **opts)
     if expl_goto and len(self.succs) == 1:
-        print("    goto %s" % self.succs[0].label, file=file)
+        out.append("    goto %s" % self.succs[0].label)
     if bb_ann:
-        print("    # succ: %s" % (
-            [b.label for b in self.succs],
-        ), file=file)
+        out.append("    # succ: %s" % ([b.label for b in self.succs],))
+
+
+def _write_lines(file, lines):
+    if lines:
+        lines.append("")
+        _write(file, "\n".join(lines))
+
+
+def dump_bb_insns(self, file=None, **opts):
+    out = []
+    bb_insns_lines(self, out, **opts)
+    _write_lines(file, out)
+
+
+def dump_bb(self, bb_ann=True, expl_goto=False, file=None, **opts):
+    out = []
+    bb_lines(self, out, bb_ann, expl_goto, **opts)
+    _write_lines(file, out)
 
 
 # Func functions
@@ -165,51 +242,62 @@ def dump_func(self, file=None, **opts):
     if self.res_type:
         t = "%s " % self.res_type
     param_str = format_func_params(self, self.params, self.param_types)
-    print("%s%s(%s) {" % (t, self.name, param_str), file=file)
-    for bb in self.bblocks:
-        bb.dump(file=file, is_ssa=self.is_ssa, **opts)
-    print("}", file=file)
-
-
-# For debugging during parsing only
-def simple_dump_func(self):
+    out = ["%s%s(%s) {" % (t, self.name, param_str)]
     for bb in self.bblocks:
-        bb.simple_print()
+        bb_lines(bb, out, is_ssa=self.is_ssa, **opts)
+    out.append("}")
+    _write_lines(file, out)
 
 
 # Struct functions
 
 
 def dump_struct(self, file=None, **opts):
-    print("struct %s { " % self.name, end="", file=file)
-    need_comma = False
+    fields = []
     for name, typ in self.fields:
-        if need_comma:
-            print(", ", end="", file=file)
-        print("%s" % typ, end="", file=file)
         if name:
-            print(" %s" % name, end="", file=file)
-        need_comma = True
-    print(" }", file=file)
+            fields.append("%s %s" % (typ, name))
+        else:
+            fields.append("%s" % typ)
+    _write(file, "struct %s { %s }\n" % (self.name, ", ".join(fields)))
 
 
 # Data functions
 
 
+# byte -> its representation in a string literal.
+_STR_CHARS = [chr(c) if 0x20 <= c < 0x7f else "\\x%02x" % c for c in range(256)]
+_STR_CHARS[ord('"')] = '\\"'
+_STR_CHARS[ord("\\")] = "\\x5c"
+_STR_CHARS[ord("\n")] = "\\n"
+
+
+def format_bytes(b):
+    "Format bytes as a string literal."
+    return '"%s"' % "".join([_STR_CHARS[c] for c in b])
+
+
 def dump_data(self, file=None, **opts):
     t = "%s " % self.type if self.type else ""
-    print("%s%s = { " % (t, self.name), end="", file=file)
-    need_comma = False
-    for typ, *vals in self.desc:
-        val = vals[0]
-        if need_comma:
-            print(", ", end="", file=file)
-        if typ == "str":
-            print(val, end="", file=file)
-        else:
-            print("(%s)%s" % (typ, val), end="", file=file)
-        need_comma = True
-    print(" }", file=file)
+    els = []
+    if self.desc is None:
+        # Content form, dumped as strings, with relocs in between.
+        content = self.content
+        off = 0
+        for reloc_off, typ, val in self.relocs:
+            if reloc_off > off:
+                els.append(format_bytes(content[off:reloc_off]))
+            els.append("(%s)%s" % (typ, val))
+            off = reloc_off + ir.DEFAULT_LAYOUT.prim_size(typ)
+        if off < len(content):
+            els.append(format_bytes(content[off:]))
+    else:
+        for typ, *vals in self.desc:
+            if typ == "str":
+                els.append("%s" % vals[0])
+            else:
+                els.append("(%s)%s" % (typ, vals[0]))
+    _write(file, "%s%s = { %s }\n" % (t, self.name, ", ".join(els)))
 
 
 # Module functions
@@ -219,6 +307,6 @@ def dump_module(self, file=None, **opts):
     need_empty_line = False
     for item in self.contents:
         if need_empty_line:
-            print(file=file)
+            _write(file, "\n")
         item.dump(file=file, **opts)
         need_empty_line = True
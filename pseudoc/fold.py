@@ -0,0 +1,85 @@
+# PseudoC-IR - Simple Program Analysis/Compiler Intermediate Representation
+#
+# Copyright (c) 2020-2021 Paul Sokolovsky
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# @sizeof() folding pass (-x pseudoc.fold.sizeof). Replaces @sizeof(type)
+# operands of instructions with constants, per data layout given by pass
+# params: ptr_size and packed (see pseudoc.ir.DataLayout). Defaults are
+# those of ir.DEFAULT_LAYOUT, which is also used by pseudoc.interp.
+# pseudoc_tool runs passes on functions as they're parsed, so a struct
+# may not be defined yet, @sizeof of such incomplete types is left as is.
+
+from .ir import Func, SpecFunc, ArrType, StructType, DataLayout, DEFAULT_LAYOUT, MAX_CACHED_TYPES
+from . import analysis
+
+
+# DataLayout per pass params, reused across functions, so layouts of types
+# shared by them are computed once.
+_layouts = {}
+
+
+def get_layout(ptr_size=DEFAULT_LAYOUT.ptr_size, packed=DEFAULT_LAYOUT.packed):
+    key = (ptr_size, packed)
+    layout = _layouts.get(key)
+    if layout is None:
+        if key == (DEFAULT_LAYOUT.ptr_size, DEFAULT_LAYOUT.packed):
+            layout = DEFAULT_LAYOUT
+        else:
+            layout = DataLayout(ptr_size, packed=packed, max_cached=MAX_CACHED_TYPES)
+        _layouts[key] = layout
+    return layout
+
+
+def forget_types(types):
+    """Drop memoized layouts of redefined struct types from DEFAULT_LAYOUT
+    and layouts of the pass."""
+    DEFAULT_LAYOUT.forget(types)
+    for layout in _layouts.values():
+        if layout is not DEFAULT_LAYOUT:
+            layout.forget(types)
+
+
+def _is_complete(typ, seen=()):
+    "Whether typ has no structs without fields (pointers to them are ok)."
+    while isinstance(typ, ArrType):
+        typ = typ.el_type
+    if not isinstance(typ, StructType) or typ in seen:
+        return True
+    if typ.fields is None:
+        return False
+    seen = seen + (typ,)
+    return all(_is_complete(t, seen) for name, t in typ.fields)
+
+
+def sizeof(func, ptr_size=DEFAULT_LAYOUT.ptr_size, packed=DEFAULT_LAYOUT.packed):
+    if not isinstance(func, Func):
+        return analysis.ALL
+    layout = get_layout(int(ptr_size), packed)
+    for bb in func.bblocks:
+        for insn in bb.insns:
+            for arg in insn.args:
+                v = arg.val
+                if type(v) is SpecFunc and v.op == "@sizeof" and _is_complete(v.args[0].val):
+                    arg.val = layout.size(v.args[0].val)
+    return analysis.ALL
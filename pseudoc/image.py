@@ -0,0 +1,187 @@
+# PseudoC-IR - Simple Program Analysis/Compiler Intermediate Representation
+#
+# Copyright (c) 2020-2021 Paul Sokolovsky
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# Binary image of module data, like a .rodata section
+# (python -m pseudoc.image file.pseudoc -o out.bin).
+#
+# Data items are placed one after another, each aligned as given by
+# DataLayout.pack_data(), followed by string literals referenced from
+# them (deduplicated). The image is a list of chunks, which are only
+# concatenated when written, so content of Data items without relocs, and
+# external blob files (add_blob(), mapped with mmap), aren't copied.
+# Relocs against symbols defined in the image are resolved (to base +
+# offset) by link(), others are left in .relocs.
+
+import os
+import mmap
+
+from .ir import Data, InlineStr, DEFAULT_LAYOUT
+from .parser import unescape
+
+
+class Image:
+
+    def __init__(self, layout=None, base=0):
+        if layout is None:
+            layout = DEFAULT_LAYOUT
+        self.layout = layout
+        self.base = base
+        # (offset, bytes-like object)
+        self.chunks = []
+        self.size = 0
+        # symbol -> offset
+        self.symbols = {}
+        # Unresolved relocs: (offset, prim type name, symbol)
+        self.relocs = []
+        # Relocs to resolve: (chunk, offset in chunk, prim type name, value)
+        self.pending = []
+        # String literal -> offset
+        self.strs = {}
+        self.maps = []
+
+    def place(self, buf, align=1):
+        "Add chunk buf at next offset aligned to align, return the offset."
+        off = (self.size + align - 1) // align * align
+        self.chunks.append((off, buf))
+        self.size = off + len(buf)
+        return off
+
+    def add_data(self, data):
+        content, relocs, align = self.layout.pack_data(data)
+        if relocs:
+            # Relocs are patched in place, so don't modify Data's content.
+            content = bytearray(content)
+        off = self.symbols[data.name] = self.place(content, align)
+        for r_off, typ, val in relocs:
+            self.pending.append((off, content, r_off, typ, val))
+        return off
+
+    def add_module(self, mod):
+        for item in mod.contents:
+            if isinstance(item, Data):
+                self.add_data(item)
+
+    def add_blob(self, name, path, align=1):
+        "Add contents of file path as symbol name. File is mapped, not read."
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.maps.append(buf)
+            else:
+                buf = b""
+        off = self.symbols[name] = self.place(buf, align)
+        return off
+
+    def str_offset(self, s):
+        off = self.strs.get(s.s)
+        if off is None:
+            off = self.strs[s.s] = self.place(unescape(s.s.encode()) + b"\0")
+        return off
+
+    def link(self):
+        "Resolve relocs (added since last call)."
+        pending = self.pending
+        self.pending = []
+        order = self.layout.byteorder
+        for chunk_off, buf, r_off, typ, val in pending:
+            if isinstance(val, InlineStr):
+                off = self.str_offset(val)
+            else:
+                off = self.symbols.get(val)
+                if off is None:
+                    self.relocs.append((chunk_off + r_off, typ, val))
+                    continue
+            size = self.layout.prim_size(typ)
+            v = (self.base + off) & ((1 << (size * 8)) - 1)
+            buf[r_off:r_off + size] = v.to_bytes(size, order)
+
+    def write(self, f):
+        pos = 0
+        for off, buf in self.chunks:
+            if off > pos:
+                f.write(bytes(off - pos))
+            f.write(buf)
+            pos = off + len(buf)
+
+    def getvalue(self):
+        res = bytearray(self.size)
+        for off, buf in self.chunks:
+            res[off:off + len(buf)] = buf
+        return res
+
+    def close(self):
+        self.chunks = []
+        for m in self.maps:
+            m.close()
+        self.maps = []
+
+
+def build_image(mod, layout=None, base=0):
+    "Build (linked) Image of Data items of module."
+    img = Image(layout, base)
+    img.add_module(mod)
+    img.link()
+    return img
+
+
+def __main__():
+    import argparse
+    from .ir import DataLayout
+    from . import parser
+
+    argp = argparse.ArgumentParser(description="Write binary image of PseudoC module data")
+    argp.add_argument("file")
+    argp.add_argument("-o", "--out", help="write image to file")
+    argp.add_argument("--base", type=lambda s: int(s, 0), default=0, help="address of image (default: %(default)s)")
+    argp.add_argument("--ptr-size", type=int, default=DEFAULT_LAYOUT.ptr_size)
+    argp.add_argument("--big-endian", action="store_true")
+    argp.add_argument("--blob", action="append", default=[], metavar="NAME=PATH",
+        help="add contents of file PATH as symbol NAME")
+    args = argp.parse_args()
+
+    layout = DataLayout(args.ptr_size, byteorder="big" if args.big_endian else "little")
+    with open(args.file) as f:
+        # Data content can be packed while parsing only for default layout.
+        pack = (layout.ptr_size, layout.byteorder) == (DEFAULT_LAYOUT.ptr_size, DEFAULT_LAYOUT.byteorder)
+        mod = parser.Parser(pack_data=pack).parse(f)
+    img = Image(layout, args.base)
+    for b in args.blob:
+        name, path = b.split("=", 1)
+        img.add_blob(name, path)
+    img.add_module(mod)
+    img.link()
+
+    for name, off in sorted(img.symbols.items(), key=lambda x: x[1]):
+        print("%08x %s" % (args.base + off, name))
+    for off, typ, sym in img.relocs:
+        print("unresolved: %08x (%s)%s" % (args.base + off, typ, sym))
+    if args.out:
+        with open(args.out, "wb") as f:
+            img.write(f)
+    img.close()
+
+
+if __name__ == "__main__":
+    __main__()
@@ -0,0 +1,210 @@
+# PseudoC-IR - Simple Program Analysis/Compiler Intermediate Representation
+#
+# Copyright (c) 2020-2021 Paul Sokolovsky
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# Incremental parsing: re-parse only top-level items which changed since
+# the previous parse (python -m pseudoc.incremental file.v1 file.v2 ...).
+#
+# Source is split into chunks at top-level item boundaries: a function is
+# a chunk from its header line (ending with "{") up to the closing "}"
+# line, every other non-empty, non-comment top-level line (data, struct)
+# is a chunk of its own. Splitting is done with regexes over the whole
+# source, and chunks are looked up by their text in a dict of previous
+# parse results, so unchanged items cost little more than hashing.
+#
+# Items of changed chunks are parsed with a Parser sharing the type
+# table with previous parses, so StructType objects (which are
+# referenced by identity from parsed functions) stay the same; definitions
+# of structs whose chunks changed or were removed are reset before
+# parsing, so they can be redefined (updating reused functions too), and
+# their memoized layouts are dropped.
+#
+# Auto-labels (_lN) are numbered across functions of a module. When a
+# reused function's numbering start changed (e.g. an edit above it split
+# a block), its auto-labeled blocks are just renamed, unless the function
+# itself uses labels which look like auto-labels (then it's re-parsed, as
+# numbering may affect which blocks such labels refer to).
+#
+# Items returned are shared between results of consecutive parses, so
+# passes which modify them should be applied to copies.
+
+import re
+import sys
+
+from .ir import Func, Module, StructType, TypeTable
+from .parser import Parser
+from . import fold
+
+
+# Closing line of a function (with preceding newline).
+_FUNC_END = re.compile(r"\n[ \t]*\}[^\n]*")
+# Function header (any non-comment top-level line ending with "{").
+_FUNC_START = re.compile(r"^[ \t]*[^#\s].*\{[ \t\r]*$", re.M)
+_AUTO_LABEL_LIKE = re.compile(r"\b_l\d")
+
+
+def _split_lines(src, start, end, out):
+    if start >= end or src[start:end].isspace():
+        return
+    for l in src[start:end].split("\n"):
+        s = l.strip()
+        if s and not s.startswith("#"):
+            out.append((start, l))
+        start += len(l) + 1
+
+
+def split_items(src):
+    """Split source into list of top-level item chunks, as (offset, text).
+    Line number of a chunk is counted only when it's needed (for parsing)."""
+    res = []
+    pos = 0
+    for m in _FUNC_END.finditer(src):
+        h = _FUNC_START.search(src, pos, m.start() + 1)
+        if h is None:
+            # Stray "}", leave it to parser to report.
+            continue
+        _split_lines(src, pos, h.start(), res)
+        end = m.end()
+        res.append((h.start(), src[h.start():end]))
+        pos = end
+    _split_lines(src, pos, len(src), res)
+    return res
+
+
+class _Entry:
+    "Parse result of a chunk."
+
+    def __init__(self, items, label_base, num_labels, sensitive):
+        self.items = items
+        self.label_base = label_base
+        self.num_labels = num_labels
+        # Whether result depends on label_base.
+        self.sensitive = sensitive
+        self.auto_blocks = []
+        if num_labels and not sensitive:
+            labels = {"_l%d" % i for i in range(label_base, label_base + num_labels)}
+            for item in items:
+                if isinstance(item, Func):
+                    self.auto_blocks.extend([bb for bb in item.bblocks if bb.label in labels])
+
+    def relabel(self, label_base):
+        for i, bb in enumerate(self.auto_blocks):
+            bb.label = "_l%d" % (label_base + i)
+        self.label_base = label_base
+
+
+class IncrementalParser:
+    """Parser which can be given successive versions of the same source,
+    and parses only items changed since the previous version. After each
+    parse(), .reused and .parsed are the numbers of chunks reused and
+    (re)parsed."""
+
+    def __init__(self, split_bb_after_call=None):
+        self.split_bb_after_call = split_bb_after_call
+        self.types = TypeTable()
+        # chunk text -> list of _Entry (the same text may occur several
+        # times, each occurrence gets its own items).
+        self.cache = {}
+        self.reused = 0
+        self.parsed = 0
+
+    def parse(self, src):
+        "Parse source string src, returning Module."
+        old = self.cache
+        plan = []
+        for offset, text in split_items(src):
+            entries = old.get(text)
+            plan.append((offset, text, entries.pop() if entries else None))
+
+        # Whatever is left in old cache is changed or removed.
+        reset = []
+        for entries in old.values():
+            for e in entries:
+                for item in e.items:
+                    if isinstance(item, StructType):
+                        item.fields = None
+                        reset.append(item)
+        if reset:
+            fold.forget_types(reset)
+
+        parser = Parser(self.types, self.split_bb_after_call)
+        mod = Module(self.types)
+        cache = {}
+        self.reused = self.parsed = 0
+        # Line number at offset, counted from the last parsed chunk.
+        offset0 = 0
+        lineno = 1
+        try:
+            for offset, text, entry in plan:
+                base = parser.label_cnt
+                if entry is not None and entry.label_base != base:
+                    if entry.sensitive:
+                        entry = None
+                    else:
+                        entry.relabel(base)
+                if entry is None:
+                    lineno += src.count("\n", offset0, offset)
+                    offset0 = offset
+                    items = list(parser.parse_iter(text.split("\n"), lineno))
+                    num = parser.label_cnt - base
+                    sensitive = num > 0 and _AUTO_LABEL_LIKE.search(text) is not None
+                    entry = _Entry(items, base, num, sensitive)
+                    self.parsed += 1
+                else:
+                    parser.label_cnt = base + entry.num_labels
+                    self.reused += 1
+                entries = cache.get(text)
+                if entries is None:
+                    entries = cache[text] = []
+                entries.append(entry)
+                for item in entry.items:
+                    mod.add(item)
+        except Exception:
+            # State may be inconsistent now, start from scratch next time.
+            self.cache = {}
+            self.types = TypeTable()
+            raise
+        self.cache = cache
+        return mod
+
+
+def __main__():
+    import time
+
+    if len(sys.argv) < 2:
+        print("Usage: %s file.v1 [file.v2...]" % sys.argv[0])
+        sys.exit(1)
+    p = IncrementalParser()
+    for fname in sys.argv[1:]:
+        with open(fname) as f:
+            src = f.read()
+        t = time.perf_counter()
+        mod = p.parse(src)
+        t = time.perf_counter() - t
+        print("%s: %d reused, %d parsed, %.1f ms" % (fname, p.reused, p.parsed, t * 1000), file=sys.stderr)
+    mod.dump(bb_ann=False, expl_goto=True)
+
+
+if __name__ == "__main__":
+    __main__()
@@ -0,0 +1,731 @@
+# PseudoC-IR - Simple Program Analysis/Compiler Intermediate Representation
+#
+# Copyright (c) 2020-2021 Paul Sokolovsky
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# Interpreter of PseudoC modules, e.g. to test results of lowering passes
+# (python -m pseudoc.interp file.pseudoc [func [args...]]).
+#
+# Before running, each function is pre-decoded: local variables get slots
+# in a frame list, and each instruction becomes a specialised Python
+# closure operating on the frame, so op strings and arg kinds aren't
+# re-checked on every step. Constants (including addresses of symbols)
+# are stored in extra frame slots, so each operand is just a slot index.
+# A decoded block is a list [steps, terminator, number of insns], where
+# terminator returns the next decoded block (None on return). In SSA form,
+# copies for phis are done on edges, by separate decoded blocks. With
+# jit=True, functions are instead compiled to Python (see pseudoc.pycodegen).
+#
+# Values are stored by register if allocated (Insn.reg), otherwise, in
+# SSA form, by defining insn (Arg.defi), and by variable name only in
+# non-SSA form. So values sharing a register while both are live, or uses
+# linked to wrong definitions, give wrong results.
+#
+# Values are Python ints, wrapped to the type of destination (untyped
+# values are of the pointer-sized signed type). Memory is a bytearray,
+# holding Data items, string literals and a stack for @alloca and
+# Func.stack_slots (freed on function return). Functions get addresses
+# outside of the memory, so they can be called indirectly. Calls to
+# functions not defined in the module go to "externs" (Python callables,
+# taking Interp as 1st arg).
+
+import sys
+import struct
+import operator
+
+from .ir import Func, Data, InlineStr, SpecFunc, PrimType, PtrType, DEFAULT_LAYOUT
+from .parser import TYPE_SIZES, unescape
+
+
+class InterpError(Exception):
+    pass
+
+
+PTR_SIZE = TYPE_SIZES["void*"]
+WORD_TYPE = "i%d" % (PTR_SIZE * 8)
+# Address 0 is null, so memory starts with a few unused bytes.
+MEM_START = 16
+FUNC_BASE = 0x7f000000
+
+
+def _make_wrap(bits, signed):
+    mask = (1 << bits) - 1
+    if signed:
+        half = 1 << (bits - 1)
+
+        def wrap(v):
+            return ((v + half) & mask) - half
+    else:
+        def wrap(v):
+            return v & mask
+    return wrap
+
+
+# prim type name -> (struct format, wrap function)
+PRIMS = {}
+for _n, _fmt in (("i8", "b"), ("i16", "h"), ("i32", "i"), ("i64", "q")):
+    _bits = TYPE_SIZES[_n] * 8
+    PRIMS[_n] = ("<" + _fmt, _make_wrap(_bits, True))
+    PRIMS["u" + _n[1:]] = ("<" + _fmt.upper(), _make_wrap(_bits, False))
+PRIMS["i1"] = ("<B", _make_wrap(1, False))
+PRIMS["void*"] = PRIMS["u" + WORD_TYPE[1:]]
+
+
+def _div(x, y):
+    if y == 0:
+        raise InterpError("division by zero")
+    q = abs(x) // abs(y)
+    return q if (x < 0) == (y < 0) else -q
+
+
+def _mod(x, y):
+    return x - _div(x, y) * y
+
+
+BIN_OPS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": _div,
+    "%": _mod,
+    "&": operator.and_,
+    "|": operator.or_,
+    "^": operator.xor,
+    "<<": lambda x, y: x << (y & 63),
+    ">>": lambda x, y: x >> (y & 63),
+}
+
+# Comparisons produce 0/1 values, so don't need wrapping.
+CMP_OPS = {
+    "==": lambda x, y: 1 if x == y else 0,
+    "!=": lambda x, y: 1 if x != y else 0,
+    "<": lambda x, y: 1 if x < y else 0,
+    ">": lambda x, y: 1 if x > y else 0,
+    "<=": lambda x, y: 1 if x <= y else 0,
+    ">=": lambda x, y: 1 if x >= y else 0,
+}
+
+# Conditions of "if" don't need 0/1 values.
+COND_OPS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    ">": operator.gt,
+    "<=": operator.le,
+    ">=": operator.ge,
+}
+
+UNARY_OPS = {
+    "-": operator.neg,
+    "~": operator.invert,
+    "!": lambda x: 0 if x else 1,
+}
+
+
+def dest_key(insn, is_ssa):
+    "Key of storage of value defined by insn."
+    if insn.reg:
+        return insn.reg
+    if is_ssa:
+        return insn
+    return insn.dest
+
+
+def arg_key(arg, is_ssa):
+    "Key of storage of (variable) value used by arg."
+    if arg.defi is not None:
+        return dest_key(arg.defi, is_ssa)
+    if arg.reg:
+        return arg.reg
+    return arg.val
+
+
+def _prim_name(typ):
+    "Name of prim type to access value of type typ (None is untyped)."
+    if typ is None:
+        return WORD_TYPE
+    if isinstance(typ, PrimType):
+        return typ.typ
+    if isinstance(typ, PtrType):
+        return "void*"
+    raise InterpError("not a scalar type: %s" % typ)
+
+
+# Step (non-terminator insn) makers. Each gets decoded slot indexes and
+# returns closure taking frame list.
+
+def _step_move(d, a):
+    def step(r):
+        r[d] = r[a]
+    return step
+
+
+def _step_wrap(w, d, a):
+    def step(r):
+        r[d] = w(r[a])
+    return step
+
+
+def _step_unary(f, w, d, a):
+    def step(r):
+        r[d] = w(f(r[a]))
+    return step
+
+
+def _step_binary(f, d, a, b):
+    def step(r):
+        r[d] = f(r[a], r[b])
+    return step
+
+
+def _step_binary_wrap(f, w, d, a, b):
+    def step(r):
+        r[d] = w(f(r[a], r[b]))
+    return step
+
+
+def _bad_addr(addr):
+    return InterpError("invalid memory access at 0x%x" % addr)
+
+
+def _step_load(mem, fmt, w, d, a):
+    unpack = struct.Struct(fmt).unpack_from
+
+    def step(r):
+        addr = r[a]
+        if addr < MEM_START:
+            raise _bad_addr(addr)
+        try:
+            r[d] = w(unpack(mem, addr)[0])
+        except struct.error:
+            raise _bad_addr(addr)
+    return step
+
+
+def _step_store(mem, fmt, w, a, v):
+    pack = struct.Struct(fmt).pack_into
+
+    def step(r):
+        addr = r[a]
+        if addr < MEM_START:
+            raise _bad_addr(addr)
+        try:
+            pack(mem, addr, w(r[v]))
+        except struct.error:
+            raise _bad_addr(addr)
+    return step
+
+
+def _step_alloca(mem, d, a):
+    def step(r):
+        addr = len(mem)
+        mem.extend(bytes((r[a] + PTR_SIZE - 1) & -PTR_SIZE))
+        r[d] = addr
+    return step
+
+
+def _step_call(interp, d, f, args):
+    call = interp.call_addr
+
+    def step(r):
+        res = call(r[f], [r[a] for a in args])
+        if d is not None:
+            r[d] = res
+    return step
+
+
+def _step_call_direct(interp, d, code, args):
+    run = interp._run
+
+    def step(r):
+        res = run(code, [r[a] for a in args])
+        if d is not None:
+            r[d] = res
+    return step
+
+
+def _step_error(msg):
+    def step(r):
+        raise InterpError(msg)
+    return step
+
+
+def _parallel_copy(dests, srcs):
+    if len(dests) == 1:
+        return _step_move(dests[0], srcs[0])
+    moves = list(zip(dests, srcs))
+
+    def step(r):
+        vals = [r[s] for d, s in moves]
+        for (d, s), v in zip(moves, vals):
+            r[d] = v
+    return step
+
+
+# Terminator makers.
+
+def _term_goto(target):
+    def term(r):
+        return target
+    return term
+
+
+def _term_if(a, t, f):
+    def term(r):
+        return t if r[a] else f
+    return term
+
+
+def _term_if_cmp(op, a, b, t, f):
+    def term(r):
+        return t if op(r[a], r[b]) else f
+    return term
+
+
+def _term_return(a):
+    def term(r):
+        r[0] = r[a]
+    return term
+
+
+def _term_return_void(r):
+    r[0] = None
+
+
+class FuncCode:
+    "Pre-decoded function."
+
+    def __init__(self, func):
+        self.func = func
+        # Initial frame: slot 0 is for return value, then variables, then
+        # constants.
+        self.frame = [None]
+        self.slots = {}
+        self.consts = {}
+        self.param_slots = []
+        # Compiled Python function (with Interp(jit=True)).
+        self.pyfunc = None
+        # Slots holding addresses of Func.stack_slots.
+        self.scratch = []
+        self.entry = None
+
+
+class Interp:
+
+    def __init__(self, mod, externs=None, count_insns=False, jit=False, layout=None):
+        self.mod = mod
+        self.externs = dict(DEFAULT_EXTERNS)
+        if externs:
+            self.externs.update(externs)
+        self.count_insns = count_insns
+        # Number of insns executed, if count_insns.
+        self.insn_count = 0
+        self.mem = bytearray(MEM_START)
+        # symbol name -> address
+        self.symbols = {}
+        self.funcs = []
+        self.code = {}
+        self.strs = {}
+        # Layout of types in memory, by default the same as used by the
+        # parser for data and by pseudoc.fold.sizeof.
+        self.layout = layout or DEFAULT_LAYOUT
+        if self.layout.ptr_size != PTR_SIZE:
+            raise ValueError("unsupported pointer size: %d" % self.layout.ptr_size)
+
+        for item in mod.contents:
+            if isinstance(item, Func):
+                self.symbols[item.name] = FUNC_BASE + len(self.funcs)
+                self.funcs.append(item)
+        datas = [item for item in mod.contents if isinstance(item, Data)]
+        for data in datas:
+            self.symbols[data.name] = self.alloc(data.size)
+        for data in datas:
+            self.init_data(data)
+        # Decoding resolves all symbols, so it's done eagerly, before
+        # anything is allocated on the stack.
+        if count_insns:
+            if jit:
+                raise ValueError("count_insns is not supported with jit")
+            self._run = self._run_counting
+        for func in self.funcs:
+            self.code[func.name] = FuncCode(func)
+        if jit:
+            # Functions are compiled to Python, see pseudoc.pycodegen.
+            from . import pycodegen
+            pycodegen.jit_module(self)
+        else:
+            for code in self.code.values():
+                self.decode(code)
+
+    def alloc(self, size):
+        addr = len(self.mem)
+        self.mem.extend(bytes((size + PTR_SIZE - 1) & -PTR_SIZE))
+        return addr
+
+    def extern_addr(self, name):
+        addr = self.symbols.get(name)
+        if addr is None:
+            addr = self.symbols[name] = FUNC_BASE + len(self.funcs)
+            self.funcs.append(name)
+        return addr
+
+    def symbol_addr(self, name):
+        addr = self.symbols.get(name)
+        if addr is None:
+            if name in self.externs:
+                return self.extern_addr(name)
+            raise InterpError("undefined symbol: %s" % name)
+        return addr
+
+    def scratch_symbols(self, func):
+        "Symbols used in func which are stack slots."
+        return tuple(func.stack_slots)
+
+    def callee(self, name):
+        "Python callable to call function name (with args as positional args)."
+        code = self.code.get(name)
+        if code is not None:
+            if code.pyfunc is not None:
+                return code.pyfunc
+            return lambda *args: self._run(code, list(args))
+        addr = self.extern_addr(name)
+        return lambda *args: self.call_addr(addr, list(args))
+
+    def str_addr(self, s):
+        "Address of (NUL-terminated) string literal s (InlineStr)."
+        addr = self.strs.get(s.s)
+        if addr is None:
+            # Same escapes as in data initializers.
+            try:
+                b = unescape(s.s.encode()) + b"\0"
+            except (KeyError, ValueError):
+                raise InterpError("unsupported escape in string: \"%s\"" % s.s)
+            addr = self.strs[s.s] = self.alloc(len(b))
+            self.mem[addr:addr + len(b)] = b
+        return addr
+
+    def type_size(self, typ):
+        try:
+            return self.layout.size(typ)
+        except ValueError as e:
+            raise InterpError(str(e))
+
+    def const_val(self, val):
+        "Value of a non-variable operand."
+        if isinstance(val, int):
+            return val
+        if isinstance(val, InlineStr):
+            return self.str_addr(val)
+        if isinstance(val, SpecFunc):
+            if val.op == "@sizeof":
+                return self.type_size(val.args[0].val)
+            raise InterpError("unsupported special function: %s" % val.op)
+        if val == "@undef":
+            return 0
+        return self.symbol_addr(val)
+
+    def init_data(self, data):
+        addr = self.symbols[data.name]
+        if data.desc is None:
+            self.mem[addr:addr + len(data.content)] = data.content
+            for off, typ, val in data.relocs:
+                fmt, w = PRIMS[typ]
+                struct.pack_into(fmt, self.mem, addr + off, w(self.const_val(val)))
+            return
+        for el in data.desc:
+            if el[0] == "str":
+                b = el[2]
+            else:
+                fmt, w = PRIMS[el[0]]
+                b = struct.pack(fmt, w(self.const_val(el[1].val)))
+            self.mem[addr:addr + len(b)] = b
+            addr += len(b)
+
+    def var_slot(self, code, key):
+        "Frame slot of a local value, by its key (see dest_key())."
+        s = code.slots.get(key)
+        if s is None:
+            s = code.slots[key] = len(code.frame)
+            code.frame.append(0)
+            if key in code.func.stack_slots:
+                code.scratch.append(s)
+        return s
+
+    def dest_slot(self, code, insn):
+        return self.var_slot(code, dest_key(insn, code.func.is_ssa))
+
+    def arg_slot(self, code, arg):
+        "Frame slot of operand arg (a variable or a constant)."
+        val = arg.val
+        if arg.defi is not None or arg.reg or isinstance(val, str) and val.startswith("$"):
+            return self.var_slot(code, arg_key(arg, code.func.is_ssa))
+        return self.slot(code, val)
+
+    def slot(self, code, val):
+        "Frame slot of variable (by name) or constant val."
+        if isinstance(val, str) and (val.startswith("$") or val in code.func.stack_slots):
+            return self.var_slot(code, val)
+        v = self.const_val(val)
+        s = code.consts.get(v)
+        if s is None:
+            s = code.consts[v] = len(code.frame)
+            code.frame.append(v)
+        return s
+
+    def decode(self, code):
+        func = code.func
+        code.param_slots = [self.slot(code, p) for p in func.params]
+        if not func.bblocks:
+            code.entry = [[], _term_return_void, 0]
+            return
+        blocks = {bb: [None, None, 0] for bb in func.bblocks}
+        for bb in func.bblocks:
+            blk = blocks[bb]
+            steps = []
+            term = None
+            n = 0
+            for insn in bb.insns:
+                if insn.op == "@phi":
+                    continue
+                n += 1
+                if insn.op in ("if", "return"):
+                    term = insn
+                else:
+                    step = self.decode_insn(code, insn)
+                    if step is not None:
+                        steps.append(step)
+            targets = [self.edge(code, blocks, bb, s) for s in bb.succs]
+            blk[0] = steps
+            blk[1] = self.decode_term(code, term, targets)
+            blk[2] = n
+        code.entry = blocks[func.bblocks[0]]
+
+    def edge(self, code, blocks, pred, succ):
+        "Decoded block to go to from pred to succ (doing phi copies)."
+        target = blocks[succ]
+        idx = succ.preds.index(pred)
+        dests = []
+        srcs = []
+        for insn in succ.insns:
+            if insn.op != "@phi":
+                continue
+            dests.append(self.dest_slot(code, insn))
+            srcs.append(self.arg_slot(code, insn.args[idx]))
+        if not dests:
+            return target
+        return [[_parallel_copy(dests, srcs)], _term_goto(target), 0]
+
+    def decode_term(self, code, insn, targets):
+        if insn is None:
+            if not targets:
+                # Falling off the end of function.
+                return _term_return_void
+            return _term_goto(targets[0])
+        if insn.op == "return":
+            if insn.args:
+                return _term_return(self.arg_slot(code, insn.args[0]))
+            return _term_return_void
+        args = insn.args
+        if len(targets) == 1:
+            targets = targets * 2
+        t, f = targets
+        a = self.arg_slot(code, args[0])
+        if len(args) == 1:
+            return _term_if(a, t, f)
+        op = COND_OPS.get(args[1].val)
+        if op is None:
+            op = BIN_OPS.get(args[1].val)
+        if op is None:
+            raise InterpError("unsupported condition op: %s" % args[1].val)
+        return _term_if_cmp(op, a, self.arg_slot(code, args[2]), t, f)
+
+    def decode_insn(self, code, insn):
+        op = insn.op
+        args = insn.args
+        if op == "@nop":
+            return None
+        d = None
+        if insn.dest:
+            d = self.dest_slot(code, insn)
+        try:
+            wrap = PRIMS[_prim_name(insn.typ)][1]
+            if op == "=":
+                if insn.typ is None:
+                    return _step_move(d, self.arg_slot(code, args[0]))
+                return _step_wrap(wrap, d, self.arg_slot(code, args[0]))
+            if op == "@param":
+                return _step_move(d, code.param_slots[args[0].val])
+            if op == "call":
+                name = args[0].val
+                arg_slots = [self.arg_slot(code, a) for a in args[1:]]
+                if name in self.code:
+                    return _step_call_direct(self, d, self.code[name], arg_slots)
+                if isinstance(name, str) and not name.startswith("$"):
+                    f = self.slot(code, self.extern_addr(name))
+                else:
+                    f = self.arg_slot(code, args[0])
+                return _step_call(self, d, f, arg_slots)
+            if op == "@load":
+                fmt, w = PRIMS[_prim_name(args[1].val)]
+                return _step_load(self.mem, fmt, w, d, self.arg_slot(code, args[0]))
+            if op == "@store":
+                fmt, w = PRIMS[_prim_name(args[1].val)]
+                return _step_store(self.mem, fmt, w, self.arg_slot(code, args[0]), self.arg_slot(code, args[2]))
+            if op == "@cast":
+                w = PRIMS[_prim_name(args[0].val)][1]
+                return _step_wrap(w, d, self.arg_slot(code, args[1]))
+            if op == "@alloca":
+                return _step_alloca(self.mem, d, self.arg_slot(code, args[0]))
+            if len(args) == 1 and op in UNARY_OPS:
+                return _step_unary(UNARY_OPS[op], wrap, d, self.arg_slot(code, args[0]))
+            if len(args) == 2:
+                a = self.arg_slot(code, args[0])
+                b = self.arg_slot(code, args[1])
+                if op in CMP_OPS:
+                    return _step_binary(CMP_OPS[op], d, a, b)
+                if op in BIN_OPS:
+                    return _step_binary_wrap(BIN_OPS[op], wrap, d, a, b)
+        except InterpError as e:
+            # Report errors when (if) the insn is executed.
+            return _step_error("%s: %s" % (func_insn_str(code, insn), e))
+        return _step_error("%s: unsupported insn" % func_insn_str(code, insn))
+
+    def _run(self, code, args):
+        r = code.frame[:]
+        for s, v in zip(code.param_slots, args):
+            r[s] = v
+        sp = len(self.mem)
+        for s in code.scratch:
+            r[s] = self.alloc(PTR_SIZE)
+        blk = code.entry
+        while blk is not None:
+            for step in blk[0]:
+                step(r)
+            blk = blk[1](r)
+        del self.mem[sp:]
+        return r[0]
+
+    def _run_counting(self, code, args):
+        r = code.frame[:]
+        for s, v in zip(code.param_slots, args):
+            r[s] = v
+        sp = len(self.mem)
+        for s in code.scratch:
+            r[s] = self.alloc(PTR_SIZE)
+        blk = code.entry
+        while blk is not None:
+            self.insn_count += blk[2]
+            for step in blk[0]:
+                step(r)
+            blk = blk[1](r)
+        del self.mem[sp:]
+        return r[0]
+
+    def call_addr(self, addr, args):
+        f = None
+        if FUNC_BASE <= addr < FUNC_BASE + len(self.funcs):
+            f = self.funcs[addr - FUNC_BASE]
+        if isinstance(f, Func):
+            code = self.code[f.name]
+            if code.pyfunc is not None:
+                return code.pyfunc(*args)
+            return self._run(code, args)
+        if f is None:
+            raise InterpError("call to non-function address: 0x%x" % addr)
+        ext = self.externs.get(f)
+        if ext is None:
+            raise InterpError("call to undefined function: %s" % f)
+        return ext(self, *args)
+
+    def call(self, name, *args):
+        "Call function by name, return its result (None for void)."
+        code = self.code.get(name)
+        if code is None:
+            return self.call_addr(self.symbol_addr(name), list(args))
+        if code.pyfunc is not None:
+            return code.pyfunc(*args)
+        return self._run(code, list(args))
+
+    def read_str(self, addr):
+        end = self.mem.index(0, addr)
+        return bytes(self.mem[addr:end])
+
+
+def func_insn_str(code, insn):
+    return "%s: %s" % (code.func.name, insn.format_insn())
+
+
+def _putchar(interp, c):
+    sys.stdout.write(chr(c & 0xff))
+    return c
+
+
+def _puts(interp, s):
+    sys.stdout.write(interp.read_str(s).decode("latin-1") + "\n")
+    return 0
+
+
+DEFAULT_EXTERNS = {
+    "putchar": _putchar,
+    "puts": _puts,
+}
+
+
+def __main__():
+    import argparse
+    from . import parser
+
+    argp = argparse.ArgumentParser(description="Run PseudoC program")
+    argp.add_argument("file")
+    argp.add_argument("func", nargs="?", default="main", help="function to call (default: %(default)s)")
+    argp.add_argument("args", nargs="*", type=lambda s: int(s, 0), help="integer args to pass")
+    argp.add_argument("-x", "--xforms", default=[], action="append",
+        help="transformation(s) to apply before running, as for pseudoc_tool")
+    argp.add_argument("--count", action="store_true", help="report number of insns executed (to stderr)")
+    argp.add_argument("--jit", action="store_true", help="compile functions to Python code (see pseudoc.pycodegen)")
+    args = argp.parse_args()
+
+    with open(args.file) as f:
+        mod = parser.parse(f)
+    if args.xforms:
+        import pseudoc_tool
+        passes_list = []
+        for x in args.xforms:
+            pseudoc_tool.parse_passes_spec(x, passes_list)
+        for item in mod.contents:
+            for pass_func, pass_params in passes_list:
+                pseudoc_tool.run_pass(item, pass_func, pass_params)
+    try:
+        interp = Interp(mod, count_insns=args.count, jit=args.jit)
+        res = interp.call(args.func, *args.args)
+    except InterpError as e:
+        print("error: %s" % e, file=sys.stderr)
+        sys.exit(1)
+    sys.stdout.flush()
+    print("return: %s" % res)
+    if args.count:
+        print("insns: %d" % interp.insn_count, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    __main__()
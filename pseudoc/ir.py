@@ -25,13 +25,22 @@
 import logging
 
 from . import dumper
+from . import analysis
 
 
 _log = logging.getLogger(__name__)
 
 
+# Classes which may have many instances in a large program use __slots__
+# to save memory. "__dict__" is still included in slots, so passes can
+# attach ad hoc attributes to objects (instance dict is then created on
+# first such assignment).
+
+
 class InlineStr:
 
+    __slots__ = ("s", "__dict__")
+
     def __init__(self, s):
         self.s = s
 
@@ -41,10 +50,31 @@ class InlineStr:
 
 class Arg:
 
+    __slots__ = ("val", "reg", "_defi", "__dict__")
+
     def __init__(self, val):
         self.val = val
         self.reg = None
-        self.defi = None
+        self._defi = None
+
+    # Defining Insn of the value (in SSA form). Setting it maintains use
+    # list of the Insn (see Insn.uses).
+    @property
+    def defi(self):
+        return self._defi
+
+    @defi.setter
+    def defi(self, insn):
+        old = self._defi
+        if old is insn:
+            return
+        if old is not None:
+            del old._uses[self]
+        if insn is not None:
+            if insn._uses is None:
+                insn._uses = {}
+            insn._uses[self] = None
+        self._defi = insn
 
     def __repr__(self):
         return "<Arg '%s'>" % self.__str__()
@@ -58,6 +88,8 @@ class SpecFunc:
     into a constant), but actual interpretation/processing depends on passes
     applied. Internal layout mirrors subset of Insn."""
 
+    __slots__ = ("op", "args", "__dict__")
+
     def __init__(self, op, *args):
         self.op = op
         self.args = [val if isinstance(val, Arg) else Arg(val) for val in args]
@@ -68,15 +100,47 @@ class SpecFunc:
 
 class Insn:
 
+    __slots__ = ("id", "typ", "dest", "op", "args", "reg", "_uses", "__dict__")
+
     def __init__(self, dest, op, *args, type=None):
         self.id = None
         # Data type of dest ("u32", etc.)
         self.typ = type
         self.dest = dest
         self.op = op
-        self.args = [Arg(val) for val in args]
+        self.args = [val if isinstance(val, Arg) else Arg(val) for val in args]
         # Assigned register
         self.reg = None
+        # Args which have this insn as defi, as dict keys (an ordered
+        # set). Allocated on first use, as most insns have few uses.
+        self._uses = None
+
+    @property
+    def uses(self):
+        "Args using value defined by this insn."
+        if not self._uses:
+            return ()
+        return self._uses.keys()
+
+    def has_uses(self):
+        return bool(self._uses)
+
+    def replace_all_uses_with(self, new):
+        """Make all uses of this insn use new instead. new is either another
+        Insn, or a plain value (e.g. constant)."""
+        if not self._uses:
+            return
+        for a in list(self._uses):
+            if isinstance(new, Insn):
+                a.defi = new
+            else:
+                a.defi = None
+                a.val = new
+
+    def drop_args(self):
+        "Remove this insn's args from use lists of their defining insns."
+        for a in self.args:
+            a.defi = None
 
     def __repr__(self):
         return "<Insn @%s>" % self.dest_name()
@@ -89,6 +153,8 @@ class Insn:
 
 class BBlock:
 
+    __slots__ = ("label", "insns", "preds", "succs", "seen", "__dict__")
+
     def __init__(self, label, insns=None):
         self.label = label
         if insns is None:
@@ -102,6 +168,47 @@ class BBlock:
     def __repr__(self):
         return "<BBlock %s>" % self.label
 
+    # CFG edges are pickled by the owning Func (as block indexes), as
+    # following them recursively would overflow the stack on large CFGs.
+    def __getstate__(self):
+        slots = {k: getattr(self, k) for k in self.__slots__[:-1]}
+        slots["preds"] = slots["succs"] = None
+        return (self.__dict__ or None, slots)
+
+    # Finding an insn in the block is O(block size), so methods below take
+    # its index, if known to the caller. To remove many insns, use
+    # erase_all(), which does it in one pass.
+
+    def erase(self, insn, idx=None):
+        "Remove insn, which must not have uses left, from this block."
+        assert not insn.has_uses(), insn
+        if idx is None:
+            idx = self.insns.index(insn)
+        assert self.insns[idx] is insn
+        del self.insns[idx]
+        insn.drop_args()
+
+    def erase_all(self, insns):
+        """Remove set of insns from this block. They must not have uses
+        left, other than by each other."""
+        for insn in insns:
+            insn.drop_args()
+        for insn in insns:
+            assert not insn.has_uses(), insn
+        self.insns = [i for i in self.insns if i not in insns]
+
+    def insert_before(self, insn, new, idx=None):
+        if idx is None:
+            idx = self.insns.index(insn)
+        assert self.insns[idx] is insn
+        self.insns.insert(idx, new)
+
+    def insert_after(self, insn, new, idx=None):
+        if idx is None:
+            idx = self.insns.index(insn)
+        assert self.insns[idx] is insn
+        self.insns.insert(idx + 1, new)
+
     dump_insns = dumper.dump_bb_insns
     dump = dumper.dump_bb
 
@@ -116,23 +223,57 @@ class Func:
         self.bblocks = []
         # Whether function is in SSA form.
         self.is_ssa = False
+        # Names of symbols which are word-sized stack slots local to each
+        # call (e.g. register allocator spill slots).
+        self.stack_slots = []
+        # AnalysisManager, created on first use.
+        self.analyses = None
 
     def calc_preds(self):
         for bb in self.bblocks:
             for s in bb.succs:
                 s.preds.append(bb)
 
+    def analysis(self, name):
+        "Get (cached) result of an analysis, see pseudoc.analysis."
+        if self.analyses is None:
+            self.analyses = analysis.AnalysisManager(self)
+        return self.analyses.get(name)
+
+    def invalidate_analyses(self, preserved=None):
+        if self.analyses is not None:
+            self.analyses.invalidate(preserved)
+
     def __repr__(self):
         return "<Func %s %d bb>" % (self.name, len(self.bblocks))
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["analyses"] = None
+        idx = {bb: i for i, bb in enumerate(self.bblocks)}
+        state["_edges"] = [
+            ([idx[b] for b in bb.preds], [idx[b] for b in bb.succs]) for bb in self.bblocks
+        ]
+        return state
+
+    def __setstate__(self, state):
+        edges = state.pop("_edges")
+        self.__dict__.update(state)
+        bblocks = self.bblocks
+        for bb, (preds, succs) in zip(bblocks, edges):
+            bb.preds = [bblocks[i] for i in preds]
+            bb.succs = [bblocks[i] for i in succs]
+
     dump = dumper.dump_func
 
 
 class Type:
-    pass
+    __slots__ = ("__dict__",)
 
 
 class PrimType(Type):
+    __slots__ = ("typ",)
+
     def __init__(self, typ):
         self.typ = typ
 
@@ -141,6 +282,8 @@ class PrimType(Type):
 
 
 class PtrType(Type):
+    __slots__ = ("el_type",)
+
     def __init__(self, el_type):
         self.el_type = el_type
 
@@ -149,6 +292,8 @@ class PtrType(Type):
 
 
 class ArrType(Type):
+    __slots__ = ("el_type", "num")
+
     def __init__(self, el_type, num):
         self.el_type = el_type
         self.num = num
@@ -164,6 +309,8 @@ class ArrType(Type):
 
 
 class StructType(Type):
+    __slots__ = ("name", "fields")
+
     def __init__(self, name, fields):
         self.name = name
         self.fields = fields  # (name, type)
@@ -174,12 +321,258 @@ class StructType(Type):
     dump = dumper.dump_struct
 
 
+class TypeTable:
+    """Factory of type objects for a module. Types are interned, so
+    structurally equal types are the same object, and can be compared by
+    identity (and used as dict keys). Struct types are nominal, and are
+    looked up by name in .structs."""
+
+    def __init__(self, structs=None):
+        self.prims = {}
+        self.ptrs = {}
+        self.arrs = {}
+        if structs is None:
+            structs = {}
+        self.structs = structs
+
+    def prim(self, name):
+        t = self.prims.get(name)
+        if t is None:
+            t = self.prims[name] = PrimType(name)
+        return t
+
+    def ptr(self, el_type):
+        t = self.ptrs.get(el_type)
+        if t is None:
+            t = self.ptrs[el_type] = PtrType(el_type)
+        return t
+
+    def arr(self, el_type, num):
+        key = (el_type, num)
+        t = self.arrs.get(key)
+        if t is None:
+            t = self.arrs[key] = ArrType(el_type, num)
+        return t
+
+    def struct(self, name):
+        "Get struct type by name, creating one (with fields=None) if needed."
+        t = self.structs.get(name)
+        if t is None:
+            t = self.structs[name] = StructType(name, None)
+        return t
+
+
+# Sizes of primitive types (size of pointers is defined by DataLayout).
+PRIM_SIZES = {
+    "i1": 1,
+    "i8": 1,
+    "u8": 1,
+    "i16": 2,
+    "u16": 2,
+    "i32": 4,
+    "u32": 4,
+    "i64": 8,
+    "u64": 8,
+}
+
+
+class TypeLayout:
+    __slots__ = ("size", "align", "offsets")
+
+    def __init__(self, size, align, offsets=None):
+        self.size = size
+        self.align = align
+        # For structs, offsets of fields (in order of StructType.fields).
+        self.offsets = offsets
+
+    def __repr__(self):
+        return "<TypeLayout size=%d align=%d>" % (self.size, self.align)
+
+
+class DataLayout:
+    """Target data layout: computes size, alignment and field offsets of
+    types. Primitive types and pointers are naturally aligned (alignment
+    is equal to size), unless overridden in aligns (prim type name, or
+    "void*" for pointers, -> alignment). Struct fields are laid out in
+    order, each padded to its alignment, and struct size is padded to
+    the max alignment of its fields. With packed=True, all alignments
+    are 1. Values are stored in given byteorder ("little" or "big").
+
+    Layouts are memoized per type object (types are interned by
+    TypeTable, so that's once per distinct type). If max_cached is set,
+    the memo is dropped when it grows larger (for long-lived layouts, as
+    type objects of all parsed modules would be kept otherwise). Struct
+    layouts assume struct definitions don't change afterwards, call
+    forget() (or invalidate()) otherwise."""
+
+    def __init__(self, ptr_size=4, aligns=None, packed=False, byteorder="little", max_cached=None):
+        self.ptr_size = ptr_size
+        self.aligns = aligns or {}
+        self.packed = packed
+        self.byteorder = byteorder
+        self.max_cached = max_cached
+        self.cache = {}
+        # Structs being laid out, to detect them containing themselves.
+        self.busy = set()
+        # prim type name -> (size, mask, align), for pack_elem()
+        self.prims = {}
+
+    def invalidate(self):
+        self.cache.clear()
+
+    def forget(self, types):
+        """Drop memoized layouts of struct types (e.g. as they're redefined),
+        and of arrays and structs containing them."""
+        types = set(types)
+        # type -> whether it contains any of types
+        contains = {}
+
+        def check(typ):
+            while isinstance(typ, ArrType):
+                typ = typ.el_type
+            if not isinstance(typ, StructType):
+                return False
+            res = contains.get(typ)
+            if res is None:
+                contains[typ] = False
+                res = typ in types or any(check(t) for _, t in typ.fields or ())
+                contains[typ] = res
+            return res
+
+        for typ in [t for t in self.cache if check(t)]:
+            del self.cache[typ]
+
+    def prim_size(self, name):
+        "Size of prim type by name (as used in Data elements, incl. void*)."
+        if name == "void*":
+            return self.ptr_size
+        size = PRIM_SIZES.get(name)
+        if size is None:
+            raise ValueError("size of unsized type: %s" % name)
+        return size
+
+    def _align(self, name, size):
+        if self.packed:
+            return 1
+        return self.aligns.get(name, size)
+
+    def layout(self, typ):
+        "Get TypeLayout of typ."
+        res = self.cache.get(typ)
+        if res is not None:
+            return res
+        if typ in self.busy:
+            raise ValueError("recursive type: %s" % typ)
+        if isinstance(typ, PrimType):
+            size = self.prim_size(typ.typ)
+            res = TypeLayout(size, self._align(typ.typ, size))
+        elif isinstance(typ, PtrType):
+            res = TypeLayout(self.ptr_size, self._align("void*", self.ptr_size))
+        elif isinstance(typ, ArrType):
+            el = self.layout(typ.el_type)
+            res = TypeLayout(el.size * typ.num, el.align)
+        elif isinstance(typ, StructType):
+            res = self._struct_layout(typ)
+        else:
+            raise ValueError("unsupported type: %s" % typ)
+        if self.max_cached is not None and len(self.cache) >= self.max_cached:
+            self.cache.clear()
+        self.cache[typ] = res
+        return res
+
+    def _struct_layout(self, typ):
+        if typ.fields is None:
+            raise ValueError("size of incomplete type: %s" % typ)
+        self.busy.add(typ)
+        try:
+            offsets = []
+            offset = 0
+            align = 1
+            for name, fld_type in typ.fields:
+                fld = self.layout(fld_type)
+                offset = (offset + fld.align - 1) // fld.align * fld.align
+                offsets.append(offset)
+                offset += fld.size
+                align = max(align, fld.align)
+            size = (offset + align - 1) // align * align
+        finally:
+            self.busy.discard(typ)
+        return TypeLayout(size, align, offsets)
+
+    def size(self, typ):
+        return self.layout(typ).size
+
+    def align(self, typ):
+        return self.layout(typ).align
+
+    def field_offset(self, typ, name):
+        "Offset of field name in struct type typ."
+        for (fld_name, fld_type), offset in zip(typ.fields or (), self.layout(typ).offsets):
+            if fld_name == name:
+                return offset
+        raise ValueError("no field %s in %s" % (name, typ))
+
+    def pack_elem(self, buf, relocs, typ, val):
+        """Append Data element (typ)val to bytearray buf. If val isn't a
+        number (e.g. symbol), zeros are appended and reloc added. Returns
+        alignment of typ."""
+        info = self.prims.get(typ)
+        if info is None:
+            size = self.prim_size(typ)
+            info = self.prims[typ] = (size, (1 << (size * 8)) - 1, self._align(typ, size))
+        if type(val) is int:
+            buf += (val & info[1]).to_bytes(info[0], self.byteorder)
+        else:
+            relocs.append((len(buf), typ, val))
+            buf += bytes(info[0])
+        return info[2]
+
+    def pack_data(self, data):
+        """Return (content, relocs, align) for Data initializer, see Data.
+        Elements are laid out one after another, without padding (so size
+        of content is Data.size). Alignment is the max of elements', and
+        of Data.type (if set)."""
+        if data.content is not None:
+            # Content is packed by parser, with default layout.
+            if (self.ptr_size, self.byteorder) != (DEFAULT_LAYOUT.ptr_size, DEFAULT_LAYOUT.byteorder):
+                raise ValueError("content of %s is packed with different layout" % data.name)
+            return data.content, data.relocs, data.align
+        buf = bytearray()
+        relocs = []
+        align = 1
+        for el in data.desc:
+            typ = el[0]
+            if typ == "str":
+                buf += el[2]
+            else:
+                a = self.pack_elem(buf, relocs, typ, el[1].val)
+                if a > align:
+                    align = a
+        if data.type is not None:
+            align = max(align, self.align(data.type))
+        return buf, relocs, align
+
+
+# Max number of memoized type layouts in shared DataLayouts (which are used
+# for all modules parsed in a process, e.g. in pseudoc_server).
+MAX_CACHED_TYPES = 100000
+DEFAULT_LAYOUT = DataLayout(max_cached=MAX_CACHED_TYPES)
+
+
 class Data:
 
     def __init__(self, name, desc, type=None):
         self.name = name
+        # Initializer elements: ("str", literal, bytes) or (prim type
+        # name, Arg). None if initializer is held as content instead.
         self.desc = desc
         self.type = type
+        # Initializer as one contiguous bytes-like object, with relocs:
+        # list of (offset, prim type name, value) for elements whose
+        # value isn't a number (symbol address or InlineStr).
+        self.content = None
+        self.relocs = None
+        self.align = 1
 
     def __repr__(self):
         return "<Data %s>" % self.name
@@ -189,8 +582,11 @@ class Data:
 
 class Module:
 
-    def __init__(self):
+    def __init__(self, types=None):
         self.contents = []
+        if types is None:
+            types = TypeTable()
+        self.types = types
 
     def add(self, item):
         self.contents.append(item)
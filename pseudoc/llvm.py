@@ -0,0 +1,1216 @@
+# PseudoC-IR - Simple Program Analysis/Compiler Intermediate Representation
+#
+# Copyright (c) 2020-2021 Paul Sokolovsky
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# Importer of LLVM IR in textual form (.ll files) into PseudoC
+# (python -m pseudoc.llvm file.ll dumps result as PseudoC).
+#
+# Input is processed as a stream of lines: struct types and global
+# variables are converted as soon as their (single-line) definitions are
+# seen, and functions once their closing "}" is seen, with items yielded
+# one by one, as by parser.parse_iter(). So, memory use is bounded by the
+# largest function (plus struct types and names of globals), not by the
+# size of input. Declarations, metadata and attributes are skipped.
+#
+# Conversion of functions:
+#
+# - Basic blocks map to PseudoC blocks (with blocks split after calls,
+#   as by the parser, the new blocks being named like foo_1 after the
+#   original block foo). Unnamed values and labels get names like $0, _5.
+#   Labels never look like parser's auto-labels (_lN), so text output can
+#   be parsed back.
+# - Result is not in SSA form: phis are replaced with copies, via a
+#   temporary per phi ($x_phi = val at the end of each predecessor,
+#   $x = $x_phi at the start of the phi's block), which avoids lost-copy
+#   and swap problems without splitting edges. pseudoc.ssa.construct can
+#   be applied to the result to get SSA form back.
+# - Integer ops map to (typed) PseudoC ops. As PseudoC values are signed,
+#   operands of unsigned ops (udiv, urem, lshr, unsigned icmp's) are cast
+#   to unsigned types first. icmp used only by the following br is folded
+#   into "if". select and switch are lowered to branches.
+# - load/store map to *(type*) accesses. getelementptr is lowered to
+#   address arithmetic (with constant parts folded), using struct layouts
+#   as given by "target datalayout". alloca's become @alloca(size).
+# - Pointers are of type void* for 32-bit targets, and of unsigned integer
+#   type of pointer size otherwise (so that struct layouts and data are
+#   the same regardless of PseudoC consumer's pointer size).
+#
+# Global variables become Data items (with struct padding as explicit
+# zero bytes), named struct types - PseudoC struct types (without field
+# names). Floating-point and vector types, aggregate values in registers,
+# exception handling, atomics other than plain load/store, etc. are not
+# supported (and raise LLVMImportError, or with keep_going=True, skip the
+# function or global using them with a warning).
+#
+# PseudoC has no packed structs. Layouts of packed LLVM structs are used
+# for conversion, but a named one is dumped as a plain struct, which has
+# natural layout when parsed back. So if layouts differ, there's a warning
+# and a note for the item in Importer.notes (python -m pseudoc.llvm dumps
+# it as a comment), or LLVMImportError with strict=True.
+
+import re
+import logging
+try:
+    from sys import intern
+except ImportError:
+    def intern(s):
+        return s
+
+from . import config
+from .ir import Arg, Insn, BBlock, Func, Data, Module, PrimType, ArrType, StructType, TypeTable, TypeLayout, DataLayout, DEFAULT_LAYOUT
+from .dumper import format_bytes
+from .parser import TYPE_NAMES
+
+
+_log = logging.getLogger(__name__)
+
+
+class LLVMImportError(Exception):
+    pass
+
+
+_TOKEN = re.compile(
+    r'[%@](?:"[^"]*"|[-A-Za-z$._0-9]+)|c"[^"]*"|"[^"]*"|![-A-Za-z$._0-9]*|#\d+'
+    r'|-?0x[0-9A-Fa-f]+|-?\d+(?:\.\d+(?:[eE][-+]?\d+)?)?|[A-Za-z_.$][-A-Za-z_.$0-9]*|\.\.\.|\S'
+)
+_LABEL = re.compile(r'(?:([-A-Za-z$._0-9]+)|"([^"]*)"):$')
+# Label of unnamed block, as printed by older LLVM versions.
+_OLD_LABEL = re.compile(r";\s*<label>:(\d+)")
+_COMMENT = re.compile(r'"[^"]*"|;')
+_INT_TYPE = re.compile(r"i(\d+)$")
+_AUTO_LABEL = re.compile(r"_l\d+$")
+_NON_IDENT = re.compile(r"[^A-Za-z_0-9]")
+_STR_ESCAPE = re.compile(rb"\\([0-9A-Fa-f]{2}|\\)")
+
+_INT_WIDTHS = (1, 8, 16, 32, 64)
+_OTHER_TYPES = {
+    "half", "bfloat", "float", "double", "fp128", "x86_fp80", "ppc_fp128",
+    "x86_mmx", "x86_amx", "label", "metadata", "token",
+}
+_TERMINATORS = {
+    "ret", "br", "switch", "indirectbr", "invoke", "callbr", "resume",
+    "catchswitch", "catchret", "cleanupret", "unreachable",
+}
+_CONST_WORDS = {"true", "false", "null", "undef", "poison", "zeroinitializer", "none"}
+_CONST_CASTS = {"bitcast", "addrspacecast", "ptrtoint", "inttoptr"}
+_PSEUDOC_KEYWORDS = TYPE_NAMES | {"if", "goto", "else", "return", "struct"}
+
+BIN_OPS = {
+    "add": "+",
+    "sub": "-",
+    "mul": "*",
+    "sdiv": "/",
+    "srem": "%",
+    "and": "&",
+    "or": "|",
+    "xor": "^",
+    "shl": "<<",
+    "ashr": ">>",
+    # Operands are cast to unsigned first.
+    "udiv": "/",
+    "urem": "%",
+    "lshr": ">>",
+}
+_UNSIGNED_OPS = {"udiv", "urem", "lshr"}
+
+# icmp predicate -> (PseudoC op, whether comparison is unsigned)
+ICMP_OPS = {
+    "eq": ("==", False),
+    "ne": ("!=", False),
+    "slt": ("<", False),
+    "sgt": (">", False),
+    "sle": ("<=", False),
+    "sge": (">=", False),
+    "ult": ("<", True),
+    "ugt": (">", True),
+    "ule": ("<=", True),
+    "uge": (">=", True),
+}
+
+# Intrinsics without effect on PseudoC semantics, calls to them are dropped.
+_DROPPED_INTRINSICS = (
+    "llvm.dbg.", "llvm.lifetime.", "llvm.assume", "llvm.donothing",
+    "llvm.experimental.noalias.scope.decl", "llvm.invariant.",
+)
+# Intrinsics mapped to libc functions (with trailing "isvolatile" arg dropped).
+_LIBC_INTRINSICS = ("memcpy", "memmove", "memset")
+
+
+def _strip_comment(l):
+    if ";" not in l:
+        return l
+    for m in _COMMENT.finditer(l):
+        if m.group() == ";":
+            return l[:m.start()]
+    return l
+
+
+def _int(t):
+    if t.startswith(("0x", "-0x")):
+        return int(t, 16)
+    return int(t)
+
+
+def _ident(name):
+    "Convert LLVM name (without sigil, possibly quoted) to PseudoC identifier."
+    if name.startswith('"'):
+        name = name[1:-1]
+    name = _NON_IDENT.sub("_", name)
+    if not name or name[0].isdigit() or name in _PSEUDOC_KEYWORDS:
+        name = "_" + name
+    return name
+
+
+def _label(t):
+    "LLVM label name from label reference token."
+    return t[1:].strip('"')
+
+
+def _unescape(s):
+    "Bytes of LLVM string constant contents."
+    return _STR_ESCAPE.sub(lambda m: bytes([int(m.group(1), 16)]) if m.group(1) != b"\\" else b"\\", s.encode())
+
+
+class Names:
+    "Mapping of LLVM names to unique PseudoC identifiers."
+
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self.map = {}
+        self.used = set()
+
+    def get(self, name, base=None):
+        "Get PseudoC name for LLVM name (optionally, based on other name)."
+        res = self.map.get(name)
+        if res is None:
+            if base is None:
+                base = name
+            if self.prefix:
+                # Local var names may start with a digit.
+                base = _NON_IDENT.sub("_", base.strip('"')) or "_"
+            else:
+                base = _ident(base)
+            res = self.map[name] = self.new(self.prefix + base)
+        return res
+
+    def new(self, base):
+        "Get unique name, not mapped from any LLVM name."
+        res = base
+        n = 0
+        while res in self.used:
+            n += 1
+            res = "%s_%d" % (base, n)
+        self.used.add(res)
+        return intern(res)
+
+
+class FuncType:
+    "Function type (used only as type of calls, so only result is kept)."
+
+    def __init__(self, res):
+        self.res = res
+
+
+class Tokens:
+    "Tokens of an LLVM IR statement, with a cursor."
+
+    __slots__ = ("toks", "pos", "lineno")
+
+    def __init__(self, l, lineno):
+        self.toks = _TOKEN.findall(l)
+        self.pos = 0
+        self.lineno = lineno
+
+    def error(self, msg):
+        raise LLVMImportError("%s: %s: %s" % (self.lineno, msg, " ".join(self.toks)))
+
+    def peek(self, off=0):
+        p = self.pos + off
+        if p < len(self.toks):
+            return self.toks[p]
+        return None
+
+    def next(self):
+        if self.pos >= len(self.toks):
+            self.error("unexpected end of statement")
+        t = self.toks[self.pos]
+        self.pos += 1
+        return t
+
+    def match(self, t):
+        if self.pos < len(self.toks) and self.toks[self.pos] == t:
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, t):
+        if not self.match(t):
+            self.error("expected %r" % t)
+
+    def is_terminator(self):
+        return self.toks[0] in _TERMINATORS
+
+    def skip_parens(self):
+        "Skip balanced parenthesized group, if any."
+        if self.peek() != "(":
+            return
+        depth = 0
+        while True:
+            t = self.next()
+            if t == "(":
+                depth += 1
+            elif t == ")":
+                depth -= 1
+                if depth == 0:
+                    return
+
+
+def _is_type_start(t):
+    if t is None:
+        # End of statement, let type parsing report error.
+        return True
+    return (
+        t in ("ptr", "void", "[", "{", "<") or t in _OTHER_TYPES
+        or t[0] == "%" or _INT_TYPE.match(t) is not None
+    )
+
+
+def _is_value_start(t):
+    return (
+        t[0] in "%@-0123456789" or t in _CONST_WORDS or t in _CONST_CASTS
+        or t == "getelementptr" or t.startswith('c"')
+    )
+
+
+class Importer:
+
+    def __init__(self, types=None, split_bb_after_call=None, keep_going=False, strict=False):
+        if types is None:
+            types = TypeTable()
+        self.types = types
+        if split_bb_after_call is None:
+            split_bb_after_call = config.SPLIT_BB_AFTER_CALL
+        self.split_bb_after_call = split_bb_after_call
+        self.keep_going = keep_going
+        self.strict = strict
+        # item -> note on its conversion
+        self.notes = {}
+        self.globals = Names()
+        self.struct_names = Names()
+        # Literal (unnamed) struct types, by (fields, packed).
+        self.lit_structs = {}
+        self.set_layout(DataLayout(8))
+
+    def set_layout(self, layout):
+        self.layout = layout
+        if layout.ptr_size == 4:
+            self.ptr_type = self.types.ptr(self.types.prim("void"))
+            self.ptr_name = "void*"
+        else:
+            self.ptr_name = "u%d" % (layout.ptr_size * 8)
+            self.ptr_type = self.types.prim(self.ptr_name)
+
+    def parse_datalayout(self, spec):
+        # LLVM defaults.
+        ptr_size = 8
+        aligns = {"i64": 4}
+        byteorder = "little"
+        for item in spec.split("-"):
+            fields = item.split(":")
+            if item == "E":
+                byteorder = "big"
+            elif fields[0] in ("p", "p0") and len(fields) >= 3:
+                ptr_size = int(fields[1]) // 8
+                aligns["void*"] = int(fields[2]) // 8
+            elif _INT_TYPE.match(fields[0]) and len(fields) >= 2:
+                aligns[fields[0]] = int(fields[1]) // 8
+        if ptr_size != 4:
+            aligns["u%d" % (ptr_size * 8)] = aligns.pop("void*", ptr_size)
+        self.set_layout(DataLayout(ptr_size, aligns, byteorder=byteorder))
+
+    def global_name(self, t):
+        "PseudoC name of LLVM global (token with @ sigil)."
+        return self.globals.get(t[1:])
+
+    # Types
+
+    def parse_type(self, toks):
+        t = toks.next()
+        m = _INT_TYPE.match(t)
+        if m:
+            if int(m.group(1)) not in _INT_WIDTHS:
+                toks.error("unsupported integer type: %s" % t)
+            typ = self.types.prim(t)
+        elif t == "ptr":
+            typ = self.ptr_type
+        elif t == "void":
+            typ = None
+        elif t == "[":
+            num = _int(toks.next())
+            toks.expect("x")
+            typ = self.types.arr(self.parse_type(toks), num)
+            toks.expect("]")
+        elif t == "{":
+            typ = self.lit_struct(self.parse_fields(toks, "}"), False)
+        elif t == "<" and toks.match("{"):
+            typ = self.lit_struct(self.parse_fields(toks, "}"), True)
+            toks.expect(">")
+        elif t[0] == "%":
+            typ = self.struct_type(t)
+        else:
+            toks.error("unsupported type: %s" % t)
+        while True:
+            if toks.match("*"):
+                typ = self.ptr_type
+            elif toks.match("addrspace"):
+                toks.skip_parens()
+                typ = self.ptr_type
+            elif toks.peek() == "(":
+                toks.skip_parens()
+                typ = FuncType(typ)
+            else:
+                return typ
+
+    def parse_fields(self, toks, end):
+        fields = []
+        while not toks.match(end):
+            fields.append((None, self.parse_type(toks)))
+            toks.match(",")
+        return fields
+
+    def struct_type(self, t):
+        name = t[1:].strip('"')
+        for prefix in ("struct.", "class.", "union."):
+            if name.startswith(prefix):
+                name = name[len(prefix):]
+                break
+        # Mapped by full LLVM name, to keep e.g. struct.A and class.A apart.
+        return self.types.struct(self.struct_names.get(t, name))
+
+    def lit_struct(self, fields, packed):
+        key = (tuple(fields), packed)
+        typ = self.lit_structs.get(key)
+        if typ is None:
+            typ = self.lit_structs[key] = StructType(None, fields)
+            if packed:
+                self.set_packed(typ)
+        return typ
+
+    def set_packed(self, typ):
+        # PseudoC has no packed structs, so layout is precomputed for them.
+        offsets = []
+        offset = 0
+        for _, fld_type in typ.fields:
+            offsets.append(offset)
+            offset += self.layout.size(fld_type)
+        lay = self.layout.cache[typ] = TypeLayout(offset, 1, offsets)
+        return lay
+
+    def is_int(self, typ):
+        return isinstance(typ, PrimType) and typ is not self.ptr_type
+
+    def bits(self, typ):
+        if typ is self.ptr_type:
+            return self.layout.ptr_size * 8
+        return int(typ.typ[1:])
+
+    def scalar(self, toks, typ):
+        "Check that typ is of a value which PseudoC can hold in a variable."
+        if typ is not self.ptr_type and not self.is_int(typ):
+            toks.error("unsupported value type: %s" % typ)
+        return typ
+
+    def type_def(self, toks):
+        typ = self.struct_type(toks.next())
+        toks.expect("=")
+        toks.expect("type")
+        if toks.match("opaque"):
+            return None
+        packed = toks.match("<")
+        toks.expect("{")
+        typ.fields = self.parse_fields(toks, "}")
+        if packed:
+            toks.expect(">")
+            natural = self.layout.layout(typ)
+            lay = self.set_packed(typ)
+            if (lay.size, lay.offsets) != (natural.size, natural.offsets):
+                note = "packed struct: field offsets %s, size %d (unpacked: %s, %d)" % (
+                    lay.offsets, lay.size, natural.offsets, natural.size)
+                if self.strict:
+                    toks.error("%s: %s" % (typ, note))
+                _log.warning("%s: %s", typ, note)
+                self.notes[typ] = note
+        return typ
+
+    # Constants
+
+    def const_int(self, toks):
+        t = toks.next()
+        if t == "true":
+            return 1
+        if t in ("false", "null", "undef", "poison", "zeroinitializer"):
+            return 0
+        try:
+            return _int(t)
+        except ValueError:
+            toks.error("expected integer constant")
+
+    def const_expr(self, toks):
+        "Parse scalar constant, return (symbol or None, offset)."
+        t = toks.next()
+        if t[0] == "@":
+            return self.global_name(t), 0
+        if t in _CONST_CASTS:
+            toks.expect("(")
+            self.parse_type(toks)
+            res = self.const_expr(toks)
+            toks.expect("to")
+            self.parse_type(toks)
+            toks.expect(")")
+            return res
+        if t == "getelementptr":
+            toks.match("inbounds")
+            toks.expect("(")
+            src_type = self.parse_type(toks)
+            toks.expect(",")
+            self.parse_type(toks)
+            sym, off = self.const_expr(toks)
+            indices = []
+            while toks.match(","):
+                toks.match("inrange")
+                self.parse_type(toks)
+                indices.append(self.const_int(toks))
+            toks.expect(")")
+            off += self.gep_offsets(toks, src_type, indices)[0]
+            return sym, off
+        toks.pos -= 1
+        return None, self.const_int(toks)
+
+    def gep_offsets(self, toks, typ, indices):
+        """Return (constant offset, [(variable index, scale)]) of address
+        computed by getelementptr on type typ, with given indices."""
+        offset = 0
+        terms = []
+        for i, idx in enumerate(indices):
+            if i > 0:
+                if isinstance(typ, StructType):
+                    if not isinstance(idx, int):
+                        toks.error("non-constant struct index")
+                    offset += self.layout.layout(typ).offsets[idx]
+                    typ = typ.fields[idx][1]
+                    continue
+                if not isinstance(typ, ArrType):
+                    toks.error("getelementptr index into non-aggregate type")
+                typ = typ.el_type
+            scale = self.layout.size(typ)
+            if isinstance(idx, int):
+                offset += idx * scale
+            else:
+                terms.append((idx, scale))
+        return offset, terms
+
+    def zeros(self, desc, size):
+        if size:
+            b = bytes(size)
+            desc.append(("str", format_bytes(b), b))
+
+    def const_init(self, toks, typ, desc):
+        "Append Data elements for initializer of type typ to desc."
+        t = toks.peek()
+        if t in ("zeroinitializer", "undef", "poison"):
+            toks.next()
+            self.zeros(desc, self.layout.size(typ))
+        elif typ is self.ptr_type:
+            sym, off = self.const_expr(toks)
+            if sym is not None and off:
+                toks.error("unsupported pointer constant (with offset)")
+            desc.append((self.ptr_name, Arg(sym or off)))
+        elif self.is_int(typ):
+            desc.append((typ.typ, Arg(self.const_int(toks))))
+        elif isinstance(typ, ArrType):
+            if t.startswith('c"'):
+                toks.next()
+                b = _unescape(t[2:-1])
+                desc.append(("str", format_bytes(b), b))
+                return
+            toks.expect("[")
+            for _ in range(typ.num):
+                self.const_init(toks, self.parse_type(toks), desc)
+                toks.match(",")
+            toks.expect("]")
+        elif isinstance(typ, StructType):
+            lay = self.layout.layout(typ)
+            packed = toks.match("<")
+            toks.expect("{")
+            pos = 0
+            for (_, fld_type), offset in zip(typ.fields, lay.offsets):
+                self.zeros(desc, offset - pos)
+                self.const_init(toks, self.parse_type(toks), desc)
+                toks.match(",")
+                pos = offset + self.layout.size(fld_type)
+            self.zeros(desc, lay.size - pos)
+            toks.expect("}")
+            if packed:
+                toks.expect(">")
+        else:
+            toks.error("unsupported initializer type: %s" % typ)
+
+    def global_var(self, toks):
+        name = self.global_name(toks.next())
+        toks.expect("=")
+        while True:
+            t = toks.next()
+            if t in ("global", "constant"):
+                break
+            if t in ("alias", "ifunc"):
+                return None
+            toks.skip_parens()
+        typ = self.parse_type(toks)
+        if toks.peek() in (None, ","):
+            # External declaration.
+            return None
+        desc = []
+        self.const_init(toks, typ, desc)
+        if isinstance(typ, StructType) and typ.name is None:
+            typ = None
+        data = Data(name, desc, typ)
+        data.size = sum([len(el[2]) if el[0] == "str" else DEFAULT_LAYOUT.prim_size(el[0]) for el in desc])
+        return data
+
+    # Top level
+
+    def import_iter(self, f):
+        """Convert LLVM IR from line iterable f, yielding PseudoC items
+        (StructType, Data, Func) one by one."""
+        func_lines = None
+        for lineno, l in enumerate(f, 1):
+            if func_lines is not None:
+                if l.startswith("}"):
+                    item = self.convert(lambda: FuncImporter(self, func_lines).convert())
+                    func_lines = None
+                    if item is not None:
+                        yield item
+                else:
+                    func_lines.append((lineno, l))
+                continue
+
+            l = _strip_comment(l).strip()
+            if not l:
+                continue
+            item = None
+            if l.startswith("define "):
+                func_lines = [(lineno, l)]
+            elif l[0] == "%":
+                item = self.convert(lambda: self.type_def(Tokens(l, lineno)))
+            elif l[0] == "@":
+                item = self.convert(lambda: self.global_var(Tokens(l, lineno)))
+            elif l.startswith("target datalayout"):
+                self.parse_datalayout(l.split('"')[1])
+            if item is not None:
+                yield item
+        if func_lines is not None:
+            raise LLVMImportError("%d: unterminated function" % func_lines[0][0])
+
+    def convert(self, func):
+        try:
+            return func()
+        except LLVMImportError as e:
+            if not self.keep_going:
+                raise
+            _log.warning("skipped: %s", e)
+        except ValueError as e:
+            # From DataLayout (e.g. size of opaque struct).
+            if not self.keep_going:
+                raise LLVMImportError(str(e))
+            _log.warning("skipped: %s", e)
+        return None
+
+    def import_module(self, f):
+        mod = Module(self.types)
+        for item in self.import_iter(f):
+            mod.add(item)
+        return mod
+
+
+class Phi:
+    __slots__ = ("dest", "tmp", "typ", "toks", "incoming")
+
+
+def _skip_value(toks):
+    "Skip tokens of a value, up to a top-level ','."
+    depth = 0
+    while True:
+        t = toks.peek()
+        if t is None or (t == "," and depth == 0):
+            return
+        if t in "([{":
+            depth += 1
+        elif t in ")]}":
+            depth -= 1
+        toks.next()
+
+
+class FuncImporter:
+    "Converter of one LLVM function, given as list of (lineno, line)."
+
+    def __init__(self, imp, lines):
+        self.imp = imp
+        self.types = imp.types
+        self.lines = lines
+        self.vars = Names("$")
+        self.labels = Names()
+        self.label2bb = {}
+        self.func = None
+        self.bb = None
+        # LLVM label of block being converted, and its BBlock.
+        self.label = None
+        self.label_bb = None
+        self.dest = None
+        # (LLVM name, args of "if") of icmp folded into following br.
+        self.cond = None
+
+    def var(self, t):
+        return self.vars.get(t[1:])
+
+    def tmp(self, suffix):
+        return self.vars.new("%s_%s" % (self.dest or "$t", suffix))
+
+    def get_bb(self, label):
+        "Get block by LLVM label (without % and quotes)."
+        bb = self.label2bb.get(label)
+        if bb is None:
+            name = _ident(label)
+            if _AUTO_LABEL.match(name):
+                name += "_"
+            bb = self.label2bb[label] = BBlock(self.labels.get(label, name))
+        return bb
+
+    def new_bb(self):
+        "Create block for a part of current LLVM block (split by a call, etc.)."
+        bb = BBlock(self.labels.new(self.label_bb.label))
+        self.func.bblocks.append(bb)
+        return bb
+
+    def emit(self, insn):
+        self.bb.insns.append(insn)
+
+    def int_type(self, typ):
+        "Type for dest of value of type typ (only integers are typed)."
+        if self.imp.is_int(typ):
+            return typ
+        return None
+
+    def value(self, toks):
+        t = toks.peek()
+        if t is None:
+            toks.error("expected value")
+        if t[0] == "%":
+            toks.next()
+            return self.var(t)
+        sym, off = self.imp.const_expr(toks)
+        if sym is None:
+            return off
+        if off:
+            res = self.tmp("off")
+            self.emit(Insn(res, "+", sym, off))
+            return res
+        return sym
+
+    def unsigned(self, val, typ):
+        "Return val (of type typ) converted to unsigned value."
+        bits = self.imp.bits(typ)
+        if bits == 1:
+            return val
+        if isinstance(val, int):
+            return val & ((1 << bits) - 1)
+        res = self.tmp("u")
+        self.emit(Insn(res, "@cast", self.types.prim("u%d" % bits), val))
+        return res
+
+    def parse_header(self, toks):
+        imp = self.imp
+        toks.expect("define")
+        while not _is_type_start(toks.peek()):
+            toks.next()
+            toks.skip_parens()
+        res_type = imp.parse_type(toks)
+        if res_type is not None:
+            imp.scalar(toks, res_type)
+        func = Func(imp.global_name(toks.next()))
+        func.res_type = res_type
+        toks.expect("(")
+        params = []
+        param_types = []
+        self.num_unnamed = 0
+        while not toks.match(")"):
+            if toks.match("..."):
+                continue
+            typ = imp.scalar(toks, imp.parse_type(toks))
+            while True:
+                t = toks.peek()
+                if t in (",", ")") or t[0] == "%":
+                    break
+                toks.next()
+                if t == "align":
+                    toks.next()
+                toks.skip_parens()
+            t = toks.next()
+            if t[0] != "%":
+                toks.error("unnamed parameter")
+            if t[1:].isdigit():
+                self.num_unnamed += 1
+            params.append(self.var(t))
+            param_types.append(typ)
+            toks.match(",")
+        func.params = params
+        func.param_types = param_types
+        return func
+
+    def collect(self):
+        """Split function body into blocks: list of (LLVM label, list of
+        Tokens), and collect phis (by LLVM label of their block)."""
+        blocks = []
+        cur = None
+        pending = None
+        # Unlabeled blocks get the next number of unnamed values (as
+        # does unlabeled entry block).
+        next_unnamed = self.num_unnamed
+        for lineno, l in self.lines[1:]:
+            l = l.strip()
+            m = _OLD_LABEL.match(l)
+            l = _strip_comment(l).strip()
+            label = None
+            if m and not l:
+                label = m.group(1)
+            elif not l:
+                continue
+            elif l[-1] == ":":
+                m = _LABEL.match(l)
+                if m:
+                    label = m.group(1) or m.group(2)
+            elif cur is None or cur[1] and cur[1][-1].is_terminator():
+                label = str(next_unnamed)
+            if label is not None:
+                if label.isdigit():
+                    next_unnamed = int(label) + 1
+                cur = (label, [])
+                blocks.append(cur)
+                if not l or l[-1] == ":":
+                    continue
+            # Statements may span lines (e.g. cases of switch).
+            if pending is not None:
+                l = pending + " " + l
+            if l.count("[") > l.count("]"):
+                pending = l
+                continue
+            pending = None
+            toks = Tokens(l, lineno)
+            if toks.peek(1) == "=" and toks.peek()[1:].isdigit():
+                next_unnamed = int(toks.peek()[1:]) + 1
+            cur[1].append(toks)
+
+        self.uses = {}
+        self.phis = {}
+        for label, insns in blocks:
+            for toks in insns:
+                for t in toks.toks[2 if toks.peek(1) == "=" else 0:]:
+                    if t[0] == "%":
+                        self.uses[t] = self.uses.get(t, 0) + 1
+                if toks.peek(2) == "phi":
+                    self.collect_phi(label, toks)
+        return blocks
+
+    def collect_phi(self, label, toks):
+        phi = Phi()
+        phi.dest = self.var(toks.peek())
+        phi.tmp = self.vars.new(phi.dest + "_phi")
+        toks.pos = 3
+        while not _is_type_start(toks.peek()):
+            toks.next()
+        phi.typ = self.imp.scalar(toks, self.imp.parse_type(toks))
+        phi.toks = toks
+        # LLVM label of predecessor -> position of incoming value in toks.
+        phi.incoming = {}
+        while toks.match("["):
+            start = toks.pos
+            _skip_value(toks)
+            toks.expect(",")
+            pred = _label(toks.next())
+            toks.expect("]")
+            phi.incoming.setdefault(pred, start)
+            toks.match(",")
+        self.phis.setdefault(label, []).append(phi)
+
+    def convert(self):
+        lineno, header = self.lines[0]
+        func = self.func = self.parse_header(Tokens(header, lineno))
+        blocks = self.collect()
+        for i, (label, insns) in enumerate(blocks):
+            if i == 0 and label.isdigit():
+                # Unlabeled entry block.
+                self.label2bb[label] = BBlock(self.labels.new("entry"))
+            self.label = label
+            self.bb = self.label_bb = self.get_bb(label)
+            func.bblocks.append(self.bb)
+            for phi in self.phis.get(label, ()):
+                self.emit(Insn(phi.dest, "=", phi.tmp, type=self.int_type(phi.typ)))
+            for j, toks in enumerate(insns):
+                if toks.toks[2:3] == ["phi"]:
+                    continue
+                self.insn(toks, insns[j + 1] if j + 1 < len(insns) else None)
+        func.calc_preds()
+        return func
+
+    def insn(self, toks, next_toks):
+        dest_tok = None
+        self.dest = None
+        if toks.peek(1) == "=":
+            dest_tok = toks.next()
+            self.dest = self.var(dest_tok)
+            toks.next()
+        op = toks.next()
+        if op in ("tail", "musttail", "notail"):
+            op = toks.next()
+        if op in BIN_OPS:
+            self.binary(op, toks)
+        elif op == "icmp":
+            self.icmp(dest_tok, toks, next_toks)
+        elif op in ("zext", "sext", "trunc", "bitcast", "addrspacecast", "ptrtoint", "inttoptr"):
+            self.cast(op, toks)
+        else:
+            handler = getattr(self, "insn_" + op, None)
+            if handler is None:
+                toks.error("unsupported instruction: %s" % op)
+            handler(toks)
+
+    def binary(self, op, toks):
+        while toks.peek() in ("nsw", "nuw", "exact", "disjoint"):
+            toks.next()
+        typ = self.imp.scalar(toks, self.imp.parse_type(toks))
+        a = self.value(toks)
+        toks.expect(",")
+        b = self.value(toks)
+        if op in _UNSIGNED_OPS:
+            a = self.unsigned(a, typ)
+            if op != "lshr":
+                b = self.unsigned(b, typ)
+        self.emit(Insn(self.dest, BIN_OPS[op], a, b, type=self.int_type(typ)))
+
+    def icmp(self, dest_tok, toks, next_toks):
+        pred = toks.next()
+        if pred not in ICMP_OPS:
+            toks.error("unsupported icmp predicate: %s" % pred)
+        op, is_unsigned = ICMP_OPS[pred]
+        typ = self.imp.scalar(toks, self.imp.parse_type(toks))
+        a = self.value(toks)
+        toks.expect(",")
+        b = self.value(toks)
+        if is_unsigned:
+            a = self.unsigned(a, typ)
+            b = self.unsigned(b, typ)
+        if (
+            self.uses.get(dest_tok) == 1 and next_toks is not None
+            and next_toks.peek() == "br" and dest_tok in next_toks.toks
+        ):
+            self.cond = (dest_tok, (a, op, b))
+            return
+        self.emit(Insn(self.dest, op, a, b, type=self.types.prim("i1")))
+
+    def cast(self, op, toks):
+        imp = self.imp
+        src_type = imp.scalar(toks, imp.parse_type(toks))
+        val = self.value(toks)
+        toks.expect("to")
+        typ = imp.scalar(toks, imp.parse_type(toks))
+        src_bits = imp.bits(src_type)
+        if op == "zext" and src_bits > 1:
+            insn = Insn(self.dest, "@cast", self.types.prim("u%d" % src_bits), val)
+        elif op == "sext" and src_bits == 1:
+            insn = Insn(self.dest, "-", val, type=typ)
+        elif imp.is_int(typ) and imp.bits(typ) < src_bits or op == "sext":
+            insn = Insn(self.dest, "@cast", typ, val)
+        else:
+            insn = Insn(self.dest, "=", val, type=self.int_type(typ))
+        self.emit(insn)
+
+    def insn_freeze(self, toks):
+        typ = self.imp.scalar(toks, self.imp.parse_type(toks))
+        self.emit(Insn(self.dest, "=", self.value(toks), type=self.int_type(typ)))
+
+    def insn_load(self, toks):
+        toks.match("atomic")
+        toks.match("volatile")
+        typ = self.imp.scalar(toks, self.imp.parse_type(toks))
+        toks.expect(",")
+        self.imp.parse_type(toks)
+        self.emit(Insn(self.dest, "@load", self.value(toks), typ))
+
+    def insn_store(self, toks):
+        toks.match("atomic")
+        toks.match("volatile")
+        typ = self.imp.scalar(toks, self.imp.parse_type(toks))
+        val = self.value(toks)
+        if isinstance(val, int):
+            # Stored as unsigned, as "*(type*)$p = -1" would be parsed
+            # as unary minus.
+            val &= (1 << self.imp.bits(typ)) - 1
+        toks.expect(",")
+        self.imp.parse_type(toks)
+        self.emit(Insn("", "@store", self.value(toks), typ, val))
+
+    def insn_alloca(self, toks):
+        toks.match("inalloca")
+        size = self.imp.layout.size(self.imp.parse_type(toks))
+        if toks.match(",") and _is_type_start(toks.peek()):
+            self.imp.parse_type(toks)
+            num = self.value(toks)
+            if isinstance(num, int):
+                size *= num
+            else:
+                t = self.tmp("size")
+                self.emit(Insn(t, "*", num, size))
+                size = t
+        self.emit(Insn(self.dest, "@alloca", size))
+
+    def insn_getelementptr(self, toks):
+        imp = self.imp
+        toks.match("inbounds")
+        src_type = imp.parse_type(toks)
+        toks.expect(",")
+        imp.parse_type(toks)
+        addr = self.value(toks)
+        indices = []
+        while toks.match(","):
+            if toks.peek()[0] == "!":
+                break
+            toks.match("inrange")
+            imp.parse_type(toks)
+            indices.append(self.value(toks))
+        offset, terms = imp.gep_offsets(toks, src_type, indices)
+        steps = []
+        for idx, scale in terms:
+            if scale != 1:
+                t = self.tmp("idx")
+                self.emit(Insn(t, "*", idx, scale))
+                idx = t
+            steps.append(idx)
+        if offset:
+            steps.append(offset)
+        if not steps:
+            self.emit(Insn(self.dest, "=", addr))
+        for i, step in enumerate(steps):
+            dest = self.dest if i == len(steps) - 1 else self.tmp("addr")
+            if isinstance(step, int) and step < 0:
+                self.emit(Insn(dest, "-", addr, -step))
+            else:
+                self.emit(Insn(dest, "+", addr, step))
+            addr = dest
+
+    def insn_select(self, toks):
+        imp = self.imp
+        imp.parse_type(toks)
+        cond = self.value(toks)
+        toks.expect(",")
+        typ = imp.scalar(toks, imp.parse_type(toks))
+        a = self.value(toks)
+        toks.expect(",")
+        imp.parse_type(toks)
+        b = self.value(toks)
+        typ = self.int_type(typ)
+        if isinstance(cond, int):
+            self.emit(Insn(self.dest, "=", a if cond else b, type=typ))
+            return
+        self.emit(Insn(self.dest, "=", b, type=typ))
+        self.emit(Insn("", "if", cond))
+        bb = self.bb
+        true_bb = self.new_bb()
+        self.bb = self.new_bb()
+        bb.succs = [true_bb, self.bb]
+        true_bb.insns.append(Insn(self.dest, "=", a, type=typ))
+        true_bb.succs.append(self.bb)
+
+    def insn_call(self, toks):
+        imp = self.imp
+        while not _is_type_start(toks.peek()):
+            toks.next()
+            toks.skip_parens()
+        typ = imp.parse_type(toks)
+        if isinstance(typ, FuncType):
+            typ = typ.res
+        if typ is not None:
+            imp.scalar(toks, typ)
+        name = toks.peek()
+        if name[0] == "@":
+            name = name[1:].strip('"')
+            if name.startswith(_DROPPED_INTRINSICS):
+                return
+        callee = self.value(toks)
+        toks.expect("(")
+        args = []
+        while not toks.match(")"):
+            imp.parse_type(toks)
+            while not _is_value_start(toks.peek() or ","):
+                if toks.next() == "align":
+                    toks.next()
+                toks.skip_parens()
+            args.append(self.value(toks))
+            toks.match(",")
+        parts = name.split(".")
+        if parts[0] == "llvm" and len(parts) > 1 and parts[1] in _LIBC_INTRINSICS:
+            callee = imp.globals.get(parts[1])
+            args = args[:3]
+        self.emit(Insn(self.dest or "", "call", callee, *args, type=self.int_type(typ)))
+        if imp.split_bb_after_call:
+            bb = self.bb
+            self.bb = self.new_bb()
+            bb.succs.append(self.bb)
+
+    def phi_copies(self, labels):
+        "Assign incoming values from current block to phis of its successors."
+        done = set()
+        for label in labels:
+            if label in done:
+                continue
+            done.add(label)
+            for phi in self.phis.get(label, ()):
+                pos = phi.incoming.get(self.label)
+                if pos is None:
+                    phi.toks.error("no incoming value for %%%s" % self.label)
+                phi.toks.pos = pos
+                self.dest = phi.dest
+                val = self.value(phi.toks)
+                self.emit(Insn(phi.tmp, "=", val, type=self.int_type(phi.typ)))
+
+    def insn_br(self, toks):
+        bb = self.bb
+        if toks.match("label"):
+            target = _label(toks.next())
+            self.phi_copies([target])
+            bb.succs.append(self.get_bb(target))
+            return
+        self.imp.parse_type(toks)
+        cond_tok = toks.peek()
+        if self.cond is not None and self.cond[0] == cond_tok:
+            toks.next()
+            cond = self.cond[1]
+        else:
+            cond = (self.value(toks),)
+        self.cond = None
+        toks.expect(",")
+        toks.expect("label")
+        true_label = _label(toks.next())
+        toks.expect(",")
+        toks.expect("label")
+        false_label = _label(toks.next())
+        self.phi_copies([true_label, false_label])
+        if len(cond) == 1 and isinstance(cond[0], int):
+            bb.succs.append(self.get_bb(true_label if cond[0] else false_label))
+        elif true_label == false_label:
+            bb.succs.append(self.get_bb(true_label))
+        else:
+            self.emit(Insn("", "if", *cond))
+            bb.succs = [self.get_bb(true_label), self.get_bb(false_label)]
+
+    def insn_switch(self, toks):
+        typ = self.imp.scalar(toks, self.imp.parse_type(toks))
+        val = self.value(toks)
+        toks.expect(",")
+        toks.expect("label")
+        default = _label(toks.next())
+        toks.expect("[")
+        cases = []
+        while not toks.match("]"):
+            self.imp.parse_type(toks)
+            c = self.imp.const_int(toks)
+            toks.expect(",")
+            toks.expect("label")
+            cases.append((c, _label(toks.next())))
+        self.phi_copies([default] + [label for _, label in cases])
+        for i, (c, label) in enumerate(cases):
+            self.emit(Insn("", "if", val, "==", c))
+            bb = self.bb
+            if i == len(cases) - 1:
+                bb.succs = [self.get_bb(label), self.get_bb(default)]
+            else:
+                self.bb = self.new_bb()
+                bb.succs = [self.get_bb(label), self.bb]
+        if not cases:
+            self.bb.succs.append(self.get_bb(default))
+
+    def insn_ret(self, toks):
+        if self.imp.parse_type(toks) is None:
+            self.emit(Insn("", "return"))
+        else:
+            self.emit(Insn("", "return", self.value(toks)))
+
+    def insn_unreachable(self, toks):
+        # Block without successors must end with return.
+        self.emit(Insn("", "return"))
+
+
+def import_iter(f, types=None):
+    return Importer(types).import_iter(f)
+
+
+def import_module(f):
+    return Importer().import_module(f)
+
+
+def __main__():
+    import sys
+    import argparse
+
+    argp = argparse.ArgumentParser(description="Convert LLVM IR (.ll) to PseudoC")
+    argp.add_argument("file")
+    argp.add_argument("-o", "--out", help="output file (default: stdout)")
+    argp.add_argument("-k", "--keep-going", action="store_true",
+        help="skip functions and globals which can't be converted (with warning)")
+    argp.add_argument("--strict", action="store_true",
+        help="error out on packed structs, which have different layout in PseudoC")
+    args = argp.parse_args()
+
+    logging.basicConfig(format="%(levelname)s: %(message)s")
+    out = open(args.out, "w") if args.out else sys.stdout
+    imp = Importer(keep_going=args.keep_going, strict=args.strict)
+    try:
+        with open(args.file) as f:
+            need_empty_line = False
+            for item in imp.import_iter(f):
+                if need_empty_line:
+                    out.write("\n")
+                note = imp.notes.get(item)
+                if note:
+                    out.write("# %s\n" % note)
+                item.dump(file=out, bb_ann=False, expl_goto=True)
+                need_empty_line = True
+    except LLVMImportError as e:
+        print("%s:%s" % (args.file, e), file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if args.out:
+            out.close()
+
+
+if __name__ == "__main__":
+    __main__()
@@ -23,83 +23,58 @@
 # THE SOFTWARE.
 
 import re
+try:
+    from sys import intern
+except ImportError:
+    def intern(s):
+        return s
 
 from lexer import Lexer
 from . import config
-from .ir import InlineStr, SpecFunc, Arg, Insn, BBlock, Func, Data, Module, PrimType, PtrType, ArrType, StructType
+from .ir import InlineStr, SpecFunc, Arg, Insn, BBlock, Func, Data, Module, PtrType, StructType, TypeTable, PRIM_SIZES, DEFAULT_LAYOUT
 
 
 LEX_IDENT = re.compile(r"[$][A-Za-z_0-9]+|[@]?[A-Za-z_][A-Za-z_0-9]*")
 LEX_SIMPLE_IDENT = re.compile(r"[A-Za-z_][A-Za-z_0-9]*")
 LEX_QUOTED_IDENT = re.compile(r"`.+?`")
 LEX_NUM = re.compile(r"-?\d+")
-LEX_TYPE = re.compile(r"void|i1|i8|u8|i16|u16|i32|u32|i64|u64")
+LEX_TYPE = re.compile(r"(void|i1|i8|u8|i16|u16|i32|u32|i64|u64)\b")
 # Simplified. To avoid enumerating specific operators supported, just say
 # "anything non-space, except handle opening parens specially (for calls
 # w/o args).
 LEX_OP = re.compile(r"\(|[^ ]+")
 LEX_UNARY_OP = re.compile(r"[-~!*(]")
-LEX_STR = re.compile(r'"([^\\]|\\.)*"')
+LEX_STR = re.compile(r'"([^\\"]|\\.)*"')
+# Data element with following comma: string literal, or (type)value with
+# number, (non-local) identifier, or string literal value.
+_STR = r'"(?:[^\\"]|\\.)*"'
+_DATA_ELEM = re.compile(
+    r'(?:(%s)|\([ \t]*(void[ \t]*\*|i1|i8|u8|i16|u16|i32|u32|i64|u64)[ \t]*\)[ \t]*'
+    r'(?:(-?\d+)|([@]?[A-Za-z_][A-Za-z_0-9]*)|(%s)))[ \t]*(?:,[ \t]*)?' % (_STR, _STR)
+)
 
 TYPE_NAMES = {"void", "i1", "i8", "u8", "i16", "u16", "i32", "u32", "i64", "u64"}
 
 
-LABEL_CNT = 0
-STRUCT_TYPE_MAP = {}
+# Version of parser output, should be bumped whenever the same input
+# starts to be parsed into a different IR (used e.g. to invalidate cached
+# parse results).
+VERSION = 3
 
 
 def parse_reg(lex, name):
     reg = None
     if name.startswith("$"):
         if lex.match("{"):
-            reg = lex.expect_re(LEX_IDENT, err="expected identifier")
+            reg = intern(lex.expect_re(LEX_IDENT, err="expected identifier"))
             lex.expect("}")
     return reg
 
 
-def parse_var(lex):
-    typ = parse_type(lex)
-    name = lex.expect_re(LEX_IDENT, err="expected identifier")
-    reg = parse_reg(lex, name)
-    return typ, name, reg
-
-
 def parse_type_name(lex):
     return lex.match_re(LEX_TYPE)
 
 
-def parse_type_mod(lex, typ):
-    while True:
-        if lex.match("*"):
-            typ = PtrType(typ)
-        elif lex.check("["):
-            dims = []
-            while lex.match("["):
-                dim = parse_val(lex).val
-                assert isinstance(dim, int)
-                dims.append(dim)
-                lex.expect("]")
-            for dim in reversed(dims):
-                typ = ArrType(typ, dim)
-        else:
-            break
-    return typ
-
-
-def parse_type(lex):
-    if lex.match("struct"):
-        name = lex.expect_re(LEX_SIMPLE_IDENT, "expected structure identifier")
-        typ = STRUCT_TYPE_MAP.get(name)
-        if typ is None:
-            typ = STRUCT_TYPE_MAP[name] = StructType(name, None)
-    else:
-        typ = parse_type_name(lex)
-        if typ is None:
-            return None
-        typ = PrimType(typ)
-    return parse_type_mod(lex, typ)
-
-
 def parse_simple_type(lex):
     if lex.match("void"):
         lex.expect("*")
@@ -107,361 +82,473 @@ def parse_simple_type(lex):
     return parse_type_name(lex)
 
 
-def parse_global_type_and_name(lex):
-    typ = None
-    name = None
-    parsed = lex.match_re(LEX_QUOTED_IDENT)
-    if parsed:
-        # If we matched a quoted id at the beginning, we know there's no type.
-        name = parsed[1:-1]
-    else:
-        parsed = lex.expect_re(LEX_SIMPLE_IDENT, "expected a simple identifier")
-        if parsed == "struct":
-            parsed = lex.expect_re(LEX_SIMPLE_IDENT, "expected structure identifier")
-            typ = STRUCT_TYPE_MAP.get(parsed)
-            if typ is None:
-                typ = STRUCT_TYPE_MAP[parsed] = StructType(parsed, None)
-        elif parsed in TYPE_NAMES:
-            typ = PrimType(parsed)
-        else:
-            # Otherwise what we parsed is a name.
-            name = parsed
-
-        if typ:
-            typ = parse_type_mod(lex, typ)
-            name = lex.match_re(LEX_SIMPLE_IDENT)
-            if not name:
-                name = lex.match_re(LEX_QUOTED_IDENT)
-            if not name:
-                # If that was a bare structure name followed by {, i.e. a
-                # structure type definition, it's ok to not have a name,
-                # otherwise report error.
-                if isinstance(typ, StructType) and lex.check("{"):
-                    pass
-                else:
-                    lex.error("identifer expected after type")
+TYPE_SIZES = dict(PRIM_SIZES)
+TYPE_SIZES["void*"] = DEFAULT_LAYOUT.ptr_size
 
-    return (typ, name)
+_ESCAPES = {b"0": b"\0", b'"': b'"', b"n": b"\n"}
 
 
-# Returns Arg object with .val and possibly .reg initialized.
-def parse_val(lex, spec_funcs=False):
-    reg = None
-    v = lex.match_re(LEX_IDENT)
-    if v:
-        if spec_funcs and v.startswith("@"):
-            if not v in ("@sizeof"):
-                lex.error("Only const-valued special functions may be used where value is expected")
-            lex.expect("(")
-            if v == "@sizeof":
-                args = [parse_type(lex)]
-                lex.expect(")")
+def unescape(b):
+    "Decode escapes (\\xNN, \\0, \\n, \\\") in contents of a string literal (bytes)."
+    if b"\\" not in b:
+        return b
+    parts = b.split(b"\\")
+    res = bytearray(parts[0])
+    for p in parts[1:]:
+        c = p[:1]
+        if c == b"x":
+            if len(p) < 3:
+                raise ValueError(p)
+            res.append(int(p[1:3], 16))
+            res += p[3:]
+        else:
+            res += _ESCAPES[c]
+            res += p[1:]
+    return bytes(res)
+
+
+class Parser:
+    """PseudoC parser. All parsing state (type table, including struct
+    types map, auto-label counter) and options are held in the instance,
+    so separate instances can be used concurrently. An instance is meant
+    to parse one module (auto-labels are numbered across its functions).
+
+    split_bb_after_call: whether to start new basic block after a call
+    instruction, defaults to config.SPLIT_BB_AFTER_CALL.
+    pack_data: whether to parse data initializers into Data.content
+    (instead of Data.desc), defaults to config.PACK_DATA."""
+
+    def __init__(self, types=None, split_bb_after_call=None, pack_data=None):
+        if types is None:
+            types = TypeTable()
+        self.types = types
+        self.struct_map = types.structs
+        if split_bb_after_call is None:
+            split_bb_after_call = config.SPLIT_BB_AFTER_CALL
+        self.split_bb_after_call = split_bb_after_call
+        if pack_data is None:
+            pack_data = config.PACK_DATA
+        self.pack_data = pack_data
+        self.label_cnt = 0
+
+    def parse_var(self, lex):
+        typ = self.parse_type(lex)
+        # Identifiers and operators are interned, as the same few names are
+        # repeated across many instructions.
+        name = intern(lex.expect_re(LEX_IDENT, err="expected identifier"))
+        reg = parse_reg(lex, name)
+        return typ, name, reg
+
+    def parse_type_mod(self, lex, typ):
+        while True:
+            if lex.match("*"):
+                typ = self.types.ptr(typ)
+            elif lex.check("["):
+                dims = []
+                while lex.match("["):
+                    dim = self.parse_val(lex).val
+                    assert isinstance(dim, int)
+                    dims.append(dim)
+                    lex.expect("]")
+                for dim in reversed(dims):
+                    typ = self.types.arr(typ, dim)
             else:
-                args = parse_args(lex)
-            return Arg(SpecFunc(v, *args))
+                break
+        return typ
+
+    def parse_type(self, lex):
+        if lex.match("struct"):
+            name = lex.expect_re(LEX_SIMPLE_IDENT, "expected structure identifier")
+            typ = self.types.struct(name)
         else:
-            reg =  parse_reg(lex, v)
-    else:
-        v = lex.match_re(LEX_NUM)
+            typ = parse_type_name(lex)
+            if typ is None:
+                return None
+            typ = self.types.prim(typ)
+        return self.parse_type_mod(lex, typ)
+
+    def parse_global_type_and_name(self, lex):
+        typ = None
+        name = None
+        parsed = lex.match_re(LEX_QUOTED_IDENT)
+        if parsed:
+            # If we matched a quoted id at the beginning, we know there's no type.
+            name = parsed[1:-1]
+        else:
+            parsed = lex.expect_re(LEX_SIMPLE_IDENT, "expected a simple identifier")
+            if parsed == "struct":
+                parsed = lex.expect_re(LEX_SIMPLE_IDENT, "expected structure identifier")
+                typ = self.types.struct(parsed)
+            elif parsed in TYPE_NAMES:
+                typ = self.types.prim(parsed)
+            else:
+                # Otherwise what we parsed is a name.
+                name = parsed
+
+            if typ:
+                typ = self.parse_type_mod(lex, typ)
+                name = lex.match_re(LEX_SIMPLE_IDENT)
+                if not name:
+                    name = lex.match_re(LEX_QUOTED_IDENT)
+                if not name:
+                    # If that was a bare structure name followed by {, i.e. a
+                    # structure type definition, it's ok to not have a name,
+                    # otherwise report error.
+                    if isinstance(typ, StructType) and lex.check("{"):
+                        pass
+                    else:
+                        lex.error("identifer expected after type")
+
+        return (typ, name)
+
+    # Returns Arg object with .val and possibly .reg initialized.
+    def parse_val(self, lex, spec_funcs=False):
+        reg = None
+        v = lex.match_re(LEX_IDENT)
         if v:
-            v = int(v, 0)
+            v = intern(v)
+            if spec_funcs and v.startswith("@"):
+                if not v in ("@sizeof"):
+                    lex.error("Only const-valued special functions may be used where value is expected")
+                lex.expect("(")
+                if v == "@sizeof":
+                    args = [self.parse_type(lex)]
+                    lex.expect(")")
+                else:
+                    args = self.parse_args(lex)
+                return Arg(SpecFunc(v, *args))
+            else:
+                reg =  parse_reg(lex, v)
         else:
-            v = lex.match_re(LEX_STR)
+            v = lex.match_re(LEX_NUM)
             if v:
-                v = InlineStr(v[1:-1])
+                v = int(v, 0)
             else:
-                lex.error("expected value (var or const)")
-    a = Arg(v)
-    if reg is not None:
-        a.reg = reg
-    return a
-
-
-def parse_args(lex):
-    # "(" already matched
-    res = []
-    while not lex.check(")"):
-        res.append(parse_val(lex, spec_funcs=True))
-        if not lex.match(","):
-            break
-    lex.expect(")")
-    return res
-
-
-def parse_params(lex):
-    # "(" already matched
-    names = []
-    types = []
-    while not lex.check(")"):
-        typ, name, reg = parse_var(lex)
-        names.append(name)
-        types.append(typ)
-        if not lex.match(","):
-            break
-    lex.expect(")")
-    return names, types
-
-
-def parse_if_expr(lex):
-    res = []
-    lex.expect("(")
-    res.append(parse_val(lex))
-    if not lex.check(")"):
-        res.append(lex.expect_re(LEX_OP))
-        res.append(parse_val(lex))
-    lex.expect(")")
-    return res
-
-
-def get_label():
-    global LABEL_CNT
-    c = LABEL_CNT
-    LABEL_CNT += 1
-    return "_l%d" % c
-
-
-def make_call(dest, name, *args):
-    if name.startswith("@"):
-        # Special name
-        return Insn(dest, name, *args), False
-    else:
-        return Insn(dest, "call", name, *args), config.SPLIT_BB_AFTER_CALL
-
-
-TYPE_SIZES = {
-    "i8": 1,
-    "u8": 1,
-    "i16": 2,
-    "u16": 2,
-    "i32": 4,
-    "u32": 4,
-    "i64": 8,
-    "u64": 8,
-    "void*": 4,
-}
-
-def parse_data(lex, name):
-    desc = []
-    size = 0
-    lex.expect("{")
-    while not lex.match("}"):
-        if lex.check('"'):
-            s = lex.match_re(LEX_STR)
-            b = s[1:-1].encode()
-
-            def unesc(m):
-                v = m.group(0)[1:]
-                if v.startswith(b"x"):
-                    v = bytes([int(v[1:], 16)])
+                v = lex.match_re(LEX_STR)
+                if v:
+                    v = InlineStr(v[1:-1])
                 else:
-                    v = {b"0": b"\0", b'"': b'"', b"n": b"\n"}[v]
-                return v
-            b = re.sub(rb"(\\x..|\\.)", unesc, b)
-
-            desc.append(("str", s, b))
-            size += len(b)
-        elif lex.match('('):
-            typ = parse_simple_type(lex)
-            lex.expect(")")
-            desc.append((typ, parse_val(lex)))
-            size += TYPE_SIZES[typ]
+                    lex.error("expected value (var or const)")
+        a = Arg(v)
+        if reg is not None:
+            a.reg = reg
+        return a
+
+    def parse_args(self, lex):
+        # "(" already matched
+        res = []
+        while not lex.check(")"):
+            res.append(self.parse_val(lex, spec_funcs=True))
+            if not lex.match(","):
+                break
+        lex.expect(")")
+        return res
+
+    def parse_params(self, lex):
+        # "(" already matched
+        names = []
+        types = []
+        while not lex.check(")"):
+            typ, name, reg = self.parse_var(lex)
+            names.append(name)
+            types.append(typ)
+            if not lex.match(","):
+                break
+        lex.expect(")")
+        return names, types
+
+    def parse_if_expr(self, lex):
+        res = []
+        lex.expect("(")
+        res.append(self.parse_val(lex))
+        if not lex.check(")"):
+            res.append(intern(lex.expect_re(LEX_OP)))
+            res.append(self.parse_val(lex))
+        lex.expect(")")
+        return res
+
+    def get_label(self):
+        c = self.label_cnt
+        self.label_cnt += 1
+        return "_l%d" % c
+
+    def make_call(self, dest, name, *args):
+        if name.startswith("@"):
+            # Special name
+            return Insn(dest, name, *args), False
         else:
-            lex.error("Unexpected syntax in data element")
-        lex.match(",")
-    data = Data(name, desc)
-    data.size = size
-    return data
-
-
-def parse(f):
-    STRUCT_TYPE_MAP.clear()
-    mod = Module()
-    bb = None
-    prev_bb = None
-    label2bb = {}
-    lex = Lexer()
-    start_new_bb = True
-    cfg = None
-
-    def get_bb(label):
-        bb = label2bb.get(label)
-        if bb is None:
-            bb = label2bb[label] = BBlock(label, [])
-        return bb
-
-    for l in f:
-        l = l.strip()
-        if not l or l.startswith("#"):
-            continue
-
-        lex.init(l)
-
-        if cfg is None:
-            typ, name = parse_global_type_and_name(lex)
-
-            if isinstance(typ, StructType) and lex.match("{"):
-                # Structure declaration
-                if typ.fields is not None:
-                    lex.error("duplicate struct definition: %s" % typ.name)
-                fields = []
-                while not lex.match("}"):
-                    typ_fld = parse_type(lex)
-                    fldname = lex.match_re(LEX_SIMPLE_IDENT)
-                    fields.append((fldname, typ_fld))
-                    lex.match(",")
-                typ.fields = fields
-                mod.add(typ)
-                continue
+            return Insn(dest, "call", name, *args), self.split_bb_after_call
+
+    def parse_data(self, lex, name, typ=None):
+        pack = self.pack_data
+        layout = DEFAULT_LAYOUT
+        desc = []
+        buf = bytearray()
+        relocs = []
+        align = 1
+        size = 0
+        lex.expect("{")
+        while True:
+            arg = None
+            # Fast path: match whole element (and following comma) at once.
+            m = _DATA_ELEM.match(lex.s, lex.pos)
+            if m:
+                lex.pos = m.end()
+                lit, el_typ, num, ident, str_val = m.groups()
+                if lit is None:
+                    if num is not None:
+                        val = int(num, 0)
+                    elif ident is not None:
+                        val = intern(ident)
+                    else:
+                        val = InlineStr(str_val[1:-1])
+                    if el_typ[0] == "v":
+                        el_typ = "void*"
+            elif lex.match("}"):
+                break
+            elif lex.check('"'):
+                lit = lex.match_re(LEX_STR)
+                lex.match(",")
             elif lex.match("("):
-                cfg = Func(name)
-                cfg.res_type = typ
-                cfg.params, cfg.param_types = parse_params(lex)
-                lex.expect("{")
-                label2bb = {}
-                start_new_bb = True
-                bb = None
-                prev_bb = None
-            elif lex.match("="):
-                data = parse_data(lex, name)
-                data.type = typ
-                mod.contents.append(data)
+                lit = None
+                el_typ = parse_simple_type(lex)
+                lex.expect(")")
+                arg = self.parse_val(lex)
+                val = arg.val
+                lex.match(",")
             else:
-                lex.error("expected function, data, or structure definition")
-            continue
-
-        if lex.match("}"):
-            cfg.calc_preds()
-            mod.contents.append(cfg)
-            cfg = None
-            continue
-
-        is_label = l.endswith(":")
-        if is_label or start_new_bb:
-            if is_label:
-                label = l[:-1]
+                lex.error("Unexpected syntax in data element")
+
+            if lit is not None:
+                try:
+                    b = unescape(lit[1:-1].encode())
+                except (KeyError, ValueError):
+                    lex.error("unsupported escape in string: %s" % lit)
+                if pack:
+                    buf += b
+                else:
+                    desc.append(("str", lit, b))
+                size += len(b)
             else:
-                label = get_label()
-            if True:
-                bb = get_bb(label)
-                cfg.bblocks.append(bb)
-                if prev_bb:
-                    # Fallthru edge
-                    prev_bb.succs.append(bb)
-                prev_bb = bb
-            start_new_bb = False
-            if is_label:
+                if pack:
+                    a = layout.pack_elem(buf, relocs, el_typ, val)
+                    if a > align:
+                        align = a
+                else:
+                    desc.append((el_typ, arg or Arg(val)))
+                size += TYPE_SIZES[el_typ]
+
+        data = Data(name, desc, typ)
+        data.size = size
+        if pack:
+            data.desc = None
+            data.content = buf
+            data.relocs = relocs
+            if typ is not None:
+                align = max(align, layout.align(typ))
+            data.align = align
+        return data
+
+    def parse_iter(self, f, first_lineno=1):
+        """Parse PseudoC program from line iterable f, yielding top-level items
+        (Func, Data, StructType) one by one, as soon as each is fully parsed.
+        Struct types are shared between items via .struct_map, and may be
+        forward-referenced (with .fields filled in once definition is seen).
+        first_lineno is line number of the first line (for error messages)."""
+        bb = None
+        prev_bb = None
+        label2bb = {}
+        lex = Lexer()
+        start_new_bb = True
+        cfg = None
+
+        def get_bb(label):
+            bb = label2bb.get(label)
+            if bb is None:
+                bb = label2bb[label] = BBlock(label, [])
+            return bb
+
+        for lineno, l in enumerate(f, first_lineno):
+            l = l.strip()
+            if not l or l.startswith("#"):
+                continue
+
+            lex.init(l, lineno)
+
+            if cfg is None:
+                typ, name = self.parse_global_type_and_name(lex)
+
+                if isinstance(typ, StructType) and lex.match("{"):
+                    # Structure declaration
+                    if typ.fields is not None:
+                        lex.error("duplicate struct definition: %s" % typ.name)
+                    fields = []
+                    while not lex.match("}"):
+                        typ_fld = self.parse_type(lex)
+                        fldname = lex.match_re(LEX_SIMPLE_IDENT)
+                        fields.append((fldname, typ_fld))
+                        lex.match(",")
+                    typ.fields = fields
+                    yield typ
+                    continue
+                elif lex.match("("):
+                    cfg = Func(name)
+                    cfg.res_type = typ
+                    cfg.params, cfg.param_types = self.parse_params(lex)
+                    lex.expect("{")
+                    label2bb = {}
+                    start_new_bb = True
+                    bb = None
+                    prev_bb = None
+                elif lex.match("="):
+                    yield self.parse_data(lex, name, typ)
+                else:
+                    lex.error("expected function, data, or structure definition")
+                continue
+
+            if lex.match("}"):
+                cfg.calc_preds()
+                yield cfg
+                cfg = None
                 continue
 
-        insn = None
-
-        # Context before having parsed anything, for error messages.
-        lex_ctx = lex.l
-
-        if lex.match("goto"):
-            label = lex.expect_re(LEX_IDENT)
-            bb.succs.append(get_bb(label))
-            prev_bb = None
-            start_new_bb = True
-
-        elif lex.match("if"):
-            expr = parse_if_expr(lex)
-            lex.expect("goto")
-            label = lex.expect_re(LEX_IDENT)
-            bb.succs.append(get_bb(label))
-            if not lex.eol():
-                lex.expect("else")
-                # Currently "goto" after "else" is optional.
-                lex.match("goto")
+            is_label = l.endswith(":")
+            if is_label or start_new_bb:
+                if is_label:
+                    label = l[:-1]
+                else:
+                    label = self.get_label()
+                if True:
+                    bb = get_bb(label)
+                    cfg.bblocks.append(bb)
+                    if prev_bb:
+                        # Fallthru edge
+                        prev_bb.succs.append(bb)
+                    prev_bb = bb
+                start_new_bb = False
+                if is_label:
+                    continue
+
+            insn = None
+
+            # Position before having parsed anything, for error messages.
+            ctx_pos = lex.pos
+
+            if lex.match("goto"):
                 label = lex.expect_re(LEX_IDENT)
                 bb.succs.append(get_bb(label))
                 prev_bb = None
-            insn = Insn("", "if", *expr)
-            start_new_bb = True
+                start_new_bb = True
 
-        elif lex.match("return"):
-            if not lex.eol():
-                arg = parse_val(lex)
-                insn = Insn("", "return", arg)
-            else:
-                insn = Insn("", "return")
-            prev_bb = None
+            elif lex.match("if"):
+                expr = self.parse_if_expr(lex)
+                lex.expect("goto")
+                label = lex.expect_re(LEX_IDENT)
+                bb.succs.append(get_bb(label))
+                if not lex.eol():
+                    lex.expect("else")
+                    # Currently "goto" after "else" is optional.
+                    lex.match("goto")
+                    label = lex.expect_re(LEX_IDENT)
+                    bb.succs.append(get_bb(label))
+                    prev_bb = None
+                insn = Insn("", "if", *expr)
+                start_new_bb = True
+
+            elif lex.match("return"):
+                if not lex.eol():
+                    arg = self.parse_val(lex)
+                    insn = Insn("", "return", arg)
+                else:
+                    insn = Insn("", "return")
+                prev_bb = None
 
-        elif lex.match("@nop"):
-            insn = Insn("", "@nop")
+            elif lex.match("@nop"):
+                insn = Insn("", "@nop")
 
-        else:
-            ptr_typ = None
-            if lex.match("*"):
-                lex.expect("(")
-                ptr_typ = parse_type(lex)
-                assert isinstance(ptr_typ, PtrType)
-                ptr_typ = ptr_typ.el_type
-                lex.expect(")")
-            dest_typ, dest, dest_reg = parse_var(lex)
-
-            if lex.match("="):
-                if ptr_typ is None and not dest.startswith("$"):
-                    lex.error("Can assign only to local variables (must start with '$')", ctx=lex_ctx)
-
-                unary_op = lex.match_re(LEX_UNARY_OP)
-                if unary_op:
-                    # Unary op
-                    typ = None
-                    args = []
-                    if unary_op == "*":
-                        op = "@load"
-                        if lex.match("("):
-                            typ = parse_type(lex)
-                            assert isinstance(typ, PtrType)
-                            typ = typ.el_type
+            else:
+                ptr_typ = None
+                if lex.match("*"):
+                    lex.expect("(")
+                    ptr_typ = self.parse_type(lex)
+                    assert isinstance(ptr_typ, PtrType)
+                    ptr_typ = ptr_typ.el_type
+                    lex.expect(")")
+                dest_typ, dest, dest_reg = self.parse_var(lex)
+
+                if lex.match("="):
+                    if ptr_typ is None and not dest.startswith("$"):
+                        lex.error("Can assign only to local variables (must start with '$')", ctx=l[ctx_pos:])
+
+                    unary_op = lex.match_re(LEX_UNARY_OP)
+                    if unary_op:
+                        # Unary op
+                        typ = None
+                        args = []
+                        if unary_op == "*":
+                            op = "@load"
+                            if lex.match("("):
+                                typ = self.parse_type(lex)
+                                assert isinstance(typ, PtrType)
+                                typ = typ.el_type
+                                lex.expect(")")
+                        elif unary_op == "(":
+                            op = "@cast"
+                            typ = self.parse_type(lex)
                             lex.expect(")")
-                    elif unary_op == "(":
-                        op = "@cast"
-                        typ = parse_type(lex)
-                        lex.expect(")")
-                        args.append(typ)
-                    args.append(parse_val(lex))
-                    if unary_op == "*":
-                        args.append(typ)
-                    insn = Insn(dest, op, *args)
-                else:
-                    arg1 = parse_val(lex)
-                    if lex.eol():
-                        if ptr_typ is None:
-                            # Move
-                            insn = Insn(dest, "=", arg1)
+                            args.append(typ)
                         else:
-                            # Store
-                            insn = Insn("", "@store", dest, ptr_typ, arg1)
+                            op = unary_op
+                        args.append(self.parse_val(lex))
+                        if unary_op == "*":
+                            args.append(typ)
+                        insn = Insn(dest, op, *args)
                     else:
-                        # Binary op
-                        op = lex.expect_re(LEX_OP)
-                        if op == "(":
-                            # Function call
-                            args = parse_args(lex)
-                            insn, start_new_bb = make_call(dest, arg1.val, *args)
+                        arg1 = self.parse_val(lex)
+                        if lex.eol():
+                            if ptr_typ is None:
+                                # Move
+                                insn = Insn(dest, "=", arg1)
+                            else:
+                                # Store
+                                insn = Insn("", "@store", dest, ptr_typ, arg1)
                         else:
-                            arg2 = parse_val(lex)
-                            insn = Insn(dest, op, arg1, arg2)
-                insn.reg = dest_reg
-                insn.typ = dest_typ
-            elif lex.match("("):
-                # Function call
-                args = parse_args(lex)
-                insn, start_new_bb = make_call("", dest, *args)
-            else:
-                lex.error("Unexpected syntax")
+                            # Binary op
+                            op = intern(lex.expect_re(LEX_OP))
+                            if op == "(":
+                                # Function call
+                                args = self.parse_args(lex)
+                                insn, start_new_bb = self.make_call(dest, arg1.val, *args)
+                            else:
+                                arg2 = self.parse_val(lex)
+                                insn = Insn(dest, op, arg1, arg2)
+                    insn.reg = dest_reg
+                    insn.typ = dest_typ
+                elif lex.match("("):
+                    # Function call
+                    args = self.parse_args(lex)
+                    insn, start_new_bb = self.make_call("", dest, *args)
+                else:
+                    lex.error("Unexpected syntax")
+
+            assert lex.eol(), "Unexpected content at end of line: %r" % lex.l
 
-        assert lex.eol(), "Unexpected content at end of line: %r" % lex.l
+            if insn:
+                bb.insns.append(insn)
 
-        if insn:
-            bb.insns.append(insn)
+    def parse(self, f):
+        mod = Module(self.types)
+        for item in self.parse_iter(f):
+            mod.add(item)
+        return mod
 
-    #print(label2bb)
-    #print(cfg.bblocks)
-    #cfg.simple_print()
 
-    return mod
+def parse_iter(f, types=None):
+    return Parser(types).parse_iter(f)
+
+
+def parse(f):
+    return Parser().parse(f)
 
 
 def __main__():
@@ -0,0 +1,422 @@
+# PseudoC-IR - Simple Program Analysis/Compiler Intermediate Representation
+#
+# Copyright (c) 2020-2021 Paul Sokolovsky
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# Python backend: compiles a Func to Python source, then to a code object
+# (with compile()), which is run with pseudoc.interp runtime (memory,
+# symbols, externs) by Interp(mod, jit=True).
+#
+# Generated function is a state machine over blocks: "while 1:" loop
+# dispatching on block index b with a tree of "if b < <mid>:" tests (so
+# it takes O(log(number of blocks)) comparisons), with a block's code at
+# each leaf. Jumps set b and "continue" the loop. Values are Python locals (one per storage key, see
+# interp.dest_key()), arithmetic with wrapping to type is inlined, and phi
+# copies are tuple assignments on edges.
+#
+# Everything module-specific (addresses of symbols and strings, sizes of
+# types, callees) is referenced via globals K0, K1, ..., which are set
+# per Interp, so code objects are cached by function text (fingerprint)
+# and reused e.g. for the same function in another module.
+
+from collections import OrderedDict
+import hashlib
+import io
+import re
+import struct
+
+from .ir import InlineStr, SpecFunc
+from . import interp as rt
+
+
+# Version of generated code, part of fingerprint.
+VERSION = 3
+
+# LRU cache of code objects, by fingerprint.
+_cache = OrderedDict()
+MAX_CACHED_CODES = 1000
+
+
+def fingerprint(func, scratch=()):
+    buf = io.StringIO()
+    func.dump(file=buf)
+    h = hashlib.sha256()
+    h.update(("%d %d %d %r\n" % (VERSION, rt.PTR_SIZE, func.is_ssa, sorted(scratch))).encode())
+    h.update(buf.getvalue().encode())
+    return h.hexdigest()
+
+
+def clear_cache():
+    _cache.clear()
+
+
+def _const_key(val, call=False):
+    if call:
+        return ("call", val)
+    if isinstance(val, InlineStr):
+        return ("str", val.s)
+    if isinstance(val, SpecFunc):
+        return ("spec", str(val))
+    return ("sym", val)
+
+
+def const_args(func, scratch=()):
+    """Yield (key, val, is_call) for operands of func which are referenced via
+    K globals, in order of first appearance. Same order is used by code
+    generation and instantiation."""
+    seen = set()
+    for bb in func.bblocks:
+        for insn in bb.insns:
+            for i, a in enumerate(insn.args):
+                val = a.val
+                call = insn.op == "call" and i == 0
+                if isinstance(val, int) or not isinstance(val, (str, InlineStr, SpecFunc)):
+                    continue
+                if isinstance(val, str) and (val.startswith("$") or val == "@undef"):
+                    continue
+                if val in scratch and not call:
+                    continue
+                if insn.op == "if" and i == 1:
+                    continue
+                key = _const_key(val, call)
+                if key not in seen:
+                    seen.add(key)
+                    yield key, val, call
+
+
+def _ident(name):
+    return re.sub(r"[^A-Za-z_0-9]", "_", name)
+
+
+def py_name(func):
+    return "f_" + _ident(func.name)
+
+
+class CodeGen:
+
+    def __init__(self, func, scratch=()):
+        self.func = func
+        self.lines = []
+        self.consts = {key: "K%d" % i for i, (key, val, call) in enumerate(const_args(func, scratch))}
+        self.is_ssa = func.is_ssa
+        self.vars = {}
+        # Symbols which are stack slots (Func.stack_slots), are locals
+        # holding their addresses.
+        self.scratch = scratch
+        self.bb_idx = {bb: i for i, bb in enumerate(func.bblocks)}
+        # Whether function allocates on stack, and so needs to free it on
+        # return.
+        self.needs_sp = False
+        for bb in func.bblocks:
+            for insn in bb.insns:
+                if insn.op == "@alloca" or any(a.val in scratch for a in insn.args if isinstance(a.val, str)):
+                    self.needs_sp = True
+
+    def emit(self, indent, s):
+        self.lines.append("    " * indent + s)
+
+    def var(self, key):
+        "Python local for value by its storage key (or var name)."
+        v = self.vars.get(key)
+        if v is None:
+            name = key if isinstance(key, str) else key.dest_name()
+            v = self.vars[key] = "v%d_%s" % (len(self.vars), _ident(name.lstrip("$")))
+        return v
+
+    def dest(self, insn):
+        return self.var(rt.dest_key(insn, self.is_ssa))
+
+    def arg(self, a, call=False):
+        val = a.val
+        if isinstance(val, int):
+            return str(val)
+        if a.defi is not None or a.reg:
+            return self.var(rt.arg_key(a, self.is_ssa))
+        if isinstance(val, str):
+            if val.startswith("$") or (val in self.scratch and not call):
+                return self.var(val)
+            if val == "@undef":
+                return "0"
+        return self.consts[_const_key(val, call)]
+
+    def wrap(self, expr, prim):
+        fmt = rt.PRIMS[prim][0]
+        bits = 1 if prim == "i1" else struct.calcsize(fmt) * 8
+        mask = (1 << bits) - 1
+        if fmt[1].islower() and prim != "i1":
+            half = 1 << (bits - 1)
+            return "(((%s) + %d) & %d) - %d" % (expr, half, mask, half)
+        return "(%s) & %d" % (expr, mask)
+
+    def gen(self):
+        func = self.func
+        params = [self.var(p) for p in func.params]
+        blocks = []
+        for bb in func.bblocks:
+            self.lines = []
+            self.gen_bb(bb)
+            blocks.append(self.lines or ["pass"])
+        self.lines = []
+        nblocks = len(blocks)
+        self.emit(0, "def %s(%s):" % (py_name(func), ", ".join(["%s=0" % p for p in params])))
+        locs = [v for v in self.vars.values() if v not in params]
+        if locs:
+            self.emit(1, "%s = 0" % " = ".join(locs))
+        slots = [self.vars[n] for n in self.scratch if n in self.vars]
+        if self.needs_sp:
+            self.emit(1, "sp = len(mem)")
+        for v in slots:
+            self.emit(1, "%s = alloca(%d)" % (v, rt.PTR_SIZE))
+        self.emit(1, "b = 0")
+        if nblocks:
+            self.emit(1, "while 1:")
+            self.gen_dispatch(2, blocks, 0, nblocks)
+        self.gen_return(1, None)
+        return "\n".join(self.lines) + "\n"
+
+    def gen_dispatch(self, indent, blocks, lo, hi):
+        "Bisect on b for blocks[lo:hi], emitting code of a block at leaves."
+        if hi - lo == 1:
+            for l in blocks[lo]:
+                self.emit(indent, l)
+            return
+        mid = (lo + hi) // 2
+        self.emit(indent, "if b < %d:" % mid)
+        self.gen_dispatch(indent + 1, blocks, lo, mid)
+        self.emit(indent, "else:")
+        self.gen_dispatch(indent + 1, blocks, mid, hi)
+
+    def gen_return(self, indent, val):
+        if self.needs_sp:
+            self.emit(indent, "del mem[sp:]")
+        self.emit(indent, "return %s" % val)
+
+    def gen_jump(self, indent, bb, succ):
+        # Phi copies for edge bb -> succ.
+        idx = succ.preds.index(bb)
+        dests = []
+        srcs = []
+        for insn in succ.insns:
+            if insn.op == "@phi":
+                dests.append(self.dest(insn))
+                srcs.append(self.arg(insn.args[idx]))
+        if dests:
+            self.emit(indent, "%s = %s" % (", ".join(dests), ", ".join(srcs)))
+        self.emit(indent, "b = %d" % self.bb_idx[succ])
+        self.emit(indent, "continue")
+
+    def gen_bb(self, bb):
+        term = None
+        for insn in bb.insns:
+            if insn.op in ("if", "return"):
+                term = insn
+            elif insn.op != "@phi":
+                self.gen_insn(insn)
+        if term is not None and term.op == "return":
+            self.gen_return(0, self.arg(term.args[0]) if term.args else None)
+            return
+        if not bb.succs:
+            self.gen_return(0, None)
+            return
+        if term is not None:
+            args = term.args
+            if len(args) == 1:
+                cond = self.arg(args[0])
+            else:
+                op = args[1].val
+                a = self.arg(args[0])
+                c = self.arg(args[2])
+                if op in ("/", "%"):
+                    cond = "%s(%s, %s)" % ("_div" if op == "/" else "_mod", a, c)
+                elif op in ("<<", ">>"):
+                    cond = "%s %s (%s & 63)" % (a, op, c)
+                elif op in rt.COND_OPS or op in rt.BIN_OPS:
+                    cond = "%s %s %s" % (a, op, c)
+                else:
+                    self.emit(0, "_error(%r)" % ("%s: unsupported condition op: %s" % (self.func.name, op)))
+                    return
+            succs = bb.succs
+            if len(succs) == 1:
+                succs = succs * 2
+            self.emit(0, "if %s:" % cond)
+            self.gen_jump(1, bb, succs[0])
+            self.emit(0, "else:")
+            self.gen_jump(1, bb, succs[1])
+        else:
+            self.gen_jump(0, bb, bb.succs[0])
+
+    def gen_insn(self, insn):
+        op = insn.op
+        args = insn.args
+        if op == "@nop":
+            return
+        d = None
+        if insn.dest:
+            d = self.dest(insn)
+        try:
+            prim = rt._prim_name(insn.typ)
+            expr = None
+            if op == "=":
+                expr = self.arg(args[0])
+                if insn.typ is not None:
+                    expr = self.wrap(expr, prim)
+            elif op == "@param":
+                expr = self.var(self.func.params[args[0].val])
+            elif op == "call":
+                call_args = ", ".join([self.arg(a) for a in args[1:]])
+                name = args[0].val
+                if isinstance(name, int) or name.startswith("$"):
+                    expr = "call_addr(%s, [%s])" % (self.arg(args[0]), call_args)
+                else:
+                    expr = "%s(%s)" % (self.arg(args[0], call=True), call_args)
+            elif op == "@load":
+                lprim = rt._prim_name(args[1].val)
+                expr = "ld_%s(%s)" % (_ident(lprim), self.arg(args[0]))
+                if lprim == "i1":
+                    expr = self.wrap(expr, lprim)
+            elif op == "@store":
+                sprim = rt._prim_name(args[1].val)
+                self.emit(0, "st_%s(%s, %s)" % (_ident(sprim), self.arg(args[0]), self.arg(args[2])))
+                return
+            elif op == "@cast":
+                expr = self.wrap(self.arg(args[1]), rt._prim_name(args[0].val))
+            elif op == "@alloca":
+                self.needs_sp = True
+                expr = "alloca(%s)" % self.arg(args[0])
+            elif len(args) == 1 and op in rt.UNARY_OPS:
+                a = self.arg(args[0])
+                if op == "!":
+                    expr = "0 if %s else 1" % a
+                else:
+                    expr = self.wrap("%s%s" % (op, a), prim)
+            elif len(args) == 2:
+                a = self.arg(args[0])
+                c = self.arg(args[1])
+                if op in rt.CMP_OPS:
+                    expr = "1 if %s %s %s else 0" % (a, op, c)
+                elif op in ("/", "%"):
+                    expr = self.wrap("%s(%s, %s)" % ("_div" if op == "/" else "_mod", a, c), prim)
+                elif op in ("<<", ">>"):
+                    if isinstance(args[1].val, int):
+                        c = str(args[1].val & 63)
+                    else:
+                        c = "(%s & 63)" % c
+                    expr = self.wrap("%s %s %s" % (a, op, c), prim)
+                elif op in rt.BIN_OPS:
+                    expr = self.wrap("%s %s %s" % (a, op, c), prim)
+            if expr is None:
+                self.emit(0, "_error(%r)" % ("%s: unsupported insn" % rt.func_insn_str(self, insn)))
+                return
+        except rt.InterpError as e:
+            self.emit(0, "_error(%r)" % ("%s: %s" % (rt.func_insn_str(self, insn), e)))
+            return
+        if d is None:
+            self.emit(0, expr)
+        else:
+            self.emit(0, "%s = %s" % (d, expr))
+
+
+def gen_source(func, scratch=()):
+    return CodeGen(func, scratch).gen()
+
+
+def compile_func(func, scratch=()):
+    """Get code object for func, from cache if possible. scratch is set of
+    symbols which are stack slots."""
+    fp = fingerprint(func, scratch)
+    code = _cache.get(fp)
+    if code is not None:
+        _cache.move_to_end(fp)
+        return code
+    src = gen_source(func, scratch)
+    code = _cache[fp] = compile(src, "<pseudoc %s>" % func.name, "exec")
+    if len(_cache) > MAX_CACHED_CODES:
+        _cache.popitem(last=False)
+    return code
+
+
+# Runtime of generated code.
+
+def _loader(mem, fmt):
+    unpack = struct.Struct(fmt).unpack_from
+
+    def ld(addr):
+        if addr < rt.MEM_START:
+            raise rt._bad_addr(addr)
+        try:
+            return unpack(mem, addr)[0]
+        except struct.error:
+            raise rt._bad_addr(addr)
+    return ld
+
+
+def _storer(mem, fmt, w):
+    pack = struct.Struct(fmt).pack_into
+
+    def st(addr, v):
+        if addr < rt.MEM_START:
+            raise rt._bad_addr(addr)
+        try:
+            pack(mem, addr, w(v))
+        except struct.error:
+            raise rt._bad_addr(addr)
+    return st
+
+
+def _error(msg):
+    raise rt.InterpError(msg)
+
+
+def runtime_globals(interp):
+    ns = {
+        "mem": interp.mem,
+        "alloca": interp.alloc,
+        "call_addr": interp.call_addr,
+        "_div": rt._div,
+        "_mod": rt._mod,
+        "_error": _error,
+    }
+    for prim, (fmt, w) in rt.PRIMS.items():
+        ns["ld_" + _ident(prim)] = _loader(interp.mem, fmt)
+        ns["st_" + _ident(prim)] = _storer(interp.mem, fmt, w)
+    return ns
+
+
+def jit_module(interp):
+    "Compile all functions of interp's module, setting FuncCode.pyfunc."
+    base = runtime_globals(interp)
+    # Callees may be not compiled yet, so are resolved at the end.
+    fixups = []
+    for code in interp.code.values():
+        func = code.func
+        scratch = interp.scratch_symbols(func)
+        ns = dict(base)
+        for i, (key, val, call) in enumerate(const_args(func, scratch)):
+            if call:
+                fixups.append((ns, "K%d" % i, val))
+            else:
+                ns["K%d" % i] = interp.const_val(val)
+        exec(compile_func(func, scratch), ns)
+        code.pyfunc = ns[py_name(func)]
+    for ns, k, name in fixups:
+        ns[k] = interp.callee(name)
@@ -0,0 +1,424 @@
+# PseudoC-IR - Simple Program Analysis/Compiler Intermediate Representation
+#
+# Copyright (c) 2020-2021 Paul Sokolovsky
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# Linear scan register allocator (-x pseudoc.regalloc.linear_scan).
+#
+# Works on SSA form (converting function to it first if needed). Blocks
+# are laid out in reverse postorder, and each value (Insn with dest) gets
+# a single live interval covering all points where it's live (lifetime
+# holes are not tracked). Intervals are scanned in order of start, with
+# active intervals kept in heaps, so allocation is O(n log n).
+#
+# Registers are split into caller-saved and callee-saved classes. Values
+# live across a call (which, with config.SPLIT_BB_AFTER_CALL, are values
+# live out of a block ending with a call) can be assigned only callee-saved
+# registers; other values prefer caller-saved ones.
+#
+# When registers run out, the interval ending furthest is spilled: its
+# value is stored to a spill slot (symbol __spillN, listed in
+# Func.stack_slots) after definition, and loaded back before each use.
+# Phis using a spilled value are spilled too.
+# A spilled phi is removed, and its incoming values are stored to its slot
+# at the end of predecessors instead (splitting critical edges, and with
+# loads of the slot there done before the store, for parallel copy
+# semantics).
+# As these loads/stores have short intervals which must not be spilled
+# again, allocation is then redone, until no more spills are needed.
+#
+# Insn.reg of each value, and Arg.reg of its uses, are set to the
+# assigned register.
+
+from heapq import heappush, heappop
+from bisect import bisect_right
+import logging
+
+from .ir import Func, BBlock, Insn, Arg
+from . import analysis
+from . import dataflow
+
+
+_log = logging.getLogger(__name__)
+
+
+# name -> (caller-saved regs, callee-saved regs)
+TARGETS = {
+    "generic": (
+        ["r0", "r1", "r2", "r3", "r4", "r5", "r6", "r7"],
+        ["r8", "r9", "r10", "r11"],
+    ),
+    # System V AMD64 ABI (rsp, rbp excluded).
+    "x86_64": (
+        ["rax", "rcx", "rdx", "rsi", "rdi", "r8", "r9", "r10", "r11"],
+        ["rbx", "r12", "r13", "r14", "r15"],
+    ),
+    # AAPCS (sp, lr, pc, fp, r9 excluded).
+    "arm": (
+        ["r0", "r1", "r2", "r3", "r12"],
+        ["r4", "r5", "r6", "r7", "r8", "r10"],
+    ),
+}
+
+CALLER = 0
+CALLEE = 1
+
+SPILL_SLOT = "__spill%d"
+
+
+class RegAllocError(Exception):
+    pass
+
+
+class Interval:
+
+    __slots__ = ("value", "start", "end", "crosses_call", "reg", "active", "seq")
+
+    def __init__(self, value, pos):
+        self.value = value
+        self.start = pos
+        self.end = pos
+        self.crosses_call = False
+        self.reg = None
+        self.active = False
+
+    def __repr__(self):
+        return "<Interval %s [%d, %d]%s %s>" % (
+            self.value.dest_name(), self.start, self.end, " call" if self.crosses_call else "", self.reg
+        )
+
+
+def _reg_list(regs):
+    if isinstance(regs, str):
+        return [r.strip() for r in regs.split(":") if r.strip()]
+    return list(regs)
+
+
+def build_intervals(func):
+    "Return list of Intervals (in order of start) for values of SSA func."
+    rpo = func.analysis("rpo")
+    live = func.analysis("liveness")
+    keys = live.keys
+    # value -> start/end position
+    start = {}
+    end = {}
+    calls = []
+    pos = 0
+
+    for i, bb in enumerate(rpo):
+        bstart = pos
+        pos += 2
+        phis = []
+        for insn in bb.insns:
+            if insn.op == "@phi":
+                # All phis are defined at once at block start, so even
+                # unused ones must get different registers.
+                start[insn] = bstart
+                phis.append(insn)
+                continue
+            if phis:
+                for v in phis:
+                    if end.get(v, -1) < pos:
+                        end[v] = pos
+                phis = []
+            for a in insn.args:
+                v = a.defi
+                if v is not None and end.get(v, -1) < pos:
+                    end[v] = pos
+            if insn.dest:
+                start[insn] = pos
+            if insn.op == "call":
+                calls.append(pos)
+            pos += 2
+        bend = pos
+        pos += 2
+        for v in phis:
+            end[v] = bend
+
+        # Definition of a value dominates its uses, so comes before in
+        # RPO, and only live out values need extending.
+        for b in dataflow.iter_bits(live.inp[i]):
+            end[keys[b]] = bend
+
+    res = []
+    for v, s in start.items():
+        iv = Interval(v, s)
+        e = end.get(v, s)
+        if e > s:
+            iv.end = e
+        res.append(iv)
+    res.sort(key=lambda iv: iv.start)
+    for seq, iv in enumerate(res):
+        iv.seq = seq
+        # Live across a call if a call is strictly inside interval (a call
+        # using value as arg, or defining it, doesn't count).
+        j = bisect_right(calls, iv.start)
+        iv.crosses_call = j < len(calls) and calls[j] < iv.end
+    return res
+
+
+def allocate(intervals, regs, unspillable):
+    """Assign registers to intervals. regs is (caller-saved, callee-saved).
+    Return list of values to spill (their intervals have reg=None)."""
+    free = (list(reversed(regs[CALLER])), list(reversed(regs[CALLEE])))
+    reg_class = {r: CALLER for r in regs[CALLER]}
+    reg_class.update({r: CALLEE for r in regs[CALLEE]})
+    # Min-heap by end, for expiring intervals.
+    active = []
+    # Max-heaps by end, per reg class, of active spillable intervals, for
+    # choosing spill candidate. Stale entries are skipped lazily.
+    spill_cands = ([], [])
+    spilled = []
+
+    for iv in intervals:
+        while active and active[0][0] <= iv.start:
+            a = heappop(active)[2]
+            if a.active:
+                a.active = False
+                free[reg_class[a.reg]].append(a.reg)
+
+        classes = (CALLEE,) if iv.crosses_call else (CALLER, CALLEE)
+        for cls in classes:
+            if free[cls]:
+                iv.reg = free[cls].pop()
+                break
+        else:
+            cand = None
+            for cls in classes:
+                h = spill_cands[cls]
+                while h and not h[0][2].active:
+                    heappop(h)
+                if h and (cand is None or h[0][2].end > cand.end):
+                    cand = h[0][2]
+            can_spill = iv.value not in unspillable
+            if cand is not None and (cand.end > iv.end or not can_spill):
+                iv.reg = cand.reg
+                cand.reg = None
+                cand.active = False
+                spilled.append(cand.value)
+            elif can_spill:
+                spilled.append(iv.value)
+                continue
+            else:
+                raise RegAllocError("not enough registers to allocate %s" % iv)
+
+        iv.active = True
+        heappush(active, (iv.end, iv.seq, iv))
+        if iv.value not in unspillable:
+            heappush(spill_cands[reg_class[iv.reg]], (-iv.end, iv.seq, iv))
+
+    return spilled
+
+
+def _emit_load(insns, load, edge_stores):
+    """Append load to insns being built. Stores of phi operands at the end
+    of block implement parallel phi copies on the outgoing edge, so a load
+    must precede a store to the same slot there."""
+    i = len(insns)
+    slot = load.args[0].val
+    for j in range(i - 1, -1, -1):
+        s = insns[j]
+        if s not in edge_stores:
+            break
+        if s.args[0].val == slot:
+            i = j
+    insns.insert(i, load)
+
+
+def _split_edge(func, pred, bb, labels):
+    label = "%s_%s" % (pred.label, bb.label)
+    cnt = 0
+    while label in labels:
+        cnt += 1
+        label = "%s_%s_%d" % (pred.label, bb.label, cnt)
+    labels.add(label)
+    new = BBlock(label)
+    new.preds.append(pred)
+    new.succs.append(bb)
+    pred.succs = [new if s is bb else s for s in pred.succs]
+    bb.preds = [new if p is pred else p for p in bb.preds]
+    func.bblocks.append(new)
+    return new
+
+
+def _edge_store_pos(bb, unspillable):
+    """Return index in bb, ending with if, to insert store on outgoing edge
+    at. It's before reloads of if's operands (made in previous rounds), as
+    otherwise they would be live across the store, needing a register more
+    than the if itself."""
+    i = len(bb.insns) - 1
+    uses = {a.defi for a in bb.insns[i].args}
+    while i > 0:
+        prev = bb.insns[i - 1]
+        if prev.op != "@load" or prev not in unspillable or prev not in uses:
+            break
+        i -= 1
+    return i
+
+
+def _spill_phi(func, bb, phi, slot, edge_stores, unspillable, labels):
+    """Replace phi with stores of incoming values to slot at the end of
+    predecessors. (All phis are live together at the start of a block, so
+    keeping spilled phis in registers even briefly could need more
+    registers than available.) Returns whether CFG was changed."""
+    cfg_changed = False
+    done = set()
+    for i, a in enumerate(phi.args):
+        p = bb.preds[i]
+        if p in done:
+            continue
+        if any(s is not bb for s in p.succs):
+            # Critical edge, the store would be executed on other paths
+            # from pred too.
+            p = _split_edge(func, p, bb, labels)
+            cfg_changed = True
+        done.add(p)
+        if a.val == "@undef":
+            continue
+        val = Arg(a.val)
+        val.defi = a.defi
+        store = Insn("", "@store", slot, phi.typ, val)
+        edge_stores.add(store)
+        last = p.insns[-1] if p.insns else None
+        if last is not None and last.op == "if":
+            p.insns.insert(_edge_store_pos(p, unspillable), store)
+        else:
+            p.insns.append(store)
+    phi.drop_args()
+    bb.insns.remove(phi)
+    return cfg_changed
+
+
+def insert_spill_code(func, spilled, slots, unspillable, edge_stores):
+    "Insert spill code for values spilled. Returns whether CFG was changed."
+    spilled = set(spilled)
+    # Phis using spilled values are spilled too, so phi operands never
+    # need to be loaded on edges (which would need many registers at
+    # once if there are many phis).
+    phi_of = {}
+    for bb in func.bblocks:
+        for insn in bb.insns:
+            if insn.op == "@phi":
+                for a in insn.args:
+                    phi_of[a] = insn
+    work = list(spilled)
+    while work:
+        v = work.pop()
+        for a in v.uses:
+            phi = phi_of.get(a)
+            if phi is not None and phi not in spilled:
+                spilled.add(phi)
+                work.append(phi)
+
+    cfg_changed = False
+    labels = {bb.label for bb in func.bblocks}
+    for bb in list(func.bblocks):
+        for insn in [i for i in bb.insns if i.op == "@phi" and i in spilled]:
+            slots[insn] = SPILL_SLOT % len(slots)
+            if _spill_phi(func, bb, insn, slots[insn], edge_stores, unspillable, labels):
+                cfg_changed = True
+
+    # Store other spilled values to their slots after definition, and
+    # load them before each use. Slots are numbered in order of blocks.
+    for bb in func.bblocks:
+        for insn in bb.insns:
+            if insn in spilled:
+                slots[insn] = SPILL_SLOT % len(slots)
+    for bb in func.bblocks:
+        res = []
+        for insn in bb.insns:
+            loads = None
+            for a in insn.args:
+                v = a.defi
+                if v in spilled:
+                    if loads is None:
+                        loads = {}
+                    load = loads.get(v)
+                    if load is None:
+                        load = loads[v] = Insn(v.dest, "@load", slots[v], v.typ)
+                        unspillable.add(load)
+                        _emit_load(res, load, edge_stores)
+                    a.defi = load
+            res.append(insn)
+            if insn in spilled:
+                val = Arg(insn.dest)
+                val.defi = insn
+                res.append(Insn("", "@store", slots[insn], insn.typ, val))
+                unspillable.add(insn)
+        bb.insns = res
+    return cfg_changed
+
+
+def linear_scan(func, target="generic", caller=None, callee=None):
+    if not isinstance(func, Func) or not func.bblocks:
+        return analysis.ALL
+
+    cfg_preserved = True
+    if not func.is_ssa:
+        from . import ssa
+        if ssa.construct(func) is None:
+            cfg_preserved = False
+
+    regs = TARGETS[target]
+    if caller is not None:
+        regs = (_reg_list(caller), regs[CALLEE])
+    if callee is not None:
+        regs = (regs[CALLER], _reg_list(callee))
+    if not regs[CALLEE]:
+        raise RegAllocError("at least one callee-saved register is required")
+
+    unspillable = set()
+    slots = {}
+    edge_stores = set()
+    rounds = 0
+    while True:
+        rounds += 1
+        intervals = build_intervals(func)
+        spilled = allocate(intervals, regs, unspillable)
+        if not spilled:
+            break
+        if insert_spill_code(func, spilled, slots, unspillable, edge_stores):
+            cfg_preserved = False
+            func.invalidate_analyses()
+        else:
+            func.invalidate_analyses(analysis.CFG)
+    _log.debug("%s: %d intervals, %d spill slots, %d rounds", func.name, len(intervals), len(slots), rounds)
+
+    for slot in slots.values():
+        if slot not in func.stack_slots:
+            func.stack_slots.append(slot)
+    for iv in intervals:
+        iv.value.reg = iv.reg
+    cnt = 0
+    for bb in func.bblocks:
+        for insn in bb.insns:
+            insn.id = cnt
+            cnt += 1
+            for a in insn.args:
+                if a.defi is not None:
+                    a.reg = a.defi.reg
+
+    func.invalidate_analyses(analysis.CFG)
+    if cfg_preserved:
+        return analysis.CFG
+    return None
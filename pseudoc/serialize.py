@@ -0,0 +1,646 @@
+# PseudoC-IR - Simple Program Analysis/Compiler Intermediate Representation
+#
+# Copyright (c) 2020-2021 Paul Sokolovsky
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Compact binary serialization of Module.
+#
+# File layout:
+#
+#   MAGIC, VERSION (u32)
+#   item blobs, one per Module.contents entry
+#   index blob
+#   index offset (u64), index CRC32 (u32)
+#
+# All blobs are marshal-encoded nested tuples of primitive values. Index
+# holds the type table (types referenced from items, by table position),
+# table of insn ops used in the module, and (kind, name, offset, length,
+# CRC32) of each item, so a particular
+# function can be decoded from a memory-mapped file without touching other
+# items. CRCs are checked before decoding, as a corrupted blob may still
+# decode to valid, but wrong objects.
+#
+# Encoding of values (Arg.val, Insn.typ, Data.desc elements):
+#   int, str, bytes, None - as is
+#   ("t", type_idx)       - Type
+#   ("i", s)              - InlineStr
+#   ("f", op, args)       - SpecFunc
+#   ("a", val, reg, defi) - Arg (defi is index of Insn in function, or None)
+#
+# Functions are encoded mostly as code arrays of fixed-width ints (1, 2 or
+# 4 bytes, as needed, little-endian), most of them indexes into the
+# function's table of values: types it uses (by type table index) are
+# numbered first, then strings (stored as one "\0"-joined string), then
+# other values. Code is:
+#   number of types, their type table indexes
+#   res_type, number of params, param types
+#   number of blocks, per block: label, number of preds, preds (block
+#     numbers), number of succs, succs, number of insns
+#   per insn: dest, op (index in ops table), typ, number of args, args
+# Insn.reg/id and Arg.reg/defi, set only by some passes, are stored in a
+# separate code array (as numbers there may be much larger): number of
+# insns with them, per insn (insn number, reg, id + 1 or 0 for None), then
+# the same for args (arg number in function, reg, defi + 1 or 0).
+
+import sys
+import gc
+import marshal
+from array import array
+from binascii import crc32
+import mmap
+import struct
+
+from .ir import InlineStr, SpecFunc, Arg, Insn, BBlock, Func, Data, Module, Type, PrimType, PtrType, ArrType, StructType, TypeTable
+
+
+MAGIC = b"PSCB"
+# Bump on any incompatible change to the format.
+VERSION = 5
+
+_HEADER = struct.Struct("<4sI")
+_TRAILER = struct.Struct("<QI")
+# marshal format version.
+_MARSHAL_VER = 4
+# Classes of Type objects.
+_TYPE_CLASSES = (PrimType, PtrType, ArrType, StructType)
+# Width of code array ints -> array typecode.
+_CODE_TYPES = {1: "B", 2: "H", 4: "I"}
+
+
+class FormatError(Exception):
+    pass
+
+
+class _Encoder:
+
+    def __init__(self):
+        self.types = []
+        self.type2idx = {}
+        # Insn ops (a small set) are numbered module-wide.
+        self.ops = {}
+        # Struct type fields are encoded after all types are collected, as
+        # structs may be (mutually) recursive.
+        self.structs = []
+
+    def type_idx(self, t):
+        idx = self.type2idx.get(t)
+        if idx is not None:
+            return idx
+        if isinstance(t, PrimType):
+            enc = ("p", t.typ)
+        elif isinstance(t, PtrType):
+            enc = ("*", self.type_idx(t.el_type))
+        elif isinstance(t, ArrType):
+            enc = ("[", self.type_idx(t.el_type), t.num)
+        elif isinstance(t, StructType):
+            enc = ("s", t.name)
+            self.structs.append(t)
+        else:
+            raise TypeError("Cannot serialize type: %r" % t)
+        # Structurally equal types share a table entry. Structs are
+        # nominal, so are keyed by name.
+        idx = self.type2idx.get(enc)
+        if idx is None:
+            idx = self.type2idx[enc] = len(self.types)
+            self.types.append(enc)
+        elif isinstance(t, StructType):
+            self.structs.pop()
+        self.type2idx[t] = idx
+        return idx
+
+    def struct_fields(self):
+        res = []
+        i = 0
+        # Encoding fields may add more structs.
+        while i < len(self.structs):
+            t = self.structs[i]
+            fields = None
+            if t.fields is not None:
+                fields = tuple((name, self.type_idx(typ)) for name, typ in t.fields)
+            res.append((self.type2idx[t], fields))
+            i += 1
+        return tuple(res)
+
+    def val(self, v, insn2idx=None):
+        if v is None or isinstance(v, (int, str, bytes)):
+            return v
+        if isinstance(v, Arg):
+            return self.arg(v, insn2idx)
+        if isinstance(v, Type):
+            return ("t", self.type_idx(v))
+        if isinstance(v, InlineStr):
+            return ("i", v.s)
+        if isinstance(v, SpecFunc):
+            return ("f", v.op, tuple(self.arg(a, insn2idx) for a in v.args))
+        raise TypeError("Cannot serialize value: %r" % v)
+
+    def arg(self, a, insn2idx):
+        defi = None
+        if a.defi is not None:
+            defi = insn2idx[a.defi]
+        return ("a", self.val(a.val, insn2idx), a.reg, defi)
+
+    def func(self, func):
+        insn2idx = {}
+        for bb in func.bblocks:
+            for insn in bb.insns:
+                insn2idx[insn] = len(insn2idx)
+        bb2idx = {bb: i for i, bb in enumerate(func.bblocks)}
+        # Code is first built with values themselves at slots listed in
+        # val_slots, replaced by indexes when all values are known.
+        code = [func.res_type, len(func.param_types)]
+        val_slots = [0]
+        for t in func.param_types:
+            val_slots.append(len(code))
+            code.append(t)
+        code.append(len(func.bblocks))
+        for bb in func.bblocks:
+            val_slots.append(len(code))
+            code.append(bb.label)
+            code.append(len(bb.preds))
+            code += [bb2idx[b] for b in bb.preds]
+            code.append(len(bb.succs))
+            code += [bb2idx[b] for b in bb.succs]
+            code.append(len(bb.insns))
+        insn_extra = []
+        arg_extra = []
+        arg_no = 0
+        for bb in func.bblocks:
+            for insn in bb.insns:
+                if insn.reg is not None or insn.id is not None:
+                    insn_extra.append((insn2idx[insn], insn.reg, insn.id))
+                op = self.ops.get(insn.op)
+                if op is None:
+                    op = self.ops[insn.op] = len(self.ops)
+                n = len(code)
+                val_slots += (n, n + 2)
+                code += (insn.dest, op, insn.typ, len(insn.args))
+                for a in insn.args:
+                    val_slots.append(len(code))
+                    code.append(a.val)
+                    if a.reg is not None or a.defi is not None:
+                        arg_extra.append((arg_no, a.reg, None if a.defi is None else insn2idx[a.defi]))
+                    arg_no += 1
+        # Extras are appended to code, as (insn/arg number, reg, id/defi + 1
+        # or 0 for None), but packed separately (as numbers there may be
+        # much larger).
+        extra_start = len(code)
+        for extra in (insn_extra, arg_extra):
+            code.append(len(extra))
+            for no, reg, i in extra:
+                val_slots.append(len(code) + 1)
+                code += (no, reg, 0 if i is None else i + 1)
+
+        # Types are numbered first, then strings, then other values. Values
+        # are keyed with their type, to keep e.g. 1 and True apart.
+        kinds = {}
+        types, strs, vals = groups = ([], [], [])
+        keys = []
+        for i in val_slots:
+            v = code[i]
+            t = type(v)
+            key = (t, v)
+            if key not in kinds:
+                kind = 1 if t is str and "\0" not in v else 0 if t in _TYPE_CLASSES else 2
+                kinds[key] = kind
+                groups[kind].append(key)
+            keys.append(key)
+        key2idx = {}
+        for g in groups:
+            for key in g:
+                key2idx[key] = len(key2idx)
+        for i, key in zip(val_slots, keys):
+            code[i] = key2idx[key]
+        head = [len(types)] + [self.type_idx(t) for _, t in types]
+        return (
+            func.name, tuple(func.params), func.is_ssa, tuple(func.stack_slots),
+            "\0".join([v for _, v in strs]) if strs else None, tuple(self.val(v, insn2idx) for _, v in vals),
+            _pack_code(head + code[:extra_start]),
+            _pack_code(code[extra_start:]) if insn_extra or arg_extra else None,
+        )
+
+    def data(self, data):
+        desc = content = relocs = None
+        if data.desc is not None:
+            desc = tuple(tuple(self.val(v) for v in el) for el in data.desc)
+        if data.content is not None:
+            content = bytes(data.content)
+            relocs = tuple((off, typ, self.val(v)) for off, typ, v in data.relocs)
+        return (data.name, self.val(data.type), desc, getattr(data, "size", None), content, relocs, data.align)
+
+
+def _pack_code(code):
+    "Pack list of non-negative ints to (width, bytes)."
+    m = max(code, default=0)
+    width = 1 if m < 0x100 else 2 if m < 0x10000 else 4
+    arr = array(_CODE_TYPES[width], code)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return (width, arr.tobytes())
+
+
+def _unpack_code(enc):
+    width, b = enc
+    arr = array(_CODE_TYPES[width], b)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr.tolist()
+
+
+class _Decoder:
+
+    def __init__(self, types, struct_fields, ops, table):
+        self.ops = ops
+        self.types = types = list(types)
+        self.table = table
+        # First create all types, then resolve references.
+        objs = [None] * len(types)
+        for i, enc in enumerate(types):
+            if enc[0] == "s":
+                objs[i] = table.struct(enc[1])
+            elif enc[0] == "p":
+                objs[i] = table.prim(enc[1])
+        for i, enc in enumerate(types):
+            self._type(i, enc, objs)
+        for idx, fields in struct_fields:
+            if fields is not None:
+                objs[idx].fields = [(name, objs[t]) for name, t in fields]
+        self.type_objs = objs
+
+    def _type(self, i, enc, objs):
+        if objs[i] is not None:
+            return objs[i]
+        if enc[0] == "*":
+            t = self.table.ptr(self._type(enc[1], self.types[enc[1]], objs))
+        else:
+            t = self.table.arr(self._type(enc[1], self.types[enc[1]], objs), enc[2])
+        objs[i] = t
+        return t
+
+    def val(self, v, fixups=None):
+        if type(v) is not tuple:
+            return v
+        tag = v[0]
+        if tag == "t":
+            return self.type_objs[v[1]]
+        if tag == "a":
+            return self.arg(v, fixups)
+        if tag == "i":
+            return InlineStr(v[1])
+        if tag == "f":
+            return SpecFunc(v[1], *[self.arg(a, fixups) for a in v[2]])
+        raise FormatError("Unknown value tag: %r" % tag)
+
+    def arg(self, v, fixups):
+        val = v[1]
+        if type(val) is tuple:
+            val = self.val(val, fixups)
+        a = Arg(val)
+        if v[2] is not None:
+            a.reg = v[2]
+        if v[3] is not None:
+            fixups.append((a, v[3]))
+        return a
+
+    def func(self, enc):
+        name, params, is_ssa, stack_slots, strs, vals, code, extra = enc
+        code = _unpack_code(code)
+        # Values of function: types, strings, then other values. Tuple
+        # values (which hold mutable objects) are decoded on each use.
+        type_objs = self.type_objs
+        pos = 1 + code[0]
+        vals = [type_objs[i] for i in code[1:pos]] + (strs.split("\0") if strs is not None else []) + list(vals)
+        ops = self.ops
+        func = Func(name)
+        func.params = list(params)
+        func.is_ssa = is_ssa
+        func.stack_slots = list(stack_slots)
+        func.res_type = vals[code[pos]]
+        end = pos + 2 + code[pos + 1]
+        func.param_types = [vals[i] for i in code[pos + 2:end]]
+        pos = end + 1
+        bblocks = func.bblocks = [BBlock(None, []) for _ in range(code[end])]
+        num_insns = []
+        for bb in bblocks:
+            bb.label = vals[code[pos]]
+            end = pos + 2 + code[pos + 1]
+            bb.preds = [bblocks[i] for i in code[pos + 2:end]]
+            pos = end + 1 + code[end]
+            bb.succs = [bblocks[i] for i in code[end + 1:pos]]
+            num_insns.append(code[pos])
+            pos += 1
+
+        all_insns = []
+        all_args = []
+        fixups = []
+        val = self.val
+        new_insn = Insn.__new__
+        for bb, num in zip(bblocks, num_insns):
+            bb_insns = bb.insns
+            for _ in range(num):
+                insn = new_insn(Insn)
+                insn.id = None
+                insn.dest = vals[code[pos]]
+                insn.op = ops[code[pos + 1]]
+                insn.typ = vals[code[pos + 2]]
+                end = pos + 4 + code[pos + 3]
+                args = []
+                for i in code[pos + 4:end]:
+                    v = vals[i]
+                    if type(v) is tuple:
+                        v = val(v, fixups)
+                    args.append(Arg(v))
+                pos = end
+                insn.args = args
+                insn.reg = None
+                insn._uses = None
+                bb_insns.append(insn)
+                all_args.extend(args)
+            all_insns.extend(bb_insns)
+        if pos != len(code):
+            raise FormatError("Code size mismatch")
+        if extra is not None:
+            code = _unpack_code(extra)
+            end = 1 + 3 * code[0]
+            for i in range(1, end, 3):
+                insn = all_insns[code[i]]
+                insn.reg = vals[code[i + 1]]
+                if code[i + 2]:
+                    insn.id = code[i + 2] - 1
+            pos = end + 1 + 3 * code[end]
+            for i in range(end + 1, pos, 3):
+                a = all_args[code[i]]
+                a.reg = vals[code[i + 1]]
+                if code[i + 2]:
+                    fixups.append((a, code[i + 2] - 1))
+            if pos != len(code):
+                raise FormatError("Code size mismatch")
+        for a, idx in fixups:
+            a.defi = all_insns[idx]
+        return func
+
+    def data(self, enc):
+        name, typ, desc, size, content, relocs, align = enc
+        fixups = []
+        if desc is not None:
+            desc = [tuple(self.val(v, fixups) for v in el) for el in desc]
+        data = Data(name, desc, self.val(typ))
+        if size is not None:
+            data.size = size
+        if content is not None:
+            data.content = content
+            data.relocs = [(off, typ, self.val(v, fixups)) for off, typ, v in relocs]
+        data.align = align
+        return data
+
+    def item(self, kind, enc):
+        if kind == "f":
+            return self.func(enc)
+        if kind == "d":
+            return self.data(enc)
+        if kind == "s":
+            return self.type_objs[enc]
+        raise FormatError("Unknown item kind: %r" % kind)
+
+
+class Writer:
+    """Serialize module items one by one to binary file object f. Items
+    are encoded as they're added, so may be modified (or freed) after."""
+
+    def __init__(self, f):
+        self.f = f
+        self.enc = _Encoder()
+        self.items = []
+        f.write(_HEADER.pack(MAGIC, VERSION))
+        self.offset = _HEADER.size
+
+    def add(self, item):
+        if isinstance(item, Func):
+            kind, blob = "f", self.enc.func(item)
+        elif isinstance(item, Data):
+            kind, blob = "d", self.enc.data(item)
+        elif isinstance(item, StructType):
+            kind, blob = "s", self.enc.type_idx(item)
+        else:
+            raise TypeError("Cannot serialize module item: %r" % item)
+        blob = marshal.dumps(blob, _MARSHAL_VER)
+        self.f.write(blob)
+        self.items.append((kind, getattr(item, "name", None), self.offset, len(blob), crc32(blob)))
+        self.offset += len(blob)
+
+    def close(self):
+        "Write index. Doesn't close underlying file."
+        enc = self.enc
+        struct_fields = enc.struct_fields()
+        index = marshal.dumps((tuple(enc.types), struct_fields, tuple(enc.ops), tuple(self.items)), _MARSHAL_VER)
+        self.f.write(index)
+        self.f.write(_TRAILER.pack(self.offset, crc32(index)))
+
+
+def save(mod, f):
+    "Write Module mod to binary file object f."
+    w = Writer(f)
+    for item in mod.contents:
+        w.add(item)
+    w.close()
+
+
+def dump_file(mod, path):
+    with open(path, "wb") as f:
+        save(mod, f)
+
+
+class Reader:
+    """Random access to items of a serialized Module. buf is a bytes-like
+    object (e.g. an mmap); only the index is decoded upfront, items are
+    decoded on request. Types of all items are interned in .types."""
+
+    def __init__(self, buf):
+        self.buf = buf
+        if len(buf) < _HEADER.size + _TRAILER.size:
+            raise FormatError("File too short")
+        magic, ver = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise FormatError("Not a serialized PseudoC module")
+        if ver != VERSION:
+            raise FormatError("Unsupported format version: %d (expected %d)" % (ver, VERSION))
+        end = len(buf) - _TRAILER.size
+        index_off, index_crc = _TRAILER.unpack_from(buf, end)
+        if not _HEADER.size <= index_off <= end:
+            raise FormatError("Index offset out of range: %d" % index_off)
+        blob = buf[index_off:end]
+        if crc32(blob) != index_crc:
+            raise FormatError("Corrupted index: CRC mismatch")
+        # Anything going wrong while decoding means the data is bad.
+        try:
+            types, struct_fields, ops, self.items = marshal.loads(blob)
+            self.types = TypeTable()
+            self.dec = _Decoder(types, struct_fields, ops, self.types)
+            self.name2idx = {}
+            for i, (kind, name, off, size, crc) in enumerate(self.items):
+                if kind == "f":
+                    self.name2idx[name] = i
+        except FormatError:
+            raise
+        except Exception as e:
+            raise FormatError("Corrupted index: %r" % e)
+
+    def __len__(self):
+        return len(self.items)
+
+    def _blob(self, i):
+        kind, name, off, size, crc = self.items[i]
+        blob = self.buf[off:off + size]
+        if len(blob) != size or crc32(blob) != crc:
+            raise FormatError("Corrupted item %d: CRC mismatch" % i)
+        return kind, blob
+
+    def verify(self):
+        "Check CRCs of all items (without decoding them)."
+        for i in range(len(self.items)):
+            self._blob(i)
+
+    def item(self, i):
+        kind, blob = self._blob(i)
+        # Decoding allocates lots of objects at once, which otherwise
+        # triggers repeated (and useless) cyclic GC runs.
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self.dec.item(kind, marshal.loads(blob))
+        except FormatError:
+            raise
+        except Exception as e:
+            raise FormatError("Corrupted item %d: %r" % (i, e))
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def func(self, name):
+        "Decode function by name."
+        return self.item(self.name2idx[name])
+
+    def func_names(self):
+        return list(self.name2idx)
+
+    def __iter__(self):
+        for i in range(len(self.items)):
+            yield self.item(i)
+
+    def module(self):
+        mod = Module(self.types)
+        for item in self:
+            mod.add(item)
+        return mod
+
+
+def load(f):
+    "Read Module from binary file object f."
+    return Reader(f.read()).module()
+
+
+def load_file(path):
+    with open(path, "rb") as f:
+        return Reader(f.read()).module()
+
+
+class MappedReader(Reader):
+    "Reader over a memory-mapped file, for lazy loading of individual items."
+
+    def __init__(self, path):
+        self.f = open(path, "rb")
+        try:
+            self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self.f.close()
+            raise
+        try:
+            super().__init__(self.mm)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        self.mm.close()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        self.close()
+
+
+def load_func(path, name):
+    "Load a single function by name from a serialized module file."
+    with MappedReader(path) as r:
+        return r.func(name)
+
+
+def __main__():
+    import argparse
+    import tempfile
+    from . import parser
+
+    argp = argparse.ArgumentParser(
+        description="Parse PseudoC program, serialize it, read back and dump (output should be the same as of pseudoc_tool)")
+    argp.add_argument("file")
+    argp.add_argument("-x", "--xforms", default=[], action="append",
+        help="transformation(s) to apply before serializing, as for pseudoc_tool")
+    argp.add_argument("--pack-data", action="store_true", help="parse data initializers into contiguous bytes")
+    argp.add_argument("--mmap", action="store_true", help="read back from a file using MappedReader")
+    args = argp.parse_args()
+
+    passes_list = []
+    if args.xforms:
+        import pseudoc_tool
+        for x in args.xforms:
+            pseudoc_tool.parse_passes_spec(x, passes_list)
+
+    # Named file is needed only to mmap it.
+    with tempfile.NamedTemporaryFile() as out:
+        w = Writer(out)
+        with open(args.file) as f:
+            for item in parser.Parser(pack_data=args.pack_data).parse_iter(f):
+                for pass_func, pass_params in passes_list:
+                    pseudoc_tool.run_pass(item, pass_func, pass_params)
+                w.add(item)
+        w.close()
+        out.flush()
+
+        if args.mmap:
+            r = MappedReader(out.name)
+        else:
+            out.seek(0)
+            r = Reader(out.read())
+        need_empty_line = False
+        for item in r:
+            if need_empty_line:
+                print()
+            item.dump()
+            need_empty_line = True
+        if args.mmap:
+            r.close()
+
+
+if __name__ == "__main__":
+    __main__()
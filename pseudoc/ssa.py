@@ -0,0 +1,209 @@
+# PseudoC-IR - Simple Program Analysis/Compiler Intermediate Representation
+#
+# Copyright (c) 2020-2021 Paul Sokolovsky
+#
+# The MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# SSA construction pass (-x pseudoc.ssa.construct).
+#
+# Uses the classic Cytron et al. approach: phis are placed at iterated
+# dominance frontiers of variable definitions, then variables are renamed
+# by a walk over the dominator tree. Dominance frontiers are computed with
+# the Cooper-Harvey-Kennedy algorithm (see pseudoc.analysis). By default,
+# phis are semi-pruned (only for variables live across blocks), with
+# pruned=True, they're placed only where variable is live (this needs a
+# liveness analysis, so is slower). All walks are iterative, so huge CFGs
+# don't hit recursion limit.
+#
+# After the pass, each local variable use has .defi set to its defining
+# Insn (possibly a @phi, or a @param insn in the entry block), uses of
+# uninitialized variables are replaced with "@undef", and all insns are
+# numbered sequentially (Insn.id). Unreachable blocks are removed, and if
+# entry block has predecessors, a new entry block is added before it.
+
+from .ir import Func, BBlock, Insn
+from . import analysis
+
+
+def is_var(val):
+    return isinstance(val, str) and val.startswith("$")
+
+
+def _new_entry(func):
+    labels = {bb.label for bb in func.bblocks}
+    label = "_entry"
+    cnt = 0
+    while label in labels:
+        cnt += 1
+        label = "_entry%d" % cnt
+    old = func.bblocks[0]
+    bb = BBlock(label)
+    bb.succs.append(old)
+    old.preds.append(bb)
+    func.bblocks.insert(0, bb)
+
+
+def _remove_unreachable(func, reachable):
+    for bb in func.bblocks:
+        if bb not in reachable:
+            for s in bb.succs:
+                if s in reachable:
+                    s.preds = [p for p in s.preds if p is not bb]
+    func.bblocks = [bb for bb in func.bblocks if bb in reachable]
+
+
+def construct(func, pruned=False):
+    if not isinstance(func, Func) or func.is_ssa or not func.bblocks:
+        return analysis.ALL
+
+    cfg_changed = False
+    if func.bblocks[0].preds:
+        _new_entry(func)
+        cfg_changed = True
+    reachable = set(analysis.calc_rpo(func, None))
+    if any(bb not in reachable for bb in func.bblocks):
+        _remove_unreachable(func, reachable)
+        cfg_changed = True
+    if cfg_changed:
+        func.invalidate_analyses()
+
+    entry = func.bblocks[0]
+    param_insns = []
+    for i, (p, t) in enumerate(zip(func.params, func.param_types or [None] * len(func.params))):
+        param_insns.append(Insn(p, "@param", i, type=t))
+    entry.insns[0:0] = param_insns
+
+    # Collect definition sites of variables, and "global" variables, i.e.
+    # used in some block before (or without) being defined in it. Only
+    # these need phis (semi-pruned SSA). dicts are used for deterministic
+    # ordering.
+    defsites = {}
+    global_vars = {}
+    for bb in func.bblocks:
+        defined = set()
+        for insn in bb.insns:
+            for a in insn.args:
+                v = a.val
+                if is_var(v) and v not in defined:
+                    global_vars[v] = None
+            if insn.dest:
+                defined.add(insn.dest)
+                sites = defsites.get(insn.dest)
+                if sites is None:
+                    defsites[insn.dest] = [bb]
+                elif sites[-1] is not bb:
+                    sites.append(bb)
+
+    df = func.analysis("domfrontier")
+    liveness = None
+    if pruned:
+        liveness = func.analysis("liveness")
+
+    phis = {}
+    for v in global_vars:
+        sites = defsites.get(v)
+        if not sites:
+            continue
+        has_phi = set()
+        queued = set(sites)
+        work = list(sites)
+        while work:
+            bb = work.pop()
+            for d in df[bb]:
+                if d in has_phi:
+                    continue
+                has_phi.add(d)
+                if liveness is not None and not liveness.is_live_in(v, d):
+                    continue
+                phi = Insn(v, "@phi", *[v] * len(d.preds))
+                phis.setdefault(d, []).append(phi)
+                if d not in queued:
+                    queued.add(d)
+                    work.append(d)
+    for bb, bb_phis in phis.items():
+        bb.insns[0:0] = bb_phis
+
+    _rename(func, phis)
+
+    cnt = 0
+    for bb in func.bblocks:
+        for insn in bb.insns:
+            insn.id = cnt
+            cnt += 1
+    func.is_ssa = True
+
+    if cfg_changed:
+        return None
+    return analysis.CFG
+
+
+def _rename(func, phis):
+    domtree = func.analysis("domtree")
+    children = domtree.children
+    # var -> stack of current definitions
+    stacks = {}
+    # Walk dominator tree, with (bb, None) pushed to undo block's
+    # definitions after its subtree is done.
+    work = [(func.bblocks[0], True)]
+    while work:
+        bb, enter = work.pop()
+        if not enter:
+            for insn in reversed(bb.insns):
+                if insn.dest:
+                    stacks[insn.dest].pop()
+            continue
+
+        for insn in bb.insns:
+            if insn.op != "@phi":
+                for a in insn.args:
+                    if is_var(a.val):
+                        s = stacks.get(a.val)
+                        if s:
+                            a.defi = s[-1]
+                        else:
+                            a.val = "@undef"
+            if insn.dest:
+                s = stacks.get(insn.dest)
+                if s is None:
+                    s = stacks[insn.dest] = []
+                s.append(insn)
+
+        for succ in bb.succs:
+            succ_phis = phis.get(succ)
+            if not succ_phis:
+                continue
+            # bb may be a pred of succ more than once (e.g. "if" with both
+            # targets the same).
+            for i, p in enumerate(succ.preds):
+                if p is not bb:
+                    continue
+                for phi in succ_phis:
+                    a = phi.args[i]
+                    s = stacks.get(phi.dest)
+                    if s:
+                        a.defi = s[-1]
+                    else:
+                        a.val = "@undef"
+
+        work.append((bb, False))
+        for c in reversed(children[bb]):
+            work.append((c, True))
@@ -0,0 +1,95 @@
+# Thin client for pseudoc_server: forwards command line (same as for
+# pseudoc_tool.py) to a running server, and outputs its results. If no
+# server is running, falls back to running pseudoc_tool in-process.
+#
+# Only lightweight modules are imported, to keep startup time low (the
+# low-level _socket, as socket imports enum, selectors, etc.). Still, each
+# invocation pays for Python interpreter startup itself (measure with
+# python -X importtime pseudoc_client.py), so what the server saves is
+# import of pseudoc_tool and pass modules, and parsing of cached files,
+# not per-process overhead. Running the client with python -S (no site
+# module) cuts it a bit further.
+#
+# Protocol (over Unix socket): request is u32 length + NUL-separated cwd
+# and args, response is a sequence of frames: kind byte + u32 length +
+# data, where kind is "o" (stdout data), "e" (stderr data) or "x" (exit
+# code, as decimal string; last frame).
+import sys
+import os
+import struct
+try:
+    import _socket as socket
+except ImportError:
+    import socket
+
+
+_LEN = struct.Struct("<I")
+
+
+def default_socket():
+    path = os.environ.get("PSEUDOC_SOCKET")
+    if path:
+        return path
+    return os.path.join(os.environ.get("TMPDIR", "/tmp"), "pseudoc-%d.sock" % os.getuid())
+
+
+def recv_exact(sock, n):
+    buf = b""
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise EOFError("connection closed")
+        buf += chunk
+    return buf
+
+
+def send_msg(sock, data):
+    sock.sendall(_LEN.pack(len(data)) + data)
+
+
+def recv_msg(sock):
+    n = _LEN.unpack(recv_exact(sock, _LEN.size))[0]
+    return recv_exact(sock, n)
+
+
+def encode_args(args):
+    return b"\0".join([a.encode("utf-8", "surrogateescape") for a in args])
+
+
+def decode_args(data):
+    return [a.decode("utf-8", "surrogateescape") for a in data.split(b"\0")]
+
+
+def call(path, argv):
+    "Run argv on server at socket path, return exit code."
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        send_msg(sock, encode_args([os.getcwd()] + argv))
+        while True:
+            kind = recv_exact(sock, 1)
+            data = recv_msg(sock)
+            if kind == b"o":
+                sys.stdout.buffer.write(data)
+            elif kind == b"e":
+                sys.stderr.buffer.write(data)
+            else:
+                return int(data)
+    finally:
+        sock.close()
+
+
+def __main__():
+    try:
+        code = call(default_socket(), sys.argv[1:])
+    except (FileNotFoundError, ConnectionRefusedError):
+        import pseudoc_tool
+        sys.argv[0] = "pseudoc_tool.py"
+        pseudoc_tool.__main__()
+        return
+    sys.stdout.flush()
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    __main__()
@@ -0,0 +1,238 @@
+# Long-running server for pseudoc_tool, to avoid per-invocation startup,
+# import and parse costs. Listens on a Unix socket (see pseudoc_client
+# for protocol and default socket path), and runs each request, which
+# takes the same arguments as pseudoc_tool.py, in-process. Pass modules
+# stay imported (restart server to pick up changes to them), and parse
+# results of recently used files are kept in memory (in
+# pseudoc.serialize format, as passes modify parsed items), invalidated
+# when a file's mtime or size changes.
+#
+# Requests are handled one at a time, as they share process-wide state
+# (cwd, stdout, pseudoc.config). SIGTERM received while handling a request
+# makes the server exit after the request is done.
+#
+# Usage: python pseudoc_server.py [--socket PATH] [--cache-size N]
+import sys
+import os
+import io
+import socket
+import signal
+import argparse
+import traceback
+import contextlib
+from collections import OrderedDict
+
+import pseudoc_tool
+import pseudoc_client
+from pseudoc import config
+from pseudoc import cache
+from pseudoc import serialize
+
+
+class ModuleCache:
+    "In-memory LRU cache of serialized parse results, by file path."
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        # path -> (stamp, serialized bytes)
+        self.entries = OrderedDict()
+
+    def items(self, args, fname):
+        "Like pseudoc_tool.iter_items(), but using cache."
+        path = os.path.realpath(fname)
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size, cache.parse_options())
+        entry = self.entries.get(path)
+        if entry is not None and entry[0] == stamp:
+            self.entries.move_to_end(path)
+            yield from serialize.Reader(entry[1])
+            return
+        buf = io.BytesIO()
+        w = serialize.Writer(buf)
+        for item in pseudoc_tool.iter_items(args, fname):
+            # Encoded before it's yielded (and possibly modified).
+            w.add(item)
+            yield item
+        w.close()
+        self.put(path, stamp, buf.getvalue())
+
+    def put(self, path, stamp, data):
+        old = self.entries.pop(path, None)
+        if old is not None:
+            self.size -= len(old[1])
+        if len(data) > self.max_size:
+            return
+        self.entries[path] = (stamp, data)
+        self.size += len(data)
+        while self.size > self.max_size:
+            path, (stamp, data) = self.entries.popitem(last=False)
+            self.size -= len(data)
+
+
+class FrameWriter:
+    "Text file-like object sending written data as frames of given kind."
+
+    BUF_SIZE = 64 * 1024
+
+    def __init__(self, sock, kind):
+        self.sock = sock
+        self.kind = kind
+        self.buf = []
+        self.buf_len = 0
+
+    def write(self, s):
+        self.buf.append(s)
+        self.buf_len += len(s)
+        if self.buf_len >= self.BUF_SIZE:
+            self.flush()
+        return len(s)
+
+    def flush(self):
+        if self.buf:
+            data = "".join(self.buf).encode("utf-8", "surrogateescape")
+            self.buf = []
+            self.buf_len = 0
+            self.sock.sendall(self.kind)
+            pseudoc_client.send_msg(self.sock, data)
+
+
+class Shutdown(Exception):
+    "Raised by SIGTERM handler to stop the server while it's idle."
+
+
+class ArgparseExit(Exception):
+    "Exit of pseudoc_tool.argp (usage error or --help), with exit status."
+
+    def __init__(self, status):
+        self.status = status
+
+
+def argp_exit(status=0, message=None):
+    if message:
+        sys.stderr.write(message)
+    raise ArgparseExit(status)
+
+
+class Server:
+
+    def __init__(self, path, cache_size):
+        self.path = path
+        self.modules = ModuleCache(cache_size)
+        # xforms -> passes_list
+        self.passes = {}
+        self.busy = False
+        self.shutdown = False
+
+    def terminate(self, signum, frame):
+        "SIGTERM handler."
+        self.shutdown = True
+        if not self.busy:
+            raise Shutdown
+
+    def get_passes(self, xforms):
+        key = tuple(xforms)
+        passes_list = self.passes.get(key)
+        if passes_list is None:
+            passes_list = []
+            for x in xforms:
+                pseudoc_tool.parse_passes_spec(x, passes_list)
+            self.passes[key] = passes_list
+        return passes_list
+
+    def run(self, argv):
+        "Run pseudoc_tool with argv, return exit code."
+        # Usage errors (also from pseudoc_tool.run()) raise ArgparseExit
+        # instead of SystemExit, see __main__().
+        try:
+            args = pseudoc_tool.argp.parse_args(argv)
+            return pseudoc_tool.run(args, self.modules.items, self.get_passes(args.xforms))
+        except ArgparseExit as e:
+            return e.status
+        except Exception:
+            traceback.print_exc()
+            return 1
+
+    def handle(self, conn):
+        req = pseudoc_client.decode_args(pseudoc_client.recv_msg(conn))
+        cwd, argv = req[0], req[1:]
+        out = FrameWriter(conn, b"o")
+        err = FrameWriter(conn, b"e")
+        old_cwd = os.getcwd()
+        split_bb = config.SPLIT_BB_AFTER_CALL
+        pack_data = config.PACK_DATA
+        tracing = tracemalloc_tracing()
+        try:
+            os.chdir(cwd)
+            with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+                code = self.run(argv)
+        finally:
+            os.chdir(old_cwd)
+            config.SPLIT_BB_AFTER_CALL = split_bb
+            config.PACK_DATA = pack_data
+            # --stats starts tracemalloc, which would slow down following
+            # requests.
+            if not tracing and tracemalloc_tracing():
+                import tracemalloc
+                tracemalloc.stop()
+        out.flush()
+        err.flush()
+        conn.sendall(b"x")
+        pseudoc_client.send_msg(conn, str(code).encode())
+
+    def serve(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if os.path.exists(self.path):
+            try:
+                sock.connect(self.path)
+            except ConnectionRefusedError:
+                # Stale socket of a dead server.
+                os.unlink(self.path)
+            else:
+                sys.exit("server is already running at %s" % self.path)
+            sock.close()
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.path)
+        sock.listen(64)
+        try:
+            while not self.shutdown:
+                conn, _ = sock.accept()
+                self.busy = True
+                with conn:
+                    try:
+                        self.handle(conn)
+                    except (OSError, EOFError):
+                        # Client went away.
+                        pass
+                self.busy = False
+        finally:
+            sock.close()
+            os.unlink(self.path)
+
+
+def tracemalloc_tracing():
+    mod = sys.modules.get("tracemalloc")
+    return mod is not None and mod.is_tracing()
+
+
+def __main__():
+    argp = argparse.ArgumentParser(description="Server for pseudoc_tool requests (see pseudoc_client.py)")
+    argp.add_argument("--socket", default=pseudoc_client.default_socket(), help="Unix socket path (default: %(default)s)")
+    argp.add_argument("--cache-size", type=int, default=256 * 1024 * 1024,
+        help="max total size of parse results kept in memory, in bytes (default: %(default)s)")
+    args = argp.parse_args()
+    # For usage/error messages of requests.
+    pseudoc_tool.argp.prog = "pseudoc_tool.py"
+    # Usage errors of a request shouldn't exit the server.
+    pseudoc_tool.argp.exit = argp_exit
+    server = Server(args.socket, args.cache_size)
+    # Exit cleanly (removing socket) on kill.
+    signal.signal(signal.SIGTERM, server.terminate)
+    try:
+        server.serve()
+    except (KeyboardInterrupt, Shutdown):
+        pass
+
+
+if __name__ == "__main__":
+    __main__()
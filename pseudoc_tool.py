@@ -1,11 +1,19 @@
 import sys
+import os
 import logging
 import argparse
 import re
+import io
+import json
+import time
+from collections import deque
 
 from lexer import Lexer
 from pseudoc import config
 from pseudoc import parser
+from pseudoc import cache
+from pseudoc import analysis
+from pseudoc.ir import Func
 
 
 log = logging.getLogger(__name__)
@@ -15,14 +23,16 @@ PASS_NAME = re.compile(r"[A-Za-z_0-9.]+")
 PARAM_NAME = re.compile(r"[A-Za-z_][A-Za-z_0-9.]*")
 PARAM_VALUE = re.compile(r"[^,()]+")
 
-def parse_passes_spec(s, pass_list):
+def parse_passes_spec(s, passes_list):
     lex = Lexer(s)
     while not lex.eol():
         name = lex.expect_re(PASS_NAME, err="expected pass name ([dotted] identifier)")
         mod = None
         if "." in name:
             mod, name = name.rsplit(".", 1)
-            mod = __import__(mod)
+            # Non-empty fromlist makes __import__ return the leaf module
+            # of a dotted name, not the top-level package.
+            mod = __import__(mod, None, None, [name])
         passfunc = getattr(mod, name)
         params = {}
         if lex.match("("):
@@ -30,7 +40,7 @@ def parse_passes_spec(s, pass_list):
                 k = lex.expect_re(PARAM_NAME, err="expected pass param name")
                 v = True
                 if lex.match("="):
-                    v = lex.expect_re(PARAM_NAME, err="expected pass param name")
+                    v = lex.expect_re(PARAM_VALUE, err="expected pass param value").strip()
                     v = {"True": True, "False": False}.get(v, v)
                 params[k] = v
                 lex.match(",")
@@ -39,24 +49,403 @@ def parse_passes_spec(s, pass_list):
 
 
 argp = argparse.ArgumentParser(description="Parse PseudoC program and apply transformations")
-argp.add_argument("file")
+argp.add_argument("files", nargs="*", metavar="file")
 argp.add_argument("-o", "--out", help="Output to file")
+argp.add_argument("--manifest", metavar="FILE",
+    help="read input files from FILE, one per line, optionally followed by output file for it")
+argp.add_argument("--out-dir", metavar="DIR", help="write output for each input to DIR/<input basename><suffix>")
+argp.add_argument("--out-suffix", metavar="SUFFIX",
+    help="write output for each input to <input>SUFFIX (with --out-dir, default is .out)")
 argp.add_argument("-x", "--xforms", default=[], action="append", help="transformation(s) to apply")
 argp.add_argument("--no-split-after-call", action="store_true", help="don't split basic blocks after call insn")
-args = argp.parse_args()
+argp.add_argument("--pack-data", action="store_true",
+    help="parse data initializers into contiguous bytes (see config.PACK_DATA)")
+argp.add_argument("-j", "--jobs", type=int, default=1,
+    help="process functions (or, with multiple inputs, files) in N worker processes "
+    "(output order is preserved, but any output of passes themselves may interleave)")
+argp.add_argument("--batch-size", type=int, default=64, help="number of items sent to a worker at once (with -j)")
+argp.add_argument("--cache-dir", help="cache parse results in this directory")
+argp.add_argument("--cache-size", type=int, default=cache.DEFAULT_MAX_SIZE,
+    help="max size of parse cache, in bytes (default: %(default)s)")
+argp.add_argument("--time-passes", action="store_true",
+    help="measure wall and CPU time of parsing, each pass and dumping, per function (report goes to stderr)")
+argp.add_argument("--stats", action="store_true", help="like --time-passes, but also measure memory allocation (slower)")
+argp.add_argument("--stats-top", type=int, default=20, metavar="N", help="report N hottest function x pass pairs")
+argp.add_argument("--stats-json", metavar="FILE",
+    help="write full --time-passes/--stats data as JSON to FILE (on its own, collects --time-passes data without report)")
 
-if args.no_split_after_call:
-    config.SPLIT_BB_AFTER_CALL = False
 
-passes_list = []
+def run_pass(item, pass_func, pass_params):
+    preserved = pass_func(item, **pass_params)
+    if isinstance(item, Func):
+        # Passes not aware of analyses may return anything (e.g. whether
+        # they changed something), which invalidates everything.
+        if preserved is not analysis.ALL and not isinstance(preserved, (set, frozenset)):
+            preserved = None
+        item.invalidate_analyses(preserved)
 
-for x in args.xforms:
-    parse_passes_spec(x, passes_list)
 
+def process_item(item, passes_list, file=None):
+    for pass_func, pass_params in passes_list:
+        run_pass(item, pass_func, pass_params)
+    item.dump(file=file)
 
-def __main__():
-    with open(args.file) as f:
-        mod = parser.parse(f)
+
+def item_name(item):
+    return getattr(item, "name", None) or type(item).__name__
+
+
+def pass_name(pass_func, pass_params):
+    name = "%s.%s" % (pass_func.__module__, pass_func.__name__)
+    if pass_params:
+        name += "(%s)" % ",".join(["%s=%s" % p for p in pass_params.items()])
+    return name
+
+
+class PassStats:
+    """Collects wall/CPU time (and optionally memory allocation, using
+    tracemalloc) of processing stages per module item. Only used if
+    requested, so normal processing doesn't pay for it."""
+
+    def __init__(self, trace_mem=False):
+        self.trace_mem = trace_mem
+        # (item name, stage, wall, cpu, mem delta, mem peak)
+        self.records = []
+        if trace_mem:
+            import tracemalloc
+            self.tracemalloc = tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    def start(self):
+        mem = None
+        if self.trace_mem:
+            self.tracemalloc.reset_peak()
+            mem = self.tracemalloc.get_traced_memory()[0]
+        return (time.perf_counter(), time.process_time(), mem)
+
+    def stop(self, item_name, stage, start):
+        wall = time.perf_counter() - start[0]
+        cpu = time.process_time() - start[1]
+        delta = peak = None
+        if self.trace_mem:
+            cur, peak = self.tracemalloc.get_traced_memory()
+            delta = cur - start[2]
+            peak -= start[2]
+        self.records.append((item_name, stage, wall, cpu, delta, peak))
+
+    def iter_parse(self, items):
+        "Wrap iterator of parsed items, recording time to parse each."
+        it = iter(items)
+        while True:
+            start = self.start()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            self.stop(item_name(item), "parse", start)
+            yield item
+
+    def process_item(self, item, passes_list, file=None):
+        name = item_name(item)
+        for pass_func, pass_params in passes_list:
+            start = self.start()
+            run_pass(item, pass_func, pass_params)
+            self.stop(name, pass_name(pass_func, pass_params), start)
+        start = self.start()
+        item.dump(file=file)
+        self.stop(name, "dump", start)
+
+    def totals(self):
+        res = {}
+        for name, stage, wall, cpu, delta, peak in self.records:
+            t = res.get(stage)
+            if t is None:
+                t = res[stage] = [0, 0.0, 0.0, 0]
+            t[0] += 1
+            t[1] += wall
+            t[2] += cpu
+            if peak is not None:
+                t[3] = max(t[3], peak)
+        return res
+
+    def report(self, top=20, file=None):
+        mem = self.trace_mem
+        hdr = "%10s %10s" % ("wall ms", "cpu ms")
+        if mem:
+            hdr += " %10s %10s" % ("alloc KB", "peak KB")
+
+        def fmt(wall, cpu, delta=None, peak=None):
+            s = "%10.2f %10.2f" % (wall * 1000, cpu * 1000)
+            if mem:
+                s += " %10.1f %10.1f" % (delta / 1024, peak / 1024)
+            return s
+
+        print("=== Hottest function x stage (top %d by wall time) ===" % top, file=file)
+        print(hdr + "  function / stage", file=file)
+        recs = sorted(self.records, key=lambda r: r[2], reverse=True)
+        for name, stage, wall, cpu, delta, peak in recs[:top]:
+            print(fmt(wall, cpu, delta, peak) + "  %s / %s" % (name, stage), file=file)
+
+        print("=== Totals per stage ===", file=file)
+        hdr = "%10s %10s %8s" % ("wall ms", "cpu ms", "count")
+        if mem:
+            hdr += " %10s" % "peak KB"
+        print(hdr + "  stage", file=file)
+        totals = sorted(self.totals().items(), key=lambda t: t[1][1], reverse=True)
+        for stage, (cnt, wall, cpu, peak) in totals:
+            s = "%10.2f %10.2f %8d" % (wall * 1000, cpu * 1000, cnt)
+            if mem:
+                s += " %10.1f" % (peak / 1024)
+            print(s + "  %s" % stage, file=file)
+
+    def to_json(self):
+        keys = ("item", "stage", "wall", "cpu", "mem_delta", "mem_peak")
+        return {
+            "records": [dict(zip(keys, r)) for r in self.records],
+            "totals": {
+                stage: {"count": cnt, "wall": wall, "cpu": cpu, "mem_peak": peak if self.trace_mem else None}
+                for stage, (cnt, wall, cpu, peak) in self.totals().items()
+            },
+        }
+
+
+# Worker process state for -j mode.
+_worker_passes = None
+_worker_stats_mode = None
+
+
+def _init_worker(xforms, stats_mode=None):
+    global _worker_passes, _worker_stats_mode
+    _worker_passes = []
+    for x in xforms:
+        parse_passes_spec(x, _worker_passes)
+    _worker_stats_mode = stats_mode
+
+
+def _process_batch(batch):
+    res = []
+    stats = None
+    if _worker_stats_mode is not None:
+        stats = PassStats(_worker_stats_mode)
+    for item in batch:
+        buf = io.StringIO()
+        if stats:
+            stats.process_item(item, _worker_passes, buf)
+        else:
+            process_item(item, _worker_passes, buf)
+        res.append(buf.getvalue())
+    if stats:
+        return res, stats.records
+    return res, None
+
+
+def iter_batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_parallel(items, args, stats=None):
+    "Yield dumps of processed items, in original order."
+    import multiprocessing
+
+    stats_mode = None
+    if stats:
+        stats_mode = stats.trace_mem
+
+    def results(res):
+        texts, records = res.get()
+        if records:
+            stats.records.extend(records)
+        return texts
+
+    with multiprocessing.Pool(args.jobs, _init_worker, (args.xforms, stats_mode)) as pool:
+        # Bound number of batches in flight, so we don't read in entire
+        # input ahead of workers.
+        pending = deque()
+        for batch in iter_batches(items, args.batch_size):
+            pending.append(pool.apply_async(_process_batch, (batch,)))
+            if len(pending) >= 2 * args.jobs:
+                yield from results(pending.popleft())
+        while pending:
+            yield from results(pending.popleft())
+
+
+def iter_items(args, fname):
+    # Items are processed as they are parsed, so only one function (plus
+    # struct types) is kept in memory at a time.
+    if fname.endswith(".ll"):
+        # LLVM IR, converted on the fly.
+        from pseudoc import llvm
+        with open(fname) as f:
+            yield from llvm.import_iter(f)
+    elif args.cache_dir:
+        yield from cache.ParseCache(args.cache_dir, args.cache_size).parse_iter(fname)
+    else:
+        with open(fname) as f:
+            yield from parser.parse_iter(f)
+
+
+def read_manifest(fname):
+    """Read manifest file: each line is input file, optionally followed by
+    output file for it. Empty lines and lines starting with # are skipped.
+    Returns list of (input, output or None)."""
+    res = []
+    with open(fname) as f:
+        for l in f:
+            l = l.strip()
+            if not l or l.startswith("#"):
+                continue
+            fields = l.split(None, 1)
+            if len(fields) == 1:
+                fields.append(None)
+            res.append(tuple(fields))
+    return res
+
+
+def get_inputs(args):
+    "Return list of (input, output file or None for common output)."
+    inputs = [(f, None) for f in args.files]
+    if args.manifest:
+        inputs.extend(read_manifest(args.manifest))
+    if not (args.out_dir or args.out_suffix):
+        return inputs
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+    res = []
+    # Normalized output path -> input, to catch inputs with the same
+    # basename (or manifest entries) overwriting each other's output.
+    seen = {}
+    for fname, out in inputs:
+        if out is None:
+            if args.out_dir:
+                out = os.path.join(args.out_dir, os.path.basename(fname) + (args.out_suffix or ".out"))
+            else:
+                out = fname + args.out_suffix
+        key = os.path.normpath(os.path.abspath(out))
+        if key in seen:
+            argp.error("output file %s is the same for inputs %s and %s" % (out, seen[key], fname))
+        seen[key] = fname
+        res.append((fname, out))
+    return res
+
+
+def input_error(fname, e):
+    return "%s: %s: %s" % (fname, type(e).__name__, e)
+
+
+def process_file(args, fname, passes_list, outfile=None, stats=None, items_func=iter_items, parallel=False):
+    items = items_func(args, fname)
+    if stats:
+        items = stats.iter_parse(items)
+
+    need_empty_line = False
+    if parallel:
+        out = outfile or sys.stdout
+        for s in iter_parallel(items, args, stats):
+            if need_empty_line:
+                out.write("\n")
+            out.write(s)
+            need_empty_line = True
+    elif stats:
+        for func in items:
+            if need_empty_line:
+                print(file=outfile)
+
+            stats.process_item(func, passes_list, outfile)
+
+            need_empty_line = True
+    else:
+        for func in items:
+            if need_empty_line:
+                print(file=outfile)
+
+            process_item(func, passes_list, outfile)
+
+            need_empty_line = True
+
+
+# Worker process state for processing multiple files with -j.
+_worker_args = None
+
+
+def _init_file_worker(args, stats_mode=None):
+    global _worker_args
+    _init_worker(args.xforms, stats_mode)
+    _worker_args = args
+    if args.no_split_after_call:
+        config.SPLIT_BB_AFTER_CALL = False
+    if args.pack_data:
+        config.PACK_DATA = True
+
+
+def _process_file(job):
+    "Returns (output text if no output file given, stats records, error)."
+    fname, out = job
+    stats = None
+    if _worker_stats_mode is not None:
+        stats = PassStats(_worker_stats_mode)
+    text = None
+    try:
+        if out:
+            with open(out, "w") as f:
+                process_file(_worker_args, fname, _worker_passes, f, stats)
+        else:
+            buf = io.StringIO()
+            process_file(_worker_args, fname, _worker_passes, buf, stats)
+            text = buf.getvalue()
+    except Exception as e:
+        return None, None, input_error(fname, e)
+    return text, stats and stats.records, None
+
+
+def iter_parallel_files(inputs, args, stats=None):
+    """Process files in worker processes, yielding (output text or None,
+    error or None) for each, in original order."""
+    import multiprocessing
+
+    stats_mode = None
+    if stats:
+        stats_mode = stats.trace_mem
+
+    with multiprocessing.Pool(args.jobs, _init_file_worker, (args, stats_mode)) as pool:
+        for text, records, err in pool.imap(_process_file, inputs):
+            if records:
+                stats.records.extend(records)
+            yield text, err
+
+
+def run(args, items_func=None, passes_list=None):
+    """Process parsed command line args, return exit status. items_func
+    (args, fname -> iterator of parsed items) and passes_list may be passed
+    in if already available (e.g. when called from pseudoc_server).
+
+    If there are multiple inputs, failure to process one of them is
+    reported and processing continues with the rest. Outputs of inputs
+    without own output file are written to common output, separated with
+    an empty line."""
+    if args.no_split_after_call:
+        config.SPLIT_BB_AFTER_CALL = False
+    if args.pack_data:
+        config.PACK_DATA = True
+
+    if passes_list is None:
+        passes_list = []
+        for x in args.xforms:
+            parse_passes_spec(x, passes_list)
+    if items_func is None:
+        items_func = iter_items
+
+    inputs = get_inputs(args)
+    if not inputs:
+        argp.error("no input files")
+    batch = len(inputs) > 1
 
     # Set up outfile before starting processing, as some passes may output
     # additional information there prior to processed program.
@@ -64,20 +453,55 @@ def __main__():
     if args.out:
         outfile = open(args.out, "w")
 
+    stats = None
+    if args.time_passes or args.stats or args.stats_json:
+        stats = PassStats(trace_mem=args.stats)
+
+    status = 0
     need_empty_line = False
-    for func in mod.contents:
-        if need_empty_line:
-            print(file=outfile)
+    if batch and args.jobs > 1:
+        out = outfile or sys.stdout
+        for text, err in iter_parallel_files(inputs, args, stats):
+            if err:
+                print(err, file=sys.stderr)
+                status = 1
+            elif text is not None:
+                if need_empty_line:
+                    out.write("\n")
+                out.write(text)
+                need_empty_line = True
+    else:
+        for fname, out in inputs:
+            try:
+                if out:
+                    with open(out, "w") as f:
+                        process_file(args, fname, passes_list, f, stats, items_func, args.jobs > 1)
+                else:
+                    if need_empty_line:
+                        print(file=outfile)
+                    process_file(args, fname, passes_list, outfile, stats, items_func, args.jobs > 1)
+                    need_empty_line = True
+            except Exception as e:
+                if not batch:
+                    raise
+                print(input_error(fname, e), file=sys.stderr)
+                status = 1
 
-        for pass_func, pass_params in passes_list:
-            pass_func(func, **pass_params)
+    if outfile:
+        outfile.close()
 
-        func.dump(file=outfile)
+    if stats:
+        if args.time_passes or args.stats:
+            stats.report(args.stats_top, file=sys.stderr)
+        if args.stats_json:
+            with open(args.stats_json, "w") as f:
+                json.dump(stats.to_json(), f, indent=1)
 
-        need_empty_line = True
+    return status
 
-    if outfile:
-        outfile.close()
+
+def __main__():
+    sys.exit(run(argp.parse_args()))
 
 
 if __name__ == "__main__":
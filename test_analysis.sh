@@ -0,0 +1,38 @@
+set -e
+
+#PYTHON=python3
+PYTHON="pycopy -X strict"
+
+# Analyses, and their caching and invalidation: second dump should get all
+# of them from cache, after SSA construction (which preserves only CFG
+# analyses) liveness should be recomputed, and after invalidation keeping
+# only liveness, it should be recomputed again too (as rpo it depends on
+# isn't kept).
+ALL=rpo:domtree:domfrontier:loops:liveness:reaching_defs
+for f in tests/analysis/*.pseudoc; do
+    echo $f
+
+    $PYTHON pseudoc_tool.py \
+        -x "pseudoc.analysis.dump(names=$ALL)" \
+        -x "pseudoc.analysis.dump(names=$ALL)" \
+        -x pseudoc.ssa.construct \
+        -x "pseudoc.analysis.dump(names=loops:liveness:reaching_defs)" \
+        -x "pseudoc.analysis.invalidate(keep=liveness)" \
+        -x "pseudoc.analysis.dump(names=liveness:rpo)" \
+        $f > $f.out
+    diff-hilite -u $f.exp $f.out
+
+    # Output to a file (appended to by each dump) is the same as to stdout
+    # (where -o doesn't redirect it).
+    rm -f $f.dump.out
+    $PYTHON pseudoc_tool.py -o /dev/null \
+        -x "pseudoc.analysis.dump(names=$ALL)" -x "pseudoc.analysis.dump(names=$ALL)" $f > $f.out
+    $PYTHON pseudoc_tool.py -o /dev/null \
+        -x "pseudoc.analysis.dump(names=$ALL,file=$f.dump.out)" -x "pseudoc.analysis.dump(names=$ALL,file=$f.dump.out)" $f
+    diff-hilite -u $f.out $f.dump.out
+    rm $f.dump.out
+
+    # Pruned SSA (uses liveness).
+    $PYTHON pseudoc_tool.py -x "pseudoc.ssa.construct(pruned)" -x "pseudoc.analysis.dump(names=liveness)" $f > $f.out
+    diff-hilite -u $f.pruned.exp $f.out
+done
@@ -0,0 +1,70 @@
+set -e
+
+#PYTHON=python3
+PYTHON="pycopy -X strict"
+
+# Batch processing of several inputs: --out-dir, --out-suffix, --manifest,
+# with and without -j, and errors in some of the inputs.
+OUT=/tmp/pseudoc-batch-$$
+trap "rm -rf $OUT" EXIT
+mkdir -p $OUT
+XFORM="-x pseudoc.ssa.construct"
+FILES=$(ls tests/ssa/*.pseudoc)
+
+check_outs() {
+    # check_outs DIR SUFFIX
+    for f in $FILES; do
+        diff-hilite -u $f.exp $1/$(basename $f)$2
+    done
+}
+
+for j in 1 2; do
+    echo "-j $j"
+
+    rm -rf $OUT/d
+    $PYTHON pseudoc_tool.py -j $j --batch-size 1 $XFORM --out-dir $OUT/d $FILES
+    check_outs $OUT/d .out
+
+    $PYTHON pseudoc_tool.py -j $j --batch-size 1 $XFORM --out-dir $OUT/d --out-suffix .txt $FILES
+    check_outs $OUT/d .txt
+
+    $PYTHON pseudoc_tool.py -j $j --batch-size 1 $XFORM --out-suffix .out $FILES
+    for f in $FILES; do
+        diff-hilite -u $f.exp $f.out
+    done
+
+    # Manifest: inputs with and without explicit output, comments, and
+    # more inputs on command line.
+    rm -rf $OUT/m
+    {
+        echo "# test manifest"
+        echo
+        for f in $FILES; do
+            echo "$f $OUT/$(basename $f).m$j"
+        done
+    } > $OUT/manifest
+    $PYTHON pseudoc_tool.py -j $j --batch-size 1 $XFORM --manifest $OUT/manifest --out-dir $OUT/m tests/ssa/00-loop.pseudoc
+    check_outs $OUT .m$j
+    diff-hilite -u tests/ssa/00-loop.pseudoc.exp $OUT/m/00-loop.pseudoc.out
+
+    # Processing continues after a failing input, with exit status 1.
+    rm -rf $OUT/e
+    echo "foo(" > $OUT/bad.pseudoc
+    status=0
+    $PYTHON pseudoc_tool.py -j $j --batch-size 1 $XFORM --out-dir $OUT/e $OUT/bad.pseudoc $FILES 2> $OUT/err || status=$?
+    test $status = 1
+    grep -q "^$OUT/bad.pseudoc: LexerError: " $OUT/err
+    check_outs $OUT/e .out
+done
+
+# Inputs with the same basename would write the same output file.
+echo "collision"
+mkdir -p $OUT/dup
+cp tests/ssa/00-loop.pseudoc $OUT/dup/
+status=0
+$PYTHON pseudoc_tool.py --out-dir $OUT/c tests/ssa/00-loop.pseudoc $OUT/dup/00-loop.pseudoc 2> $OUT/err || status=$?
+test $status = 2
+grep -q "output file $OUT/c/00-loop.pseudoc.out is the same for inputs" $OUT/err
+test ! -e $OUT/c/00-loop.pseudoc.out
+
+rm -f tests/ssa/*.out
@@ -0,0 +1,99 @@
+set -e
+
+#PYTHON=python3
+PYTHON="pycopy -X strict"
+
+# Parse cache (--cache-dir): misses, hits, invalidation and eviction.
+CACHE=/tmp/pseudoc-cache-$$
+trap "rm -rf $CACHE $CACHE.2" EXIT
+
+entries() {
+    ls $CACHE/*.pscb 2>/dev/null | wc -l
+}
+
+# Path of cache entry for a file.
+entry() {
+    $PYTHON -c "from pseudoc import cache; c = cache.ParseCache('$CACHE'); print(c.entry_path(c.key('$1')[0]))"
+}
+
+for f in tests/ssa/*.pseudoc; do
+    echo $f
+
+    # Miss, then hit.
+    $PYTHON pseudoc_tool.py --cache-dir $CACHE -x pseudoc.ssa.construct $f > $f.out
+    diff-hilite -u $f.exp $f.out
+    $PYTHON pseudoc_tool.py --cache-dir $CACHE -x pseudoc.ssa.construct $f > $f.out
+    diff-hilite -u $f.exp $f.out
+done
+n=$(ls tests/ssa/*.pseudoc | wc -l)
+test $(entries) = $n
+
+echo "hit is served from cache entry"
+f=tests/ssa/00-loop.pseudoc
+f2=tests/ssa/05-entry_preds.pseudoc
+cp $(entry $f2) $(entry $f)
+$PYTHON pseudoc_tool.py --cache-dir $CACHE -x pseudoc.ssa.construct $f > $f.out
+diff-hilite -u $f2.exp $f.out
+
+echo "corrupted entry is reparsed"
+: > $(entry $f)
+$PYTHON pseudoc_tool.py --cache-dir $CACHE -x pseudoc.ssa.construct $f > $f.out
+diff-hilite -u $f.exp $f.out
+test -s $(entry $f)
+
+# Entry with overwritten trailer (index offset within file, or out of
+# it), truncated, or with a byte of (the first) item body flipped.
+for corrupt in \
+    "b = b[:-12] + (8).to_bytes(8, 'little') + b[-4:]" \
+    "b = b[:-12] + b'\xff' * 8 + b[-4:]" \
+    "b = b[:len(b) // 2]" \
+    "b = b[:20] + bytes([b[20] ^ 0xff]) + b[21:]"
+do
+    echo "corrupted entry is reparsed: $corrupt"
+    $PYTHON -c "
+p = '$(entry $f)'
+b = open(p, 'rb').read()
+$corrupt
+open(p, 'wb').write(b)
+"
+    $PYTHON pseudoc_tool.py --cache-dir $CACHE -x pseudoc.ssa.construct $f > $f.out
+    diff-hilite -u $f.exp $f.out
+done
+
+echo "changed parse options"
+f=tests/roundtrip/10-funcalls.pseudoc
+$PYTHON pseudoc_tool.py --no-split-after-call $f > $f.exp.nocache
+$PYTHON pseudoc_tool.py --cache-dir $CACHE --no-split-after-call $f > $f.out
+diff-hilite -u $f.exp.nocache $f.out
+$PYTHON pseudoc_tool.py --cache-dir $CACHE $f > $f.out
+if cmp -s $f.exp.nocache $f.out; then
+    echo "cached result for other options used"
+    exit 1
+fi
+rm $f.exp.nocache
+test $(entries) = $((n + 2))
+
+echo "changed input"
+src=$CACHE/src.pseudoc
+cp tests/ssa/00-loop.pseudoc $src
+$PYTHON pseudoc_tool.py --cache-dir $CACHE $src > /dev/null
+sed -i 's/100/200/' $src
+$PYTHON pseudoc_tool.py $src > $src.exp
+$PYTHON pseudoc_tool.py --cache-dir $CACHE $src > $src.out
+diff-hilite -u $src.exp $src.out
+
+echo "eviction"
+# Room for just two entries: a new one and most recently used one (entries
+# are written to cache on miss, so size of new one is found using another
+# cache dir).
+sed -i 's/200/300/' $src
+$PYTHON pseudoc_tool.py --cache-dir $CACHE.2 $src > /dev/null
+size=$(cat $CACHE.2/*.pscb | wc -c)
+rm -rf $CACHE.2
+f=tests/ssa/10-undef.pseudoc
+size=$((size + $(wc -c < $(entry $f))))
+touch $(entry $f)
+$PYTHON pseudoc_tool.py --cache-dir $CACHE --cache-size $size $src > $src.out
+test $(entries) = 2
+test -f $(entry $f)
+test -f $(entry $src)
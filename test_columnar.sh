@@ -0,0 +1,28 @@
+set -e
+
+#PYTHON=python3
+PYTHON="pycopy -X strict"
+
+# Vectorized implementations are checked against the same results, if
+# NumPy is available.
+if $PYTHON -c "import numpy" 2>/dev/null; then
+    NUMPY_OPTS="--no-numpy -"
+else
+    NUMPY_OPTS="--no-numpy"
+fi
+
+for f in tests/columnar/*.pseudoc; do
+    echo $f
+
+    for o in $NUMPY_OPTS; do
+        [ $o = - ] && o=
+        $PYTHON -m pseudoc.columnar $o $f > $f.out
+        diff-hilite -u $f.exp $f.out
+
+        # Columns edited in place, and stored back to module.
+        if [ -f $f.replace ]; then
+            $PYTHON -m pseudoc.columnar $o $(cat $f.replace) $f > $f.out
+            diff-hilite -u $f.store.exp $f.out
+        fi
+    done
+done
@@ -0,0 +1,11 @@
+set -e
+
+#PYTHON=python3
+PYTHON="pycopy -X strict"
+
+for f in tests/fold/*.pseudoc; do
+    echo $f
+
+    $PYTHON pseudoc_tool.py -x pseudoc.fold.sizeof $f > $f.out
+    diff-hilite -u $f.exp $f.out
+done
@@ -0,0 +1,33 @@
+set -e
+
+#PYTHON=python3
+PYTHON="pycopy -X strict"
+
+for f in tests/image/*.pseudoc; do
+    echo $f
+
+    $PYTHON -m pseudoc.image --base 0x1000 $f -o $f.bin > $f.out
+    od -A x -t x1 -v $f.bin >> $f.out
+    $PYTHON pseudoc_tool.py --pack-data $f >> $f.out
+    diff-hilite -u $f.exp $f.out
+
+    # External blob files (resolving a reloc against ext), including an
+    # empty one.
+    $PYTHON -m pseudoc.image --base 0x1000 --blob ext=tests/image/blob.dat --blob none=tests/image/empty.dat $f -o $f.bin > $f.out
+    od -A x -t x1 -v $f.bin >> $f.out
+    diff-hilite -u $f.blob.exp $f.out
+
+    # Rendering as C (with 4-byte pointers of default layout).
+    $PYTHON -m pseudoc.csyntax --ptr-size 4 $f > $f.out
+    diff-hilite -u $f.c.exp $f.out
+
+    # Rendering with host's pointer size should be accepted by host's C
+    # compiler (pseudoc.h is only needed for code, so empty one is used).
+    if command -v cc > /dev/null; then
+        $PYTHON -m pseudoc.csyntax $f > $f.out.c
+        mkdir -p tests/image/inc
+        touch tests/image/inc/pseudoc.h
+        cc -Wall -Werror -Itests/image/inc -c $f.out.c -o $f.out.o
+        rm -r $f.out.c $f.out.o tests/image/inc
+    fi
+done
@@ -0,0 +1,13 @@
+set -e
+
+#PYTHON=python3
+PYTHON="pycopy -X strict"
+
+# Incremental parse of an edited version should give the same result as
+# parsing it from scratch.
+for f in tests/incremental/*.pseudoc; do
+    echo $f
+
+    $PYTHON -m pseudoc.incremental $f $f.edit > $f.out
+    diff-hilite -u $f.exp $f.out
+done
@@ -0,0 +1,37 @@
+set -e
+
+#PYTHON=python3
+PYTHON="pycopy -X strict"
+
+# Programs should produce the same results before and after lowering passes.
+for f in tests/interp/*.pseudoc; do
+    echo $f
+
+    $PYTHON -m pseudoc.interp $f > $f.out
+    diff-hilite -u $f.exp $f.out
+    $PYTHON -m pseudoc.interp -x pseudoc.ssa.construct $f > $f.out
+    diff-hilite -u $f.exp $f.out
+    $PYTHON -m pseudoc.interp -x "pseudoc.regalloc.linear_scan(caller=r0:r1, callee=r2)" $f > $f.out
+    diff-hilite -u $f.exp $f.out
+    $PYTHON -m pseudoc.interp -x pseudoc.fold.sizeof $f > $f.out
+    diff-hilite -u $f.exp $f.out
+    # Compiled to Python code.
+    $PYTHON -m pseudoc.interp --jit $f > $f.out
+    diff-hilite -u $f.exp $f.out
+    $PYTHON -m pseudoc.interp --jit -x pseudoc.ssa.construct $f > $f.out
+    diff-hilite -u $f.exp $f.out
+    $PYTHON -m pseudoc.interp --jit -x "pseudoc.regalloc.linear_scan(caller=r0:r1, callee=r2)" $f > $f.out
+    diff-hilite -u $f.exp $f.out
+done
+
+# Unsupported escape in a string literal in code is an error, like in data
+# (same escapes are supported, see parser.unescape()).
+BAD=/tmp/pseudoc-escape-$$.pseudoc
+printf 'main() {\n    puts("a\\tb")\n    return 0\n}\n' > $BAD
+for o in "" --jit; do
+    if $PYTHON -m pseudoc.interp $o $BAD 2> $BAD.err; then
+        exit 1
+    fi
+    grep -q 'unsupported escape in string: "a\\tb"' $BAD.err
+done
+rm -f $BAD $BAD.err
@@ -0,0 +1,271 @@
+# Tests of IR manipulation API: def-use chains (Arg.defi, Insn.uses) and
+# BBlock insn editing, on a small function in SSA form. Also of memoized
+# type layouts (DataLayout) staying valid as structs are redefined.
+#
+# Usage: python test_ir.py
+import sys
+import io
+import traceback
+
+from pseudoc import parser
+from pseudoc import ssa
+from pseudoc import serialize
+from pseudoc import fold
+from pseudoc.incremental import IncrementalParser
+from pseudoc.ir import Insn, DataLayout, TypeTable, DEFAULT_LAYOUT
+
+
+SRC = """\
+fun($a, $b) {
+    $c = $a + $b
+    $d = $c * 2
+    if ($d > 10) goto big
+    $d = $c - 1
+big:
+    $e = $d + $c
+    return $e
+}
+"""
+
+
+def parse():
+    func = parser.parse(io.StringIO(SRC)).contents[0]
+    ssa.construct(func)
+    return func
+
+
+def insns(func):
+    "Map of SSA value names to defining insns."
+    return {insn.dest_name(): insn for bb in func.bblocks for insn in bb.insns if insn.dest}
+
+
+def dump(func):
+    buf = io.StringIO()
+    func.dump(file=buf, bb_ann=False)
+    return buf.getvalue()
+
+
+def check_uses(func):
+    "Check that use lists are exactly the args referring to each insn."
+    exp = {}
+    for bb in func.bblocks:
+        for insn in bb.insns:
+            for a in insn.args:
+                if a.defi is not None:
+                    exp.setdefault(a.defi, set()).add(a)
+    for bb in func.bblocks:
+        for insn in bb.insns:
+            assert set(insn.uses) == exp.get(insn, set()), insn
+            assert insn.has_uses() == (insn in exp), insn
+
+
+def test_construct():
+    func = parse()
+    check_uses(func)
+    v = insns(func)
+    assert len(v["$c_2"].uses) == 3
+    assert len(v["$e_7"].uses) == 1
+    # Phi args are uses too.
+    assert v["$d_6"].args[1] in v["$d_5"].uses
+
+
+def test_defi_setter():
+    func = parse()
+    v = insns(func)
+    c, d = v["$c_2"], v["$d_3"]
+    a = v["$e_7"].args[1]
+    assert a.defi is c
+    a.defi = d
+    assert a in d.uses and a not in c.uses
+    # Setting the same value is a no-op.
+    a.defi = d
+    assert list(d.uses).count(a) == 1
+    a.defi = None
+    assert a not in d.uses
+    a.defi = c
+    check_uses(func)
+
+
+def test_rauw_insn():
+    func = parse()
+    v = insns(func)
+    c, b = v["$c_2"], v["$b_1"]
+    uses = set(c.uses)
+    c.replace_all_uses_with(b)
+    assert not c.has_uses()
+    assert set(b.uses) >= uses
+    check_uses(func)
+    assert "$c_2 * 2" not in dump(func) and "$b_1 * 2" in dump(func)
+
+
+def test_rauw_const():
+    func = parse()
+    v = insns(func)
+    c = v["$c_2"]
+    args = list(c.uses)
+    c.replace_all_uses_with(5)
+    assert not c.has_uses()
+    for a in args:
+        assert a.defi is None and a.val == 5
+    check_uses(func)
+    assert "5 * 2" in dump(func)
+
+
+def test_erase():
+    func = parse()
+    v = insns(func)
+    c, d = v["$c_2"], v["$d_3"]
+    bb = func.bblocks[0]
+    # Can't erase insn with uses.
+    try:
+        bb.erase(c)
+        assert False
+    except AssertionError as e:
+        assert e.args and e.args[0] is c
+    assert c in bb.insns
+    # Once uses are replaced, can, and its args are removed from use
+    # lists of their defs.
+    c.replace_all_uses_with(7)
+    a_uses = len(v["$a_0"].uses)
+    bb.erase(c)
+    assert c not in bb.insns
+    assert len(v["$a_0"].uses) == a_uses - 1
+    check_uses(func)
+    # By index.
+    idx = bb.insns.index(d)
+    d.replace_all_uses_with(0)
+    bb.erase(d, idx)
+    assert d not in bb.insns
+    check_uses(func)
+
+
+def test_erase_all():
+    func = parse()
+    v = insns(func)
+    bb = func.bblocks[0]
+    # $d_3 uses $c_2, but both are removed (after their other uses).
+    c, d = v["$c_2"], v["$d_3"]
+    for a in list(c.uses):
+        if a not in d.args:
+            a.defi = None
+            a.val = 0
+    for a in list(d.uses):
+        a.defi = None
+        a.val = 0
+    n = len(bb.insns)
+    bb.erase_all({c, d})
+    assert len(bb.insns) == n - 2 and c not in bb.insns and d not in bb.insns
+    check_uses(func)
+
+
+def test_insert():
+    func = parse()
+    v = insns(func)
+    bb = func.bblocks[0]
+    c = v["$c_2"]
+    idx = bb.insns.index(c)
+    before = Insn("$x", "=", 1)
+    after = Insn("$y", "=", 2)
+    bb.insert_before(c, before)
+    assert bb.insns[idx] is before and bb.insns[idx + 1] is c
+    bb.insert_after(c, after, idx + 1)
+    assert bb.insns[idx + 2] is after
+    try:
+        bb.insert_after(c, Insn("$z", "=", 3), idx)
+        assert False
+    except AssertionError:
+        pass
+
+
+def test_serialize():
+    func = parse()
+    v = insns(func)
+    buf = io.BytesIO()
+    w = serialize.Writer(buf)
+    w.add(func)
+    w.close()
+    func2 = serialize.Reader(buf.getvalue()).item(0)
+    check_uses(func2)
+    assert dump(func2) == dump(func)
+    v2 = insns(func2)
+    assert len(v2["$c_2"].uses) == len(v["$c_2"].uses)
+
+
+def test_serialize_corrupted():
+    "Any corrupted byte is reported as FormatError."
+    buf = io.BytesIO()
+    w = serialize.Writer(buf)
+    w.add(parse())
+    w.close()
+    data = buf.getvalue()
+    for i in range(len(data)):
+        b = bytearray(data)
+        b[i] ^= 0x55
+        try:
+            r = serialize.Reader(bytes(b))
+            list(r)
+            assert False, "corruption at %d not detected" % i
+        except serialize.FormatError:
+            pass
+
+
+STRUCT_SRC = """\
+struct S { %s }
+
+struct T { struct S s, i8 c }
+
+fun() {
+    $p = @alloca(@sizeof(struct S))
+    $q = @alloca(@sizeof(struct T[2]))
+    return $p
+}
+"""
+
+
+def sizes(mod, ptr_size):
+    "Sizes which @sizeof args of mod's function fold to."
+    layout = fold.get_layout(ptr_size)
+    func = mod.contents[-1]
+    return [layout.size(insn.args[0].val.args[0].val) for insn in func.bblocks[0].insns if insn.op == "@alloca"]
+
+
+def test_layout_redefined_struct():
+    p = IncrementalParser()
+    mod = p.parse(STRUCT_SRC % "i32 a")
+    assert sizes(mod, 4) == sizes(mod, 8) == [4, 16]
+    # Function is reused, but struct S it refers to is redefined.
+    mod = p.parse(STRUCT_SRC % "i32 a, void* b, i8 c")
+    assert p.reused == 2
+    assert sizes(mod, 4) == [12, 32]
+    assert sizes(mod, 8) == [24, 64]
+    mod2 = parser.parse(io.StringIO(STRUCT_SRC % "i32 a, void* b, i8 c"))
+    assert sizes(mod2, 4) == sizes(mod, 4)
+
+
+def test_layout_max_cached():
+    types = TypeTable()
+    layout = DataLayout(max_cached=10)
+    for i in range(1, 30):
+        assert layout.size(types.arr(types.prim("i16"), i)) == 2 * i
+        assert len(layout.cache) <= 10
+    assert DEFAULT_LAYOUT.max_cached is not None
+
+
+def __main__():
+    tests = [(name, f) for name, f in sorted(globals().items()) if name.startswith("test_")]
+    failed = []
+    for name, f in tests:
+        try:
+            f()
+        except Exception:
+            traceback.print_exc()
+            failed.append(name)
+    print("%d tests, %d failed" % (len(tests), len(failed)))
+    for name in failed:
+        print("FAILED: %s" % name)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    __main__()
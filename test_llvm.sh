@@ -0,0 +1,21 @@
+set -e
+
+#PYTHON=python3
+PYTHON="pycopy -X strict"
+
+# Import LLVM IR, then check that imported program produces the same
+# result as the original (as run by lli, recorded in .run.exp).
+for f in tests/llvm/*.ll; do
+    echo $f
+
+    $PYTHON -m pseudoc.llvm -k $f > $f.out
+    diff-hilite -u $f.exp $f.out
+    $PYTHON -m pseudoc.interp $f.exp > $f.out
+    diff-hilite -u $f.run.exp $f.out
+done
+
+# Packed struct, which has different layout in PseudoC, is an error with
+# --strict.
+if $PYTHON -m pseudoc.llvm --strict tests/llvm/20-struct.ll > /dev/null 2>&1; then
+    exit 1
+fi
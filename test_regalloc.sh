@@ -0,0 +1,23 @@
+set -e
+
+#PYTHON=python3
+PYTHON="pycopy -X strict"
+
+for f in tests/regalloc/*.pseudoc; do
+    echo $f
+
+    $PYTHON pseudoc_tool.py -x "pseudoc.regalloc.linear_scan(caller=r0:r1, callee=r2)" $f > $f.out
+    diff-hilite -u $f.exp $f.out
+    # Output of parallel pipeline must be identical to serial one.
+    $PYTHON pseudoc_tool.py -j 2 --batch-size 1 -x "pseudoc.regalloc.linear_scan(caller=r0:r1, callee=r2)" $f > $f.out
+    diff-hilite -u $f.exp $f.out
+done
+
+# Minimal register set: an insn can't need more than 2 registers (only
+# calls with more args can).
+for f in tests/regalloc/2regs/*.pseudoc; do
+    echo $f
+
+    $PYTHON pseudoc_tool.py -x "pseudoc.regalloc.linear_scan(caller=r0, callee=r1)" $f > $f.out
+    diff-hilite -u $f.exp $f.out
+done
@@ -0,0 +1,119 @@
+# Runner for roundtrip and pass regression tests (tests/<suite>/*.pseudoc,
+# with expected output in .exp), equivalent to test_roundtrip.sh,
+# test_ssa.sh, test_regalloc.sh and test_fold.sh, but running all tests
+# in-process, in a pool of worker processes, instead of starting an
+# interpreter per test. For failed tests, output is left in <test>.out
+# and diff printed.
+#
+# Usage: python test_roundtrip.py [-j N] [suite...]
+import sys
+import os
+import io
+import glob
+import difflib
+import argparse
+import traceback
+import contextlib
+
+from pseudoc import parser
+import pseudoc_tool
+
+
+# suite -> pass spec, or None for parser roundtrip (as done by
+# "python -m pseudoc.parser").
+SUITES = {
+    "roundtrip": None,
+    "ssa": "pseudoc.ssa.construct",
+    "regalloc": "pseudoc.regalloc.linear_scan(caller=r0:r1, callee=r2)",
+    "fold": "pseudoc.fold.sizeof",
+}
+
+# Per-process cache of parsed pass specs.
+_passes = {}
+
+
+def get_passes(spec):
+    passes_list = _passes.get(spec)
+    if passes_list is None:
+        passes_list = _passes[spec] = []
+        pseudoc_tool.parse_passes_spec(spec, passes_list)
+    return passes_list
+
+
+def run(spec, fname):
+    "Return output of processing fname, as done by corresponding tool."
+    buf = io.StringIO()
+    with contextlib.redirect_stdout(buf):
+        try:
+            with open(fname) as f:
+                if spec is None:
+                    parser.parse(f).dump(bb_ann=False, expl_goto=True)
+                else:
+                    passes_list = get_passes(spec)
+                    need_empty_line = False
+                    for item in parser.parse_iter(f):
+                        if need_empty_line:
+                            print()
+                        pseudoc_tool.process_item(item, passes_list)
+                        need_empty_line = True
+        except Exception:
+            traceback.print_exc(file=buf)
+    return buf.getvalue()
+
+
+def run_test(job):
+    "Return (test file, diff against expected output or None)."
+    suite, fname = job
+    out = run(SUITES[suite], fname)
+    exp_fname = fname + ".exp"
+    with open(exp_fname) as f:
+        exp = f.read()
+    if out == exp:
+        return fname, None
+    out_fname = fname + ".out"
+    with open(out_fname, "w") as f:
+        f.write(out)
+    diff = difflib.unified_diff(exp.splitlines(True), out.splitlines(True), exp_fname, out_fname)
+    return fname, "".join(diff)
+
+
+def __main__():
+    argp = argparse.ArgumentParser(description="Run PseudoC roundtrip and pass regression tests")
+    argp.add_argument("suites", nargs="*", metavar="suite", help="suites to run (default: all of %s)" % ", ".join(SUITES))
+    argp.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    args = argp.parse_args()
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    jobs = []
+    for suite in args.suites or SUITES:
+        if suite not in SUITES:
+            argp.error("unknown suite: %s" % suite)
+        for fname in sorted(glob.glob("tests/%s/*.pseudoc" % suite)):
+            jobs.append((suite, fname))
+
+    if args.jobs > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(args.jobs)
+        results = pool.imap(run_test, jobs, max(1, len(jobs) // (args.jobs * 4)))
+    else:
+        pool = None
+        results = map(run_test, jobs)
+
+    failed = []
+    for fname, diff in results:
+        if diff is not None:
+            failed.append(fname)
+            sys.stdout.write(diff)
+    if pool:
+        pool.close()
+        pool.join()
+
+    print("%d tests, %d failed" % (len(jobs), len(failed)))
+    for fname in failed:
+        print("FAILED: %s" % fname)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    __main__()
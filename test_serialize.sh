@@ -0,0 +1,30 @@
+set -e
+
+#PYTHON=python3
+PYTHON="pycopy -X strict"
+
+# Output after serializing and reading back should be the same as
+# pseudoc_tool's (plain, with packed data, in SSA form - which checks
+# Arg.defi links, via names they're dumped with - and via MappedReader).
+for f in tests/roundtrip/*.pseudoc; do
+    echo $f
+
+    for opts in "" "--pack-data" "-x pseudoc.ssa.construct"; do
+        $PYTHON pseudoc_tool.py $opts $f > $f.exp.ser
+        $PYTHON -m pseudoc.serialize $opts $f > $f.out
+        diff-hilite -u $f.exp.ser $f.out
+        rm $f.exp.ser
+    done
+    $PYTHON pseudoc_tool.py -x pseudoc.ssa.construct $f > $f.exp.ser
+    $PYTHON -m pseudoc.serialize --mmap -x pseudoc.ssa.construct $f > $f.out
+    diff-hilite -u $f.exp.ser $f.out
+    rm $f.exp.ser
+done
+
+# Allocated registers (Arg.reg, Insn.reg).
+for f in tests/regalloc/*.pseudoc; do
+    echo $f
+
+    $PYTHON -m pseudoc.serialize -x "pseudoc.regalloc.linear_scan(caller=r0:r1, callee=r2)" $f > $f.out
+    diff-hilite -u $f.exp $f.out
+done
@@ -0,0 +1,50 @@
+set -e
+
+#PYTHON=python3
+PYTHON="pycopy -X strict"
+
+# Run SSA tests via pseudoc_server/pseudoc_client.
+export PSEUDOC_SOCKET=/tmp/pseudoc-test-$$.sock
+# Module with a slow pass, to send signals during a request.
+PASSES=/tmp/pseudoc-test-$$
+mkdir -p $PASSES
+cat > $PASSES/slow_pass.py <<PY
+import time
+
+def sleep(func, marker, secs):
+    open(marker, "w").close()
+    time.sleep(float(secs))
+PY
+PYTHONPATH=$PASSES $PYTHON pseudoc_server.py &
+SERVER=$!
+trap "kill $SERVER 2>/dev/null || true; rm -rf $PASSES" EXIT
+while [ ! -S $PSEUDOC_SOCKET ]; do sleep 0.1; done
+
+for f in tests/ssa/*.pseudoc; do
+    echo $f
+
+    # Twice, 2nd time using parse result cached by server.
+    $PYTHON pseudoc_client.py -x pseudoc.ssa.construct $f > $f.out
+    diff-hilite -u $f.exp $f.out
+    $PYTHON pseudoc_client.py -x pseudoc.ssa.construct $f > $f.out
+    diff-hilite -u $f.exp $f.out
+done
+
+echo "usage error doesn't stop server"
+status=0
+$PYTHON pseudoc_client.py --no-such-option $f > /dev/null 2> $PASSES/err || status=$?
+test $status = 2
+grep -q "unrecognized arguments: --no-such-option" $PASSES/err
+$PYTHON pseudoc_client.py -x pseudoc.ssa.construct $f > $f.out
+diff-hilite -u $f.exp $f.out
+
+echo "SIGTERM during request"
+$PYTHON pseudoc_client.py -x pseudoc.ssa.construct -x "slow_pass.sleep(marker=$PASSES/started, secs=1)" $f > $f.out &
+CLIENT=$!
+while [ ! -f $PASSES/started ]; do sleep 0.1; done
+kill $SERVER
+# Request is completed, then server exits cleanly.
+wait $CLIENT
+diff-hilite -u $f.exp $f.out
+wait $SERVER
+test ! -e $PSEUDOC_SOCKET
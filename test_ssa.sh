@@ -0,0 +1,14 @@
+set -e
+
+#PYTHON=python3
+PYTHON="pycopy -X strict"
+
+for f in tests/ssa/*.pseudoc; do
+    echo $f
+
+    $PYTHON pseudoc_tool.py -x pseudoc.ssa.construct $f > $f.out
+    diff-hilite -u $f.exp $f.out
+    # Output of parallel pipeline must be identical to serial one.
+    $PYTHON pseudoc_tool.py -j 2 --batch-size 1 -x pseudoc.ssa.construct $f > $f.out
+    diff-hilite -u $f.exp $f.out
+done
@@ -0,0 +1,49 @@
+set -e
+
+#PYTHON=python3
+PYTHON="pycopy -X strict"
+
+# Smoke test of --time-passes/--stats: output is not affected, report is
+# produced, and JSON data has records for parsing, dumping and each pass.
+XFORMS="-x pseudoc.ssa.construct -x pseudoc.regalloc.linear_scan(caller=r0:r1,callee=r2)"
+PASSES="pseudoc.ssa.construct pseudoc.regalloc.linear_scan(caller=r0:r1,callee=r2)"
+
+check_json() {
+    $PYTHON -c "
+import sys, json
+d = json.load(open(sys.argv[1]))
+stages = set(r['stage'] for r in d['records'])
+exp = set(['parse', 'dump'] + sys.argv[3:])
+assert stages == exp, (stages, exp)
+assert set(d['totals']) == exp
+for r in d['records']:
+    assert r['wall'] >= 0 and r['cpu'] >= 0
+    assert (r['mem_peak'] is not None) == (sys.argv[2] == 'mem'), r
+" "$@"
+}
+
+for f in tests/ssa/*.pseudoc; do
+    echo $f
+
+    $PYTHON pseudoc_tool.py $XFORMS $f > $f.exp.stats
+    for opts in "--time-passes" "--stats --stats-top 3" "-j 2 --batch-size 1 --time-passes" ""; do
+        $PYTHON pseudoc_tool.py $opts --stats-json $f.json $XFORMS $f > $f.out 2> $f.err
+        diff-hilite -u $f.exp.stats $f.out
+        case "$opts" in
+        "")
+            # --stats-json alone: data is collected, but not reported.
+            test ! -s $f.err
+            ;;
+        *) grep -q "=== Totals per stage ===" $f.err ;;
+        esac
+        case "$opts" in
+        --stats*)
+            check_json $f.json mem $PASSES
+            # Title, header, 3 records and next title.
+            test $(sed -n "/^=== Hottest/,/^=== Totals/p" $f.err | wc -l) -le 6
+            ;;
+        *) check_json $f.json time $PASSES ;;
+        esac
+    done
+    rm $f.exp.stats $f.err $f.json
+done
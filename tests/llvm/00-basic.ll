@@ -0,0 +1,86 @@
+; Typical unoptimized (clang -O0) code: locals in allocas, typed pointers.
+source_filename = "basic.c"
+target datalayout = "e-m:e-p270:32:32-p271:32:32-p272:64:64-i64:64-f80:128-n8:16:32:64-S128"
+target triple = "x86_64-pc-linux-gnu"
+
+@counter = dso_local global i32 0, align 4
+@.str = private unnamed_addr constant [7 x i8] c"hello\0A\00", align 1
+@msg = dso_local global i8* getelementptr inbounds ([7 x i8], [7 x i8]* @.str, i32 0, i32 0), align 8
+
+; Function Attrs: noinline nounwind optnone uwtable
+define dso_local i32 @add(i32 noundef %a, i32 noundef %b) #0 {
+entry:
+  %a.addr = alloca i32, align 4
+  %b.addr = alloca i32, align 4
+  store i32 %a, i32* %a.addr, align 4
+  store i32 %b, i32* %b.addr, align 4
+  %0 = load i32, i32* %a.addr, align 4
+  %1 = load i32, i32* %b.addr, align 4
+  %add = add nsw i32 %0, %1
+  ret i32 %add
+}
+
+define dso_local i32 @fact(i32 noundef %n) #0 {
+entry:
+  %retval = alloca i32, align 4
+  %n.addr = alloca i32, align 4
+  store i32 %n, i32* %n.addr, align 4
+  %0 = load i32, i32* %n.addr, align 4
+  %cmp = icmp sle i32 %0, 1
+  br i1 %cmp, label %if.then, label %if.end
+
+if.then:                                          ; preds = %entry
+  store i32 1, i32* %retval, align 4
+  br label %return
+
+if.end:                                           ; preds = %entry
+  %1 = load i32, i32* %n.addr, align 4
+  %2 = load i32, i32* %n.addr, align 4
+  %sub = sub nsw i32 %2, 1
+  %call = call i32 @fact(i32 noundef %sub)
+  %mul = mul nsw i32 %1, %call
+  store i32 %mul, i32* %retval, align 4
+  br label %return
+
+return:                                           ; preds = %if.end, %if.then
+  %3 = load i32, i32* %retval, align 4
+  ret i32 %3
+}
+
+define dso_local void @print(i8* noundef %s) #0 {
+entry:
+  %s.addr = alloca i8*, align 8
+  store i8* %s, i8** %s.addr, align 8
+  %0 = load i8*, i8** %s.addr, align 8
+  %call = call i32 @puts(i8* noundef %0)
+  %1 = load i32, i32* @counter, align 4
+  %inc = add nsw i32 %1, 1
+  store i32 %inc, i32* @counter, align 4
+  ret void
+}
+
+declare i32 @puts(i8* noundef) #1
+
+define dso_local i32 @main() #0 {
+entry:
+  %0 = load i8*, i8** @msg, align 8
+  call void @print(i8* noundef %0)
+  call void @print(i8* noundef getelementptr inbounds ([7 x i8], [7 x i8]* @.str, i64 0, i64 2))
+  %call = call i32 @fact(i32 noundef 5)
+  %call1 = call i32 @add(i32 noundef %call, i32 noundef 3)
+  %1 = load i32, i32* @counter, align 4
+  %conv = sext i32 %1 to i64
+  %2 = trunc i64 %conv to i32
+  %add = add nsw i32 %call1, %2
+  %p = bitcast i32* @counter to i8*
+  call void @llvm.lifetime.end.p0i8(i64 4, i8* %p)
+  ret i32 %add
+}
+
+declare void @llvm.lifetime.end.p0i8(i64 immarg, i8* nocapture)
+
+attributes #0 = { noinline nounwind optnone uwtable "frame-pointer"="all" }
+attributes #1 = { "frame-pointer"="all" }
+
+!llvm.module.flags = !{!0}
+!0 = !{i32 7, !"PIC Level", i32 2}
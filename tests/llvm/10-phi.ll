@@ -0,0 +1,104 @@
+; Optimized code: phis (incl. swapped values in loop), select, switch,
+; unsigned ops, loops.
+target datalayout = "e-m:e-p270:32:32-p271:32:32-p272:64:64-i64:64-f80:128-n8:16:32:64-S128"
+
+; Sum of 0..n-1
+define dso_local i32 @sum(i32 %n) local_unnamed_addr #0 {
+  %1 = icmp sgt i32 %n, 0
+  br i1 %1, label %loop, label %exit
+
+loop:                                             ; preds = %0, %loop
+  %i = phi i32 [ %i.next, %loop ], [ 0, %0 ]
+  %acc = phi i32 [ %acc.next, %loop ], [ 0, %0 ]
+  %acc.next = add nsw i32 %acc, %i
+  %i.next = add nuw nsw i32 %i, 1
+  %done = icmp eq i32 %i.next, %n
+  br i1 %done, label %exit, label %loop
+
+exit:                                             ; preds = %loop, %0
+  %res = phi i32 [ 0, %0 ], [ %acc.next, %loop ]
+  ret i32 %res
+}
+
+; Fibonacci, with values swapped by phis.
+define dso_local i32 @fib(i32 %n) {
+entry:
+  br label %loop
+
+loop:
+  %a = phi i32 [ 0, %entry ], [ %b, %loop ]
+  %b = phi i32 [ 1, %entry ], [ %c, %loop ]
+  %k = phi i32 [ %n, %entry ], [ %k.dec, %loop ]
+  %c = add i32 %a, %b
+  %k.dec = add i32 %k, -1
+  %more = icmp sgt i32 %k, 0
+  br i1 %more, label %loop, label %done
+
+done:
+  ret i32 %a
+}
+
+define dso_local i32 @classify(i32 %x) {
+entry:
+  switch i32 %x, label %other [
+    i32 0, label %zero
+    i32 1, label %one
+    i32 7, label %one
+  ]
+
+zero:
+  br label %out
+
+one:
+  br label %out
+
+other:
+  %neg = icmp slt i32 %x, 0
+  %v = select i1 %neg, i32 -1, i32 2
+  br label %out
+
+out:
+  %r = phi i32 [ 10, %zero ], [ 11, %one ], [ %v, %other ]
+  ret i32 %r
+}
+
+define dso_local i32 @unsigned_ops(i32 %a, i32 %b) {
+entry:
+  %q = udiv i32 %a, %b
+  %r = urem i32 %a, %b
+  %s = lshr i32 %a, 28
+  %lt = icmp ult i32 %a, %b
+  %lt.ext = zext i1 %lt to i32
+  %t = add i32 %q, %r
+  %t2 = add i32 %t, %s
+  %t3 = add i32 %t2, %lt.ext
+  %byte = trunc i32 %a to i8
+  %byte.ext = zext i8 %byte to i32
+  %t4 = add i32 %t3, %byte.ext
+  %wide = sext i32 %t4 to i64
+  %wide2 = mul i64 %wide, 4294967296
+  %hi = ashr i64 %wide2, 32
+  %res = trunc i64 %hi to i32
+  ret i32 %res
+}
+
+define dso_local i32 @main() {
+entry:
+  %s = call i32 @sum(i32 10)
+  %f = call i32 @fib(i32 10)
+  %c0 = call i32 @classify(i32 0)
+  %c1 = call i32 @classify(i32 7)
+  %c2 = call i32 @classify(i32 -5)
+  %c3 = call i32 @classify(i32 5)
+  %u = call i32 @unsigned_ops(i32 -16, i32 3)
+  %u.ok = icmp eq i32 %u, 1431656015
+  %u.bit = zext i1 %u.ok to i32
+  %0 = add i32 %s, %f
+  %1 = add i32 %0, %c0
+  %2 = add i32 %1, %c1
+  %3 = add i32 %2, %c2
+  %4 = add i32 %3, %c3
+  %5 = shl i32 %4, 1
+  %6 = or i32 %5, %u.bit
+  ret i32 %6
+}
@@ -0,0 +1,94 @@
+; Structs, arrays and getelementptr, with opaque pointers, 32-bit target.
+target datalayout = "e-m:e-p:32:32-i64:64-n8:16:32-S128"
+
+%struct.node = type { i8, ptr, i32 }
+%struct.pair = type { i16, [3 x i32] }
+%struct.opaque = type opaque
+%struct.ppair = type <{ i8, i32 }>
+
+@n3 = internal global %struct.node { i8 3, ptr null, i32 30 }, align 4
+@n2 = internal global %struct.node { i8 2, ptr @n3, i32 20 }, align 4
+@nodes = dso_local global [1 x %struct.node] [%struct.node { i8 1, ptr @n2, i32 10 }], align 4
+@pairs = dso_local global [2 x %struct.pair] [%struct.pair { i16 -1, [3 x i32] [i32 1, i32 2, i32 3] }, %struct.pair zeroinitializer], align 4
+@packed = dso_local global <{ i8, i32 }> <{ i8 5, i32 6 }>, align 1
+@name = internal constant [4 x i8] c"a;\22\00"
+@handle = external global ptr
+
+; Sum payloads of a list (nodes are linked via second field).
+define dso_local i32 @list_sum(ptr %p) {
+entry:
+  %is_null = icmp eq ptr %p, null
+  br i1 %is_null, label %done, label %loop
+
+loop:
+  %cur = phi ptr [ %p, %entry ], [ %next, %loop ]
+  %acc = phi i32 [ 0, %entry ], [ %acc.next, %loop ]
+  %val.addr = getelementptr inbounds %struct.node, ptr %cur, i32 0, i32 2
+  %val = load i32, ptr %val.addr, align 4
+  %acc.next = add i32 %acc, %val
+  %next.addr = getelementptr inbounds %struct.node, ptr %cur, i32 0, i32 1
+  %next = load ptr, ptr %next.addr, align 4
+  %end = icmp eq ptr %next, null
+  br i1 %end, label %done, label %loop
+
+done:
+  %res = phi i32 [ 0, %entry ], [ %acc.next, %loop ]
+  ret i32 %res
+}
+
+; pairs[i].vals[j]
+define dso_local i32 @pair_get(i32 %i, i32 %j) {
+entry:
+  %addr = getelementptr inbounds [2 x %struct.pair], ptr @pairs, i32 0, i32 %i, i32 1, i32 %j
+  %v = load i32, ptr %addr, align 4
+  ret i32 %v
+}
+
+define dso_local i32 @locals(i32 %n) {
+entry:
+  %buf = alloca i32, i32 %n, align 4
+  %pair = alloca %struct.pair, align 4
+  %last = getelementptr i32, ptr %buf, i32 -1
+  %first = getelementptr i32, ptr %last, i32 1
+  store i32 7, ptr %first, align 4
+  %f = getelementptr inbounds %struct.pair, ptr %pair, i32 0, i32 0
+  store i16 -2, ptr %f, align 4
+  %f.val = load i16, ptr %f, align 4
+  %f.ext = sext i16 %f.val to i32
+  %v = load i32, ptr %buf, align 4
+  %r = add i32 %v, %f.ext
+  ret i32 %r
+}
+
+define dso_local void @copy(ptr %dst, ptr %src, i32 %n) {
+entry:
+  call void @llvm.memcpy.p0.p0.i32(ptr align 4 %dst, ptr align 4 %src, i32 %n, i1 false)
+  tail call void @llvm.memset.p0.i32(ptr nonnull align 1 %dst, i8 0, i32 4, i1 false)
+  ret void
+}
+
+define dso_local i32 @main() {
+entry:
+  %s = call i32 @list_sum(ptr @nodes)
+  %a = call i32 @pair_get(i32 0, i32 2)
+  %b = call i32 @pair_get(i32 1, i32 0)
+  %l = call i32 @locals(i32 4)
+  %c = load i8, ptr getelementptr inbounds (%struct.node, ptr @n2, i32 1, i32 0), align 1
+  %c.ext = zext i8 %c to i32
+  %p = load i32, ptr getelementptr inbounds (<{ i8, i32 }>, ptr @packed, i32 0, i32 1), align 1
+  %n = load i8, ptr getelementptr inbounds ([4 x i8], ptr @name, i32 0, i32 2), align 1
+  %n.ext = zext i8 %n to i32
+  %h = load i16, ptr @pairs, align 4
+  %h.ext = sext i16 %h to i32
+  %0 = add i32 %s, %a
+  %1 = add i32 %0, %b
+  %2 = add i32 %1, %l
+  %3 = add i32 %2, %c.ext
+  %4 = add i32 %3, %p
+  %5 = add i32 %4, %n.ext
+  %6 = add i32 %5, %h.ext
+  ret i32 %6
+}
+
+declare void @llvm.memcpy.p0.p0.i32(ptr noalias nocapture writeonly, ptr noalias nocapture readonly, i32, i1 immarg)
+declare void @llvm.memset.p0.i32(ptr nocapture writeonly, i8, i32, i1 immarg)
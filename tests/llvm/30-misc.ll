@@ -0,0 +1,65 @@
+; Less common constructs, and unsupported ones (functions and globals
+; using them are skipped with -k).
+target datalayout = "e-p:64:64-i64:64"
+
+@"quoted name" = global i64 -1
+@if = global i32 1
+@pi = global double 3.140000e+00
+@fptr = global i32 (i32)* @twice
+
+define i32 @twice(i32 %x) {
+  %1 = shl i32 %x, 1
+  ret i32 %1
+}
+
+define double @half(double %x) {
+  %1 = fmul double %x, 5.000000e-01
+  ret double %1
+}
+
+define i32 @indirect(i32 %x) {
+  %fp = load i32 (i32)*, i32 (i32)** @fptr
+  %r = call i32 %fp(i32 %x)
+  %bits = ptrtoint i32 (i32)* %fp to i64
+  %low = trunc i64 %bits to i32
+  %back = inttoptr i64 %bits to i8*
+  %f = freeze i32 %r
+  ret i32 %f
+}
+
+define i32 @labels(i1 %c) {
+  %1 = sext i1 %c to i32
+  br i1 %c, label %_l5, label %2
+
+; <label>:2:                                      ; preds = %0
+  %3 = add i32 %1, 2
+  br label %"quoted label"
+
+_l5:                                              ; preds = %0
+  %4 = select i1 true, i32 %1, i32 0
+  br label %"quoted label"
+
+"quoted label":                                   ; preds = %_l5, %2
+  %5 = phi i32 [ %3, %2 ], [ %4, %_l5 ]
+  br i1 false, label %dead, label %6
+
+  %7 = mul i32 %5, 3
+  ret i32 %7
+
+dead:
+  unreachable
+}
+
+define <4 x i32> @vec(<4 x i32> %v) {
+  %1 = add <4 x i32> %v, %v
+  ret <4 x i32> %1
+}
+
+define i32 @main() {
+  %1 = call i32 @indirect(i32 21)
+  %2 = call i32 @labels(i1 true)
+  %3 = call i32 @labels(i1 false)
+  %4 = add i32 %1, %2
+  %5 = add i32 %4, %3
+  ret i32 %5
+}